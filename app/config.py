@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,6 +11,27 @@ class Config:
     # -------------------
     BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+    # -------------------
+    # Приём апдейтов: polling (по умолчанию) или webhook (aiohttp-сервер)
+    # -------------------
+    BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+    if BOT_MODE not in ("polling", "webhook"):
+        BOT_MODE = "polling"
+
+    # Публичный адрес для setWebhook (https://bot.example.com). Пусто — webhook не
+    # регистрируется при старте (например, локально или когда его ставит один экземпляр)
+    WEBHOOK_BASE_URL = (os.getenv("WEBHOOK_BASE_URL") or "").rstrip("/")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token каждого апдейта
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+    # Явное разрешение принимать апдейты без секрета (только для локальной отладки)
+    WEBHOOK_INSECURE = os.getenv("WEBHOOK_INSECURE", "0").lower() in ("1", "true", "yes")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    try:
+        WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    except ValueError:
+        WEBHOOK_PORT = 8080
+
     # -------------------
     # База данных
     # -------------------
@@ -27,6 +49,169 @@ class Config:
     # -------------------
     REDIS_URL = os.getenv("REDIS_URL") or "redis://localhost:6379/0"
 
+    # -------------------
+    # Гео-поиск сервисов
+    # -------------------
+    try:
+        # Размер ячейки сетки индекса в градусах (0.1° ≈ 11 км по широте)
+        GEO_INDEX_CELL_DEG = float(os.getenv("GEO_INDEX_CELL_DEG", "0.1"))
+        # Раз в сколько секунд полностью перечитывать индекс из БД (0 — никогда)
+        GEO_INDEX_REFRESH_SECONDS = int(os.getenv("GEO_INDEX_REFRESH_SECONDS", "300"))
+    except ValueError:
+        GEO_INDEX_CELL_DEG = 0.1
+        GEO_INDEX_REFRESH_SECONDS = 300
+
+    # Как искать сервисы по радиусу:
+    #   index         — in-memory индекс в процессе бота (по умолчанию)
+    #   vector        — векторный numpy-проход по снапшоту сервисов
+    #   bbox          — SQL bounding box по индексу (location_lat, location_lon)
+    #   earthdistance — Postgres cube/earthdistance
+    #   postgis       — Postgres PostGIS
+    GEO_SEARCH_MODE = os.getenv("GEO_SEARCH_MODE", "index").lower()
+    if GEO_SEARCH_MODE not in ("index", "vector", "bbox", "earthdistance", "postgis"):
+        GEO_SEARCH_MODE = "index"
+    if GEO_SEARCH_MODE in ("earthdistance", "postgis") and DB_TYPE != "postgres":
+        GEO_SEARCH_MODE = "bbox"
+
+    # Кэш результатов гео-поиска (ключ — геохеш точки + радиус + категория)
+    GEO_CACHE_ENABLED = os.getenv("GEO_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+    # Второй уровень кэша в Redis — общий для всех экземпляров бота
+    GEO_CACHE_REDIS = os.getenv("GEO_CACHE_REDIS", "0").lower() in ("1", "true", "yes")
+    try:
+        # Точность геохеша ключа (6 ≈ 1.2 x 0.6 км)
+        GEO_CACHE_PRECISION = int(os.getenv("GEO_CACHE_PRECISION", "6"))
+        GEO_CACHE_SIZE = int(os.getenv("GEO_CACHE_SIZE", "1024"))
+        GEO_CACHE_TTL_SECONDS = int(os.getenv("GEO_CACHE_TTL_SECONDS", "600"))
+    except ValueError:
+        GEO_CACHE_PRECISION = 6
+        GEO_CACHE_SIZE = 1024
+        GEO_CACHE_TTL_SECONDS = 600
+
+    # -------------------
+    # Кэш пользователя / роли / СТО (identity-middleware)
+    # -------------------
+    # Второй уровень в Redis — общий для всех экземпляров бота
+    IDENTITY_CACHE_REDIS = os.getenv("IDENTITY_CACHE_REDIS", "1").lower() in ("1", "true", "yes")
+    try:
+        IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+        # Локальный кэш живёт недолго: так до других экземпляров быстрее доходит инвалидация
+        IDENTITY_CACHE_TTL_SECONDS = int(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "60"))
+        IDENTITY_CACHE_REDIS_TTL_SECONDS = int(
+            os.getenv("IDENTITY_CACHE_REDIS_TTL_SECONDS", "3600")
+        )
+    except ValueError:
+        IDENTITY_CACHE_SIZE = 10000
+        IDENTITY_CACHE_TTL_SECONDS = 60
+        IDENTITY_CACHE_REDIS_TTL_SECONDS = 3600
+
+    # -------------------
+    # Кэш маршрутов доставки СТО (группа / ЛС владельца)
+    # -------------------
+    try:
+        SERVICE_ROUTING_CACHE_SIZE = int(os.getenv("SERVICE_ROUTING_CACHE_SIZE", "2048"))
+        SERVICE_ROUTING_CACHE_TTL_SECONDS = int(
+            os.getenv("SERVICE_ROUTING_CACHE_TTL_SECONDS", "300")
+        )
+    except ValueError:
+        SERVICE_ROUTING_CACHE_SIZE = 2048
+        SERVICE_ROUTING_CACHE_TTL_SECONDS = 300
+
+    # -------------------
+    # Счётчики заявок по СТО
+    # -------------------
+    try:
+        # Раз в сколько секунд сверять счётчики с таблицей requests
+        REQUEST_COUNTERS_RECONCILE_SECONDS = int(
+            os.getenv("REQUEST_COUNTERS_RECONCILE_SECONDS", "900")
+        )
+    except ValueError:
+        REQUEST_COUNTERS_RECONCILE_SECONDS = 900
+
+    try:
+        # Сколько дней хранить почасовые изменения для приростов в статистике
+        REQUEST_STATS_HOURLY_KEEP_DAYS = int(
+            os.getenv("REQUEST_STATS_HOURLY_KEEP_DAYS", "8")
+        )
+    except ValueError:
+        REQUEST_STATS_HOURLY_KEEP_DAYS = 8
+
+    try:
+        # Сколько запросов к Telegram одновременно при рассылке по автоотказу
+        AUTO_DECLINE_CONCURRENCY = int(os.getenv("AUTO_DECLINE_CONCURRENCY", "8"))
+    except ValueError:
+        AUTO_DECLINE_CONCURRENCY = 8
+
+    try:
+        # Во сколько чатов сервиса одновременно отправлять / обновлять карточку заявки
+        REQUEST_CHAT_CONCURRENCY = int(os.getenv("REQUEST_CHAT_CONCURRENCY", "4"))
+    except ValueError:
+        REQUEST_CHAT_CONCURRENCY = 4
+
+    # -------------------
+    # Outbox уведомлений (доставка после коммита)
+    # -------------------
+    try:
+        OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+        # Как часто проверять outbox, если никто не разбудил диспетчер
+        OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+        # Сколько строка считается взятой диспетчером (потом её подберёт другой)
+        OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+        OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+        # Сколько записей один процесс держит в доставке одновременно
+        # (их аренда продлевается, пока они ждут лимитов чатов в send_queue)
+        OUTBOX_MAX_IN_FLIGHT = int(os.getenv("OUTBOX_MAX_IN_FLIGHT", "200"))
+    except ValueError:
+        OUTBOX_BATCH_SIZE = 50
+        OUTBOX_POLL_SECONDS = 2.0
+        OUTBOX_LEASE_SECONDS = 60
+        OUTBOX_MAX_ATTEMPTS = 8
+        OUTBOX_MAX_IN_FLIGHT = 200
+
+    # -------------------
+    # Очередь исходящих запросов к Telegram (лимиты Bot API)
+    # -------------------
+    try:
+        SEND_QUEUE_WORKERS = int(os.getenv("SEND_QUEUE_WORKERS", "8"))
+        # Глобально: не больше ~30 сообщений в секунду на бота
+        SEND_GLOBAL_PER_SECOND = float(os.getenv("SEND_GLOBAL_PER_SECOND", "30"))
+        # В один личный чат — около одного в секунду
+        SEND_CHAT_PER_SECOND = float(os.getenv("SEND_CHAT_PER_SECOND", "1"))
+        # В одну группу — не больше 20 в минуту
+        SEND_GROUP_PER_MINUTE = float(os.getenv("SEND_GROUP_PER_MINUTE", "20"))
+        # Сколько раз повторять запрос после TelegramRetryAfter
+        SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+    except ValueError:
+        SEND_QUEUE_WORKERS = 8
+        SEND_GLOBAL_PER_SECOND = 30.0
+        SEND_CHAT_PER_SECOND = 1.0
+        SEND_GROUP_PER_MINUTE = 20.0
+        SEND_MAX_RETRIES = 3
+
+    # -------------------
+    # Синхронизация карточек заявок (склейка правок)
+    # -------------------
+    try:
+        # Окно, в котором правки одного сообщения склеиваются в одну (0 — без ожидания)
+        CARD_SYNC_DEBOUNCE_SECONDS = float(os.getenv("CARD_SYNC_DEBOUNCE_SECONDS", "0.5"))
+        # Сколько сообщений помнить и как долго верить запомненному состоянию
+        CARD_SYNC_CACHE_SIZE = int(os.getenv("CARD_SYNC_CACHE_SIZE", "10000"))
+        CARD_SYNC_CACHE_TTL_SECONDS = int(os.getenv("CARD_SYNC_CACHE_TTL_SECONDS", "3600"))
+    except ValueError:
+        CARD_SYNC_DEBOUNCE_SECONDS = 0.5
+        CARD_SYNC_CACHE_SIZE = 10000
+        CARD_SYNC_CACHE_TTL_SECONDS = 3600
+
+    # -------------------
+    # Кэш отрисованных карточек заявок (ключ — заявка + version + вид)
+    # -------------------
+    try:
+        RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "5000"))
+        # Клиент и авто в ключ не входят — их правки видны не позже TTL
+        RENDER_CACHE_TTL_SECONDS = int(os.getenv("RENDER_CACHE_TTL_SECONDS", "600"))
+    except ValueError:
+        RENDER_CACHE_SIZE = 5000
+        RENDER_CACHE_TTL_SECONDS = 600
+
     # -------------------
     # Чаты / пользователи
     # -------------------
@@ -81,6 +266,26 @@ class Config:
         print(f"ℹ️ DB_TYPE={cls.DB_TYPE}, DB_URL={cls.DB_URL}")
         print(f"ℹ️ MANAGER_CHAT_ID={cls.MANAGER_CHAT_ID}")
         print(f"ℹ️ ADMIN_USER_IDS={cls.ADMIN_USER_IDS}")
+        print(f"ℹ️ GEO_SEARCH_MODE={cls.GEO_SEARCH_MODE}")
+        print(f"ℹ️ BOT_MODE={cls.BOT_MODE}")
+
+        if cls.BOT_MODE == "webhook":
+            if cls.WEBHOOK_SECRET:
+                # Ограничения Telegram для secret_token: 1–256 символов A-Z a-z 0-9 _ -
+                if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", cls.WEBHOOK_SECRET):
+                    raise ValueError(
+                        "❌ WEBHOOK_SECRET: допустимы 1–256 символов A-Z, a-z, 0-9, _ и -"
+                    )
+            elif cls.WEBHOOK_INSECURE:
+                print(
+                    "⚠️ BOT_MODE=webhook без WEBHOOK_SECRET (WEBHOOK_INSECURE=1): "
+                    "апдейты принимаются без проверки секретного токена."
+                )
+            else:
+                raise ValueError(
+                    "❌ BOT_MODE=webhook требует WEBHOOK_SECRET в .env файле "
+                    "(для локальной отладки без секрета — WEBHOOK_INSECURE=1)"
+                )
 
         if cls.MANAGER_CHAT_ID is not None and cls.MANAGER_CHAT_ID > 0:
             print(
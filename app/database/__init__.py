@@ -3,6 +3,9 @@ from .db import engine, AsyncSessionLocal, create_tables
 from .models import User, Car, Request
 from .comment_models import Comment
 from .bonus_models import BonusTransaction
+from .rating_models import Rating
+from .outbox_models import OutboxMessage
+from .chat_message_models import RequestChatMessage
 
 __all__ = [
     "Base",
@@ -14,4 +17,7 @@ __all__ = [
     "Request",
     "Comment",
     "BonusTransaction",
+    "Rating",
+    "OutboxMessage",
+    "RequestChatMessage",
 ]
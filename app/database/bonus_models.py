@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 
 from app.database.base import Base
@@ -30,3 +30,8 @@ class BonusTransaction(Base):
         server_default=func.now(),
         nullable=False,
     )
+
+    __table_args__ = (
+        # История операций пользователя, новые сначала
+        Index("ix_bonus_transactions_user_created", "user_id", "created_at"),
+    )
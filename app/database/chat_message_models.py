@@ -0,0 +1,42 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    UniqueConstraint,
+)
+from sqlalchemy.sql import func
+
+from app.database.base import Base
+
+
+class RequestChatMessage(Base):
+    """
+    Копия карточки заявки в чате сервиса (группа, ЛС владельца).
+    По этим записям клавиатура и статус обновляются во всех копиях сразу.
+    """
+    __tablename__ = "request_chat_messages"
+
+    id = Column(Integer, primary_key=True)
+    request_id = Column(
+        Integer,
+        ForeignKey("requests.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger, nullable=False)
+    # Основной чат сервиса (его message_id дублируется в requests.chat_message_id)
+    is_primary = Column(Boolean, nullable=False, default=False)
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # Одна карточка заявки на чат; индекс заодно для выборки по request_id
+        UniqueConstraint("request_id", "chat_id", name="uq_request_chat_messages_request_chat"),
+    )
@@ -8,8 +8,9 @@ from sqlalchemy import (
     ForeignKey,
     Float,
     Boolean,
+    Index,
 )
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 from app.database.base import Base
 
@@ -41,6 +42,75 @@ class ServiceCenter(Base):
 
     rating = Column(Float, default=0.0)
     ratings_count = Column(Integer, default=0)
+    # Байесовский рейтинг (matching.bayesian_rating) — ключ сортировки списков СТО.
+    # Без оценок равен априорному среднему matching.RATING_PRIOR_MEAN.
+    rating_sort = Column(Float, nullable=False, default=4.0, server_default="4.0")
+
+    __table_args__ = (
+        # Для SQL-префильтра по bounding box при поиске по радиусу
+        Index("ix_service_centers_location", "location_lat", "location_lon"),
+        # СТО владельца (identity, настройки сервиса)
+        Index("ix_service_centers_owner", "owner_user_id"),
+        # Списки СТО по рейтингу
+        Index("ix_service_centers_rating_sort", "rating_sort", "id"),
+    )
+
+
+class ServiceCenterSpecialization(Base):
+    """
+    Специализации СТО в нормализованном виде (по строке на код).
+    Дублирует ServiceCenter.specializations, но ищется по индексу, а не через LIKE.
+    """
+    __tablename__ = "service_center_specializations"
+
+    service_center_id = Column(
+        Integer,
+        ForeignKey("service_centers.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    code = Column(String(50), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_service_center_specializations_code", "code", "service_center_id"),
+    )
+
+
+class ServiceCenterRequestCount(Base):
+    """
+    Счётчики заявок по СТО и статусам (ведутся в той же транзакции, что и смена статуса).
+    service_center_id = 0 — заявки без привязки к СТО, поэтому без внешнего ключа.
+    """
+    __tablename__ = "service_center_request_counts"
+
+    service_center_id = Column(Integer, primary_key=True)
+    status = Column(String(50), primary_key=True)
+    requests_count = Column(Integer, nullable=False, default=0)
+
+
+class RequestStatsRollup(Base):
+    """
+    Свёртка заявок для админской статистики: количество по (СТО, категория, статус).
+    service_center_id = 0 — без СТО, category_code = "" — без категории.
+    Ведётся инкрементально (app.services.request_stats), сверяется одним GROUP BY.
+    """
+    __tablename__ = "request_stats_rollup"
+
+    service_center_id = Column(Integer, primary_key=True)
+    category_code = Column(String(50), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    requests_count = Column(Integer, nullable=False, default=0)
+
+
+class RequestStatsHourly(Base):
+    """
+    Изменение количества заявок в статусе за час — для приростов за 24 часа / 7 дней.
+    Старше REQUEST_STATS_HOURLY_KEEP_DAYS удаляется при сверке.
+    """
+    __tablename__ = "request_stats_hourly"
+
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    status = Column(String(50), primary_key=True)
+    delta = Column(Integer, nullable=False, default=0)
 
 
 class User(Base):
@@ -73,6 +143,10 @@ class Car(Base):
     # ✅ VIN — часть карточки автомобиля
     vin = Column(String(50))
 
+    __table_args__ = (
+        Index("ix_cars_user_id", "user_id"),
+    )
+
 
 class Request(Base):
     __tablename__ = "requests"
@@ -118,3 +192,68 @@ class Request(Base):
     in_progress_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
     rejected_at = Column(DateTime(timezone=True))
+
+    # Версия строки: +1 на каждом UPDATE — и из ORM, и из Core-запросов
+    # (onupdate подставляется в любой update(requests), где version не задан).
+    # Ключ кэша отрисованных карточек (render_cache).
+    version = Column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        onupdate=text("requests.version + 1"),
+    )
+
+    # Новая версия после flush приходит через RETURNING, а не ленивой загрузкой
+    __mapper_args__ = {"eager_defaults": True}
+
+    # Индексы под списки заявок: keyset-пагинация идёт по (created_at, id)
+    __table_args__ = (
+        # История клиента
+        Index("ix_requests_user_created", "user_id", "created_at", "id"),
+        # Списки менеджера СТО по статусам
+        Index(
+            "ix_requests_sc_status_created",
+            "service_center_id",
+            "status",
+            "created_at",
+            "id",
+        ),
+        # Списки админа по статусам (без привязки к СТО)
+        Index("ix_requests_status_created", "status", "created_at", "id"),
+        # Выборки за период (статистика, выгрузки)
+        Index("ix_requests_created", "created_at", "id"),
+    )
+
+
+class RequestSearchDocument(Base):
+    """
+    Поисковый документ заявки для менеджерского поиска (app.services.request_search):
+    склеенный текст клиента / авто / описания и нормализованные ключи для точных
+    совпадений. Ведётся в той же транзакции, что и изменения заявки, авто и клиента.
+    Полнотекстовые индексы поверх document (FTS5 / tsvector + pg_trgm) создаются
+    отдельно — они зависят от диалекта.
+    """
+    __tablename__ = "request_search"
+
+    request_id = Column(
+        Integer,
+        ForeignKey("requests.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    service_center_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+
+    # Нормализованные ключи: госномер (латиница, без пробелов), VIN, последние 10 цифр телефона
+    plate_norm = Column(String(20))
+    vin_norm = Column(String(50))
+    phone_norm = Column(String(20))
+
+    document = Column(Text, nullable=False, default="")
+
+    __table_args__ = (
+        Index("ix_request_search_plate", "plate_norm"),
+        Index("ix_request_search_vin", "vin_norm"),
+        Index("ix_request_search_phone", "phone_norm"),
+        Index("ix_request_search_sc_created", "service_center_id", "created_at"),
+    )
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+
+from app.database.base import Base
+
+
+class OutboxMessage(Base):
+    """
+    Отложенное действие в Telegram (уведомление, карточка, клавиатура), записанное
+    в той же транзакции, что и изменение заявки. Доставляет app.services.outbox.
+    """
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    # Тип доставки (outbox.handler) и его параметры в JSON
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")
+
+    attempts = Column(Integer, nullable=False, default=0)
+    # Когда можно (снова) брать в работу: отсрочка повтора или аренда диспетчера
+    available_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+    last_error = Column(Text)
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index("ix_outbox_available", "available_at", "id"),
+    )
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.database.base import Base
+
+
+class Rating(Base):
+    """
+    Оценка сервиса клиентом по заявке (1–5). Одна оценка на (заявка, пользователь).
+    """
+    __tablename__ = "ratings"
+
+    id = Column(Integer, primary_key=True)
+    request_id = Column(
+        Integer,
+        ForeignKey("requests.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    user_id = Column(
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # Без внешнего ключа: оценка остаётся в истории, даже если СТО удалили
+    service_center_id = Column(Integer, nullable=True)
+
+    score = Column(Integer, nullable=False)
+
+    created_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # Повторная оценка — проба по уникальному индексу
+        UniqueConstraint("request_id", "user_id", name="uq_ratings_request_user"),
+        Index("ix_ratings_service_center", "service_center_id", "created_at"),
+    )
@@ -1,19 +1,29 @@
+import csv
 import logging
+import os
+import tempfile
+from html import escape
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import (
     Message,
     CallbackQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    FSInputFile,
 )
 from aiogram.enums import ParseMode
-from sqlalchemy import select, func
+from sqlalchemy import exists, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import config
 from app.database.db import AsyncSessionLocal
-from app.database.models import User, Request, ServiceCenter, Car
+from app.database.models import User, Request, ServiceCenter, ServiceCenterSpecialization, Car
 from app.keyboards.main_kb import SERVICE_SPECIALIZATION_OPTIONS
 from app.services.chat_service import _format_status
+from app.services import geo_cache, request_stats
+from app.services.pagination import NEXT, PREV, fetch_id_page
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -42,6 +52,16 @@ def is_admin(user_id: int) -> bool:
 # Словарь код -> человекочитаемая категория, по тем же кодам, что в регистрации СТО
 SPEC_LABELS = {code: label for code, label in SERVICE_SPECIALIZATION_OPTIONS}
 
+# Сколько СТО показывать в статистике
+STATS_TOP_SERVICES = 10
+
+# Размер страниц в списках админки (СТО длиннее — их меньше)
+ADMIN_PAGE_SIZE = 30
+ADMIN_SERVICES_PAGE_SIZE = 10
+
+# Сколько строк за раз забирать из БД при выгрузке в CSV
+CSV_BATCH_SIZE = 500
+
 
 # ------------------------------
 # Команда /admin
@@ -92,79 +112,283 @@ async def admin_panel(msg: Message):
 # ------------------------------
 # Статистика
 # ------------------------------
-@router.callback_query(F.data == "admin_stats")
-async def admin_stats(callback: CallbackQuery):
+def _format_delta(value: int) -> str:
+    return f"+{value}" if value > 0 else str(value)
+
+
+@router.callback_query(F.data.in_({"admin_stats", "admin_stats:deltas"}))
+async def admin_stats(callback: CallbackQuery, session: AsyncSession):
     if not is_admin(callback.from_user.id):
         await callback.answer("Нет прав", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        total_users = await session.scalar(select(func.count(User.id)))
-        total_requests = await session.scalar(select(func.count(Request.id)))
-        completed = await session.scalar(
-            select(func.count(Request.id)).where(Request.status == "completed")
-        )
-        in_progress = await session.scalar(
-            select(func.count(Request.id)).where(Request.status == "in_progress")
-        )
+    with_deltas = callback.data == "admin_stats:deltas"
+
+    # Заявки — из свёртки request_stats (без подсчёта по таблице requests)
+    stats = await request_stats.get_stats(session, with_deltas=with_deltas)
+    total_users = await session.scalar(select(func.count(User.id)))
 
     text = (
         "📊 <b>Статистика</b>\n\n"
         f"👥 Пользователей: <b>{total_users}</b>\n"
-        f"📝 Заявок всего: <b>{total_requests}</b>\n"
-        f"✔️ Выполнено: <b>{completed}</b>\n"
-        f"⚙️ В работе: <b>{in_progress}</b>\n"
+        f"📝 Заявок всего: <b>{stats.total}</b>\n"
     )
 
-    await callback.message.edit_text(text, parse_mode=ParseMode.HTML)
+    if stats.by_status:
+        text += "\n<b>По статусам:</b>\n"
+        for status, count in sorted(stats.by_status.items(), key=lambda x: -x[1]):
+            line = f"{_format_status(status)}: <b>{count}</b>"
+            if with_deltas:
+                line += (
+                    f" (24ч: {_format_delta(stats.delta_24h.get(status, 0))}, "
+                    f"7д: {_format_delta(stats.delta_7d.get(status, 0))})"
+                )
+            text += line + "\n"
+
+    if stats.by_category:
+        text += "\n<b>По категориям:</b>\n"
+        for code, count in sorted(stats.by_category.items(), key=lambda x: -x[1]):
+            label = SPEC_LABELS.get(code, code) if code else "Без категории"
+            text += f"🧩 {escape(label)}: <b>{count}</b>\n"
+
+    if stats.by_service_center:
+        top = sorted(stats.by_service_center.items(), key=lambda x: -x[1])[:STATS_TOP_SERVICES]
+        ids = [sc_id for sc_id, _ in top if sc_id != request_stats.UNASSIGNED]
+        names = {}
+        if ids:
+            result = await session.execute(
+                select(ServiceCenter.id, ServiceCenter.name).where(ServiceCenter.id.in_(ids))
+            )
+            names = dict(result.all())
+
+        text += f"\n<b>По СТО (топ {STATS_TOP_SERVICES}):</b>\n"
+        for sc_id, count in top:
+            # Название СТО вводит пользователь — экранируем для HTML
+            name = (
+                escape(names.get(sc_id) or f"СТО #{sc_id}")
+                if sc_id != request_stats.UNASSIGNED
+                else "Без СТО"
+            )
+            text += f"🏭 {name}: <b>{count}</b>\n"
+
+    cache = geo_cache.stats()
+    if config.GEO_CACHE_ENABLED:
+        text += (
+            f"\n🗺 Гео-кэш: попаданий <b>{cache['hits_local'] + cache['hits_redis']}</b> "
+            f"(Redis: {cache['hits_redis']}), промахов <b>{cache['misses']}</b>, "
+            f"записей {cache['local_size']}\n"
+        )
+
+    toggle = (
+        InlineKeyboardButton(text="📊 Без приростов", callback_data="admin_stats")
+        if with_deltas
+        else InlineKeyboardButton(text="📈 Прирост за 24ч / 7д", callback_data="admin_stats:deltas")
+    )
+    kb = InlineKeyboardMarkup(inline_keyboard=[[toggle]])
+
+    await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=kb)
     await callback.answer()
 
 
 # ------------------------------
-# Список пользователей
+# Списки пользователей и СТО: keyset-страницы + выгрузка в CSV
 # ------------------------------
-@router.callback_query(F.data == "admin_users")
-async def admin_users(callback: CallbackQuery):
+
+# Фильтр по роли: код -> подпись кнопки
+USER_ROLE_FILTERS = {
+    "all": "Все",
+    "client": "Клиенты",
+    "service": "СТО",
+}
+
+
+def _parse_list_args(parts: list[str]) -> tuple[str, str, Optional[int]]:
+    """
+    Хвост callback_data списка: [<фильтр>[:<направление>:<id-курсор>]].
+    """
+    filter_key = parts[0] if parts and parts[0] else "all"
+    if len(parts) >= 3 and parts[1] in (NEXT, PREV):
+        return filter_key, parts[1], int(parts[2])
+    return filter_key, NEXT, None
+
+
+def _list_kb(
+    prefix: str,
+    filter_key: str,
+    filters: list[tuple[str, str]],
+    rows: list,
+    has_prev: bool,
+    has_next: bool,
+    filters_per_row: int = 3,
+) -> InlineKeyboardMarkup:
+    """
+    Клавиатура списка: ◀️/▶️ по курсорам, фильтры, выгрузка в CSV.
+    """
+    keyboard: list[list[InlineKeyboardButton]] = []
+
+    nav: list[InlineKeyboardButton] = []
+    if rows and has_prev:
+        nav.append(
+            InlineKeyboardButton(
+                text="◀️", callback_data=f"{prefix}:{filter_key}:{PREV}:{rows[0].id}"
+            )
+        )
+    if rows and has_next:
+        nav.append(
+            InlineKeyboardButton(
+                text="▶️", callback_data=f"{prefix}:{filter_key}:{NEXT}:{rows[-1].id}"
+            )
+        )
+    if nav:
+        keyboard.append(nav)
+
+    filter_buttons = [
+        InlineKeyboardButton(
+            text=f"✅ {label}" if key == filter_key else label,
+            callback_data=f"{prefix}:{key}",
+        )
+        for key, label in filters
+    ]
+    for i in range(0, len(filter_buttons), filters_per_row):
+        keyboard.append(filter_buttons[i:i + filters_per_row])
+
+    keyboard.append(
+        [InlineKeyboardButton(text="📥 Скачать CSV", callback_data=f"{prefix}_csv:{filter_key}")]
+    )
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def _users_stmt(role: str):
+    stmt = select(User.id, User.telegram_id, User.full_name, User.role, User.phone_number)
+    if role == "client":
+        # Старые записи без роли — тоже клиенты
+        stmt = stmt.where((User.role == "client") | (User.role.is_(None)))
+    elif role != "all":
+        stmt = stmt.where(User.role == role)
+    return stmt
+
+
+def _services_stmt(category: str):
+    stmt = select(
+        ServiceCenter.id,
+        ServiceCenter.name,
+        ServiceCenter.address,
+        ServiceCenter.specializations,
+    )
+    if category != "all":
+        stmt = stmt.where(
+            exists().where(
+                ServiceCenterSpecialization.service_center_id == ServiceCenter.id,
+                ServiceCenterSpecialization.code == category,
+            )
+        )
+    return stmt
+
+
+async def _send_csv(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    stmt,
+    header: list[str],
+    filename: str,
+) -> None:
+    """
+    Выгрузка в CSV: строки идут из БД пачками (yield_per) прямо во временный файл,
+    таблица целиком в памяти не собирается.
+    """
+    fd, path = tempfile.mkstemp(suffix=".csv", prefix="admin_")
+    try:
+        total = 0
+        with os.fdopen(fd, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(header)
+            result = await session.stream(stmt.execution_options(yield_per=CSV_BATCH_SIZE))
+            async for partition in result.partitions():
+                writer.writerows(partition)
+                total += len(partition)
+
+        await callback.message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📥 Строк: {total}",
+        )
+    finally:
+        os.remove(path)
+
+
+@router.callback_query((F.data == "admin_users") | F.data.startswith("admin_users:"))
+async def admin_users(callback: CallbackQuery, session: AsyncSession):
     if not is_admin(callback.from_user.id):
         await callback.answer("Нет прав", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(User).order_by(User.id.desc()))
-        users = result.scalars().all()
-
-    text_lines: list[str] = ["👥 <b>Пользователи</b>\n"]
-    for u in users:
-        role = u.role or "client"
-        name = u.full_name or f"ID {u.telegram_id}"
-        text_lines.append(
-            f"{u.id}. {name} — <code>{role}</code>"
-        )
+    role, direction, cursor_id = _parse_list_args(callback.data.split(":")[1:])
+    if role not in USER_ROLE_FILTERS:
+        role = "all"
+
+    rows, has_prev, has_next = await fetch_id_page(
+        session, _users_stmt(role), User.id, cursor_id, direction, ADMIN_PAGE_SIZE
+    )
 
-    text = "\n".join(text_lines)
+    text_lines: list[str] = [f"👥 <b>Пользователи</b> — {USER_ROLE_FILTERS[role]}\n"]
+    for u in rows:
+        name = escape(u.full_name or f"ID {u.telegram_id}")
+        text_lines.append(f"{u.id}. {name} — <code>{u.role or 'client'}</code>")
+    if not rows:
+        text_lines.append("Никого не найдено.")
 
-    await callback.message.edit_text(text, parse_mode=ParseMode.HTML)
+    kb = _list_kb(
+        "admin_users", role, list(USER_ROLE_FILTERS.items()), rows, has_prev, has_next
+    )
+    await callback.message.edit_text(
+        "\n".join(text_lines), parse_mode=ParseMode.HTML, reply_markup=kb
+    )
     await callback.answer()
 
 
-# ------------------------------
-# Список сервисов (СТО + категории)
-# ------------------------------
-@router.callback_query(F.data == "admin_services")
-async def admin_services(callback: CallbackQuery):
+@router.callback_query(F.data.startswith("admin_users_csv:"))
+async def admin_users_csv(callback: CallbackQuery, session: AsyncSession):
     if not is_admin(callback.from_user.id):
         await callback.answer("Нет прав", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter).order_by(ServiceCenter.id.asc())
-        )
-        services = result.scalars().all()
+    role = callback.data.split(":", 1)[1]
+    if role not in USER_ROLE_FILTERS:
+        role = "all"
+
+    await callback.answer("Готовим файл...")
+    await _send_csv(
+        callback,
+        session,
+        _users_stmt(role).order_by(User.id),
+        ["id", "telegram_id", "full_name", "role", "phone_number"],
+        f"users_{role}.csv",
+    )
+
+
+@router.callback_query((F.data == "admin_services") | F.data.startswith("admin_services:"))
+async def admin_services(callback: CallbackQuery, session: AsyncSession):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Нет прав", show_alert=True)
+        return
+
+    category, direction, cursor_id = _parse_list_args(callback.data.split(":")[1:])
+    if category != "all" and category not in SPEC_LABELS:
+        category = "all"
+
+    rows, has_prev, has_next = await fetch_id_page(
+        session,
+        _services_stmt(category),
+        ServiceCenter.id,
+        cursor_id,
+        direction,
+        ADMIN_SERVICES_PAGE_SIZE,
+        descending=False,
+    )
 
-    lines: list[str] = ["🏭 <b>СТО</b>\n"]
+    title = "все" if category == "all" else SPEC_LABELS[category]
+    lines: list[str] = [f"🏭 <b>СТО</b> — {title}\n"]
 
-    for s in services:
+    for s in rows:
         codes = []
         if s.specializations:
             codes = [c.strip() for c in s.specializations.split(",") if c.strip()]
@@ -172,20 +396,47 @@ async def admin_services(callback: CallbackQuery):
         labels = [SPEC_LABELS.get(code, code) for code in codes]
         categories_str = ", ".join(labels) if labels else "—"
 
-        address = s.address or ""
+        address = escape(s.address or "")
         line = (
-            f"{s.id}. <b>{s.name}</b>\n"
+            f"{s.id}. <b>{escape(s.name or '')}</b>\n"
             f"   📍 {address}\n"
             f"   🧩 Категории: {categories_str}\n"
         )
         lines.append(line)
 
-    text = "\n".join(lines) if services else "🏭 <b>СТО пока нет</b>"
+    if not rows:
+        lines.append("СТО не найдены.")
 
-    await callback.message.edit_text(text, parse_mode=ParseMode.HTML)
+    filters = [("all", "Все")] + list(SPEC_LABELS.items())
+    kb = _list_kb(
+        "admin_services", category, filters, rows, has_prev, has_next, filters_per_row=2
+    )
+    await callback.message.edit_text(
+        "\n".join(lines), parse_mode=ParseMode.HTML, reply_markup=kb
+    )
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith("admin_services_csv:"))
+async def admin_services_csv(callback: CallbackQuery, session: AsyncSession):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Нет прав", show_alert=True)
+        return
+
+    category = callback.data.split(":", 1)[1]
+    if category != "all" and category not in SPEC_LABELS:
+        category = "all"
+
+    await callback.answer("Готовим файл...")
+    await _send_csv(
+        callback,
+        session,
+        _services_stmt(category).order_by(ServiceCenter.id),
+        ["id", "name", "address", "specializations"],
+        f"services_{category}.csv",
+    )
+
+
 # ------------------------------
 # Все заявки (с пользователем, авто, СТО и временем)
 # ------------------------------
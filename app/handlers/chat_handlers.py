@@ -1,9 +1,8 @@
 import logging
-from datetime import datetime
 from typing import Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from aiogram import Router, F, Bot
+from aiogram import Router, F
 from aiogram import Router, F
 from aiogram.types import (
     CallbackQuery,
@@ -14,11 +13,13 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from sqlalchemy import select
+from sqlalchemy import func, select
 
 from app.config import config
 from app.database.db import AsyncSessionLocal
 from app.database.models import Request, User, ServiceCenter
+from app.services import auto_decline, outbox, request_state, send_queue, service_routing
+from app.services.identity import Identity
 from app.services.chat_service import update_chat_keyboard
 from app.services.bonus_service import add_bonus
 from app.keyboards.main_kb import get_rating_kb
@@ -59,6 +60,34 @@ async def _load_request_with_user(
     return row[0], row[1]
 
 
+async def _transition_refusal(
+    session,
+    request_id: int,
+    status_text: str,
+    *,
+    owner_user_id: Optional[int] = None,
+    client_user_id: Optional[int] = None,
+) -> str:
+    """
+    Текст отказа, когда request_state.transition вернул None. Причину выясняем
+    отдельным запросом только на этом (редком) пути: заявки нет, она чужая
+    или статус уже не тот (status_text) — например, кнопку нажали повторно.
+    """
+    result = await session.execute(
+        select(Request.user_id, ServiceCenter.owner_user_id)
+        .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
+        .where(Request.id == request_id)
+    )
+    row = result.first()
+    if not row:
+        return "❌ Заявка не найдена"
+    if owner_user_id is not None and row.owner_user_id != owner_user_id:
+        return "Только представитель сервиса может менять статус."
+    if client_user_id is not None and row.user_id != client_user_id:
+        return "❌ Эта заявка принадлежит другому пользователю"
+    return status_text
+
+
 def _ensure_manager_chat(callback: CallbackQuery) -> bool:
     """
     Проверяем, что коллбек пришёл из "менеджерского" контекста.
@@ -78,13 +107,12 @@ async def _notify_service_about_client_action(
     bot,
     session,
     request: Request,
-    service_center: Optional[ServiceCenter],
     text: str,
 ) -> None:
     """
     Отправляет уведомление в основной чат сервиса по заявке.
 
-    Логика выбора чата:
+    Логика выбора чата (service_routing, кэш маршрутов СТО):
     - если у заявки есть service_center:
         • если send_to_group и manager_chat_id → туда
         • иначе, если send_to_owner → ЛС владельца
@@ -94,26 +122,9 @@ async def _notify_service_about_client_action(
     - к уведомлению прикрепляем кнопку "📩 Написать клиенту" (по telegram_id),
       чтобы можно было сразу открыть чат, не зная номера телефона.
     """
-    primary_chat_id: Optional[int] = None
-
     # 1. Определяем основной чат сервиса
-    owner_telegram_id: Optional[int] = None
-    if service_center:
-        # Владелец сервиса (для ЛС)
-        if service_center.owner_user_id:
-            owner_res = await session.execute(
-                select(User).where(User.id == service_center.owner_user_id)
-            )
-            owner = owner_res.scalar_one_or_none()
-            if owner and owner.telegram_id:
-                owner_telegram_id = owner.telegram_id
-
-        # Отправка в группу сервиса
-        if service_center.send_to_group and service_center.manager_chat_id:
-            primary_chat_id = service_center.manager_chat_id
-        # Или в ЛС владельцу
-        elif service_center.send_to_owner and owner_telegram_id:
-            primary_chat_id = owner_telegram_id
+    route = await service_routing.resolve(request.service_center_id, session)
+    primary_chat_id: Optional[int] = route.primary_chat_id if route else None
 
     # Fallback на MANAGER_CHAT_ID
     if primary_chat_id is None and config.MANAGER_CHAT_ID:
@@ -151,9 +162,11 @@ async def _notify_service_about_client_action(
 
     # 4. Отправляем уведомление
     try:
-        await bot.send_message(
-            chat_id=primary_chat_id,
-            text=text,
+        await send_queue.send_message(
+            bot,
+            primary_chat_id,
+            text,
+            priority=send_queue.PRIORITY_SERVICE,
             reply_markup=kb,
         )
     except Exception as e:
@@ -163,12 +176,29 @@ async def _notify_service_about_client_action(
         )
 
 
+def _enqueue_service_notice(session, request_id: int, text: str) -> None:
+    """
+    Уведомление в основной чат сервиса по заявке — через outbox
+    (доставка: _notify_service_about_client_action после коммита).
+    """
+    outbox.enqueue(session, "service_notice", request_id=request_id, text=text)
+
+
+@outbox.handler("service_notice")
+async def _deliver_service_notice(bot, payload: dict) -> None:
+    async with AsyncSessionLocal() as session:
+        request = await session.get(Request, payload["request_id"])
+        if request is None:
+            return
+        await _notify_service_about_client_action(bot, session, request, text=payload["text"])
+
+
 # =======================
 # 1. Менеджер: отправка условий / отказ (FSM, БЕЗ reply)
 # =======================
 
 @router.callback_query(F.data.startswith("mgr_offer:"))
-async def manager_offer_start(callback: CallbackQuery, state: FSMContext):
+async def manager_offer_start(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """
     Менеджер нажал "Ответить клиенту" под карточкой заявки.
 
@@ -185,20 +215,19 @@ async def manager_offer_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        data = await _load_request_with_user(session, request_id)
-        if not data:
-            await callback.answer("❌ Заявка не найдена", show_alert=True)
-            return
+    data = await _load_request_with_user(session, request_id)
+    if not data:
+        await callback.answer("❌ Заявка не найдена", show_alert=True)
+        return
 
-        request, user = data
+    request, user = data
 
-        # Разрешаем отправлять условия только по "живым" заявкам
-        if request.status not in ("new", "rejected", "offer_sent"):
-            await callback.answer(
-                "Статус заявки не позволяет отправить условия", show_alert=True
-            )
-            return
+    # Разрешаем отправлять условия только по "живым" заявкам
+    if request.status not in ("new", "rejected", "offer_sent"):
+        await callback.answer(
+            "Статус заявки не позволяет отправить условия", show_alert=True
+        )
+        return
 
     # Сбрасываем предыдущие состояния и запускаем новый сценарий
     await state.clear()
@@ -252,98 +281,8 @@ async def manager_offer_time(message: Message, state: FSMContext):
     )
 
 
-# В начале файла убедись, что есть:
-# from datetime import datetime, timedelta
-# from sqlalchemy import select
-# from app.database.models import Request, User, ServiceCenter
-# from app.services.chat_service import update_chat_keyboard  # если ещё нет импорта
-
-
-async def _auto_decline_other_requests(
-    bot: Bot,
-    session: AsyncSession,
-    accepted_request: Request,
-) -> None:
-    """
-    Автоматически отклоняет все другие активные заявки клиента
-    по тому же авто и типу работ, если он принял условия по одной.
-
-    Логика:
-    - тот же user_id;
-    - тот же car_id;
-    - тот же service_type;
-    - статус в ('new', 'offer_sent', 'accepted_by_client');
-    - другой request.id.
-    """
-    try:
-        result = await session.execute(
-            select(Request, ServiceCenter)
-            .join(
-                ServiceCenter,
-                Request.service_center_id == ServiceCenter.id,
-                isouter=True,
-            )
-            .where(
-                Request.user_id == accepted_request.user_id,
-                Request.id != accepted_request.id,
-                Request.service_type == accepted_request.service_type,
-                Request.car_id == accepted_request.car_id,
-                Request.status.in_(["new", "offer_sent", "accepted_by_client"]),
-            )
-        )
-        rows = result.all()
-    except Exception as e:
-        logging.error(
-            f"❌ Ошибка поиска параллельных заявок для auto-decline по #{accepted_request.id}: {e}"
-        )
-        return
-
-    if not rows:
-        return
-
-    now = datetime.now()
-
-    for other_req, other_sc in rows:
-        # подстраховка, вдруг статус уже изменился где-то ещё
-        if other_req.status in ("completed", "rejected"):
-            continue
-
-        other_req.status = "rejected"
-        other_req.rejected_at = now
-
-        # дописываем в комментарий менеджера пометку
-        auto_text = "Автоотказ: клиент выбрал другой сервис."
-        if not other_req.manager_comment:
-            other_req.manager_comment = auto_text
-        else:
-            other_req.manager_comment = f"{other_req.manager_comment}\n\n{auto_text}"
-
-        try:
-            await _notify_service_about_client_action(
-                bot,
-                session,
-                other_req,
-                other_sc,
-                text=(
-                    f"❌ Клиент выбрал другой сервис по заявке #{other_req.id}.\n"
-                    f"Заявка автоматически переведена в статус «Отклонена»."
-                ),
-            )
-        except Exception as e:
-            logging.error(
-                f"❌ Не удалось уведомить сервис об автоотказе по заявке #{other_req.id}: {e}"
-            )
-
-        try:
-            await update_chat_keyboard(bot, other_req.id)
-        except Exception as e:
-            logging.error(
-                f"❌ Не удалось обновить клавиатуру по заявке #{other_req.id} после auto-decline: {e}"
-            )
-
-
 @router.message(ManagerOfferStates.waiting_comment)
-async def manager_offer_comment(message: Message, state: FSMContext):
+async def manager_offer_comment(message: Message, state: FSMContext, session: AsyncSession):
     """
     Менеджер присылает единый текстовый комментарий с условиями:
     цена + сроки + любые доп. комментарии.
@@ -366,127 +305,104 @@ async def manager_offer_comment(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            loaded = await _load_request_with_user(session, request_id)
-            if not loaded:
-                await message.answer("❌ Заявка не найдена.")
-                await state.clear()
-                return
-
-            request, user = loaded
-
-            if request.status not in ("new", "rejected", "offer_sent"):
-                await message.answer(
+    try:
+        # Сохраняем комментарий менеджера и переводим в offer_sent
+        request = await request_state.transition(
+            session,
+            request_id,
+            "offer_sent",
+            values={"manager_comment": comment_text},
+        )
+        if request is None:
+            await message.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
                     "Статус заявки больше не позволяет отправить условия. "
-                    "Обновите карточку заявки и проверьте статус."
+                    "Обновите карточку заявки и проверьте статус.",
                 )
-                await state.clear()
-                return
-
-            # Сохраняем комментарий менеджера и переводим в offer_sent
-            request.manager_comment = comment_text
-            request.status = "offer_sent"
-            await session.commit()
-
-            # Определяем контакт менеджера для кнопки связи
-            manager_telegram_id = None
-            if request.service_center_id:
-                sc_res = await session.execute(
-                    select(ServiceCenter).where(
-                        ServiceCenter.id == request.service_center_id
-                    )
+            )
+            await state.clear()
+            return
+
+        user = await session.get(User, request.user_id)
+
+        # Определяем контакт менеджера для кнопки связи
+        route = await service_routing.resolve(request.service_center_id, session)
+        manager_telegram_id = route.owner_telegram_id if route else None
+
+        # Кнопки для клиента:
+        # 1) Отправить номер
+        # 2) Принять без передачи номера
+        # 3) Отклонить
+        # 4) Написать менеджеру (если есть контакт)
+        kb_rows = [
+            [
+                InlineKeyboardButton(
+                    text="📞 Отправить номер телефона",
+                    callback_data=f"offer_accept_show_phone:{request.id}",
                 )
-                sc = sc_res.scalar_one_or_none()
-                if sc and sc.owner_user_id:
-                    owner_res = await session.execute(
-                        select(User).where(User.id == sc.owner_user_id)
-                    )
-                    owner = owner_res.scalar_one_or_none()
-                    if owner and owner.telegram_id:
-                        manager_telegram_id = owner.telegram_id
-
-            # Кнопки для клиента:
-            # 1) Отправить номер
-            # 2) Принять без передачи номера
-            # 3) Отклонить
-            # 4) Написать менеджеру (если есть контакт)
-            kb_rows = [
-                [
-                    InlineKeyboardButton(
-                        text="📞 Отправить номер телефона",
-                        callback_data=f"offer_accept_show_phone:{request.id}",
-                    )
-                ],
+            ],
+            [
+                InlineKeyboardButton(
+                    text="✅ Принять без передачи номера",
+                    callback_data=f"offer_accept_no_phone:{request.id}",
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    text="❌ Отклонить предложение",
+                    callback_data=f"offer_reject:{request.id}",
+                ),
+            ],
+        ]
+
+        if manager_telegram_id:
+            kb_rows.append(
                 [
                     InlineKeyboardButton(
-                        text="✅ Принять без передачи номера",
-                        callback_data=f"offer_accept_no_phone:{request.id}",
+                        text="💬 Написать менеджеру",
+                        url=f"tg://user?id={manager_telegram_id}",
                     )
-                ],
-                [
-                    InlineKeyboardButton(
-                        text="❌ Отклонить предложение",
-                        callback_data=f"offer_reject:{request.id}",
-                    ),
-                ],
-            ]
-
-            if manager_telegram_id:
-                kb_rows.append(
-                    [
-                        InlineKeyboardButton(
-                            text="💬 Написать менеджеру",
-                            url=f"tg://user?id={manager_telegram_id}",
-                        )
-                    ]
-                )
-
-            kb = InlineKeyboardMarkup(inline_keyboard=kb_rows)
-
-            offer_text = (
-                f"📋 Ваша заявка #{request.id}\n\n"
-                f"🛠 Услуга: {request.service_type}\n\n"
-                f"💬 Условия от сервиса:\n{comment_text}\n\n"
-                "Вы можете:\n"
-                "• отправить номер телефона для связи;\n"
-                "• принять условия без передачи номера (общение только через Telegram);\n"
-                "• задать вопрос менеджеру;\n"
-                "• отклонить предложение."
+                ]
             )
 
-            try:
-                await message.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=offer_text,
-                    reply_markup=kb,
-                )
-            except Exception as send_err:
-                logging.error(
-                    f"❌ Не удалось отправить условия клиенту по заявке "
-                    f"#{request.id}: {send_err}"
-                )
+        kb = InlineKeyboardMarkup(inline_keyboard=kb_rows)
+
+        offer_text = (
+            f"📋 Ваша заявка #{request.id}\n\n"
+            f"🛠 Услуга: {request.service_type}\n\n"
+            f"💬 Условия от сервиса:\n{comment_text}\n\n"
+            "Вы можете:\n"
+            "• отправить номер телефона для связи;\n"
+            "• принять условия без передачи номера (общение только через Telegram);\n"
+            "• задать вопрос менеджеру;\n"
+            "• отклонить предложение."
+        )
 
-            # Сообщаем менеджеру
-            await message.answer(
-                f"✅ Условия по заявке #{request.id} отправлены клиенту."
-            )
+        # Условия клиенту и клавиатура под карточкой заявки — через outbox,
+        # в одной транзакции со сменой статуса
+        outbox.enqueue_message(session, user.telegram_id, offer_text, reply_markup=kb)
+        outbox.enqueue_chat_keyboard(session, request.id)
+        await session.commit()
 
-            # Обновляем клавиатуру под карточкой заявки
-            await update_chat_keyboard(message.bot, request.id)
+        # Сообщаем менеджеру
+        await message.answer(
+            f"✅ Условия по заявке #{request.id} отправлены клиенту."
+        )
 
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при сохранении условий по заявке #{request_id}: {e}"
-            )
-            await message.answer("❌ Ошибка при сохранении условий. Попробуйте позже.")
+    except Exception as e:
+        await session.rollback()
+        logging.error(
+            f"❌ Ошибка при сохранении условий по заявке #{request_id}: {e}"
+        )
+        await message.answer("❌ Ошибка при сохранении условий. Попробуйте позже.")
 
     await state.clear()
 
 
 @router.callback_query(F.data.startswith("mgr_reject:"))
-async def manager_reject_start(callback: CallbackQuery, state: FSMContext):
+async def manager_reject_start(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """
     Менеджер нажал "Отклонить заявку".
     Дальше спрашиваем причину отказа (FSM).
@@ -501,19 +417,18 @@ async def manager_reject_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        data = await _load_request_with_user(session, request_id)
-        if not data:
-            await callback.answer("❌ Заявка не найдена", show_alert=True)
-            return
+    data = await _load_request_with_user(session, request_id)
+    if not data:
+        await callback.answer("❌ Заявка не найдена", show_alert=True)
+        return
 
-        request, user = data
+    request, user = data
 
-        if request.status in ("completed", "rejected"):
-            await callback.answer(
-                "Заявка уже завершена или отклонена", show_alert=True
-            )
-            return
+    if request.status in ("completed", "rejected"):
+        await callback.answer(
+            "Заявка уже завершена или отклонена", show_alert=True
+        )
+        return
 
     await state.clear()
     await state.update_data(request_id=request_id)
@@ -532,6 +447,8 @@ async def manager_reject_start(callback: CallbackQuery, state: FSMContext):
 async def manager_start_work_handler(
     callback: CallbackQuery,
     state: FSMContext,
+    identity: Identity,
+    session: AsyncSession,
 ):
     """
     Менеджер/СТО нажимает "Принять в работу".
@@ -543,42 +460,34 @@ async def manager_start_work_handler(
         await callback.answer("Некорректные данные кнопки", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        # Загружаем заявку + сервис
-        result = await session.execute(
-            select(Request, ServiceCenter)
-            .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
-            .where(Request.id == request_id)
-        )
-        row = result.first()
-
-        if not row:
-            await callback.answer("Заявка не найдена", show_alert=True)
-            return
-
-        request, service_center = row
+    # Только владелец СТО: условие владения — в том же UPDATE, что и смена статуса
+    if identity.user_id is None:
+        await callback.answer("Только представитель сервиса может менять статус.", show_alert=True)
+        return
 
-        # Проверка права — только владелец СТО
-        result_user = await session.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
+    request = await request_state.transition(
+        session,
+        request_id,
+        "in_progress",
+        allowed=("accepted_by_client",),
+        where=[request_state.owned_by(identity.user_id)],
+    )
+    if request is None:
+        await callback.answer(
+            await _transition_refusal(
+                session,
+                request_id,
+                "Заявка не находится на этапе принятия клиентом.",
+                owner_user_id=identity.user_id,
+            ),
+            show_alert=True,
         )
-        actor = result_user.scalar_one_or_none()
-
-        if not actor or not service_center or actor.id != service_center.owner_user_id:
-            await callback.answer("Только представитель сервиса может менять статус.", show_alert=True)
-            return
-
-        if request.status != "accepted_by_client":
-            await callback.answer("Заявка не находится на этапе принятия клиентом.", show_alert=True)
-            return
-
-        request.status = "in_progress"
-        request.in_progress_at = datetime.utcnow()
+        return
 
-        await session.commit()
+    # Клавиатура в карточке обновится из outbox после коммита
+    outbox.enqueue_chat_keyboard(session, request_id)
+    await session.commit()
 
-    # Обновляем клавиатуру в карточке
-    await update_chat_keyboard(callback.bot, request_id)
     await callback.answer("Заявка принята в работу ✅")
 
 
@@ -586,6 +495,8 @@ async def manager_start_work_handler(
 async def manager_finish_work_handler(
     callback: CallbackQuery,
     state: FSMContext,
+    identity: Identity,
+    session: AsyncSession,
 ):
     """
     Менеджер/СТО нажимает "Работа выполнена".
@@ -597,39 +508,32 @@ async def manager_finish_work_handler(
         await callback.answer("Некорректные данные кнопки", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request, ServiceCenter)
-            .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
-            .where(Request.id == request_id)
-        )
-        row = result.first()
-
-        if not row:
-            await callback.answer("Заявка не найдена", show_alert=True)
-            return
-
-        request, service_center = row
+    # Только владелец СТО: условие владения — в том же UPDATE, что и смена статуса
+    if identity.user_id is None:
+        await callback.answer("Только представитель сервиса может менять статус.", show_alert=True)
+        return
 
-        result_user = await session.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
+    request = await request_state.transition(
+        session,
+        request_id,
+        "completed",
+        allowed=("in_progress",),
+        where=[request_state.owned_by(identity.user_id)],
+    )
+    if request is None:
+        await callback.answer(
+            await _transition_refusal(
+                session,
+                request_id,
+                "Заявка не находится в работе.",
+                owner_user_id=identity.user_id,
+            ),
+            show_alert=True,
         )
-        actor = result_user.scalar_one_or_none()
-
-        if not actor or not service_center or actor.id != service_center.owner_user_id:
-            await callback.answer("Только представитель сервиса может менять статус.", show_alert=True)
-            return
-
-        if request.status != "in_progress":
-            await callback.answer("Заявка не находится в работе.", show_alert=True)
-            return
-
-        request.status = "completed"
-        request.completed_at = datetime.utcnow()
-
-        await session.commit()
+        return
 
-    await update_chat_keyboard(callback.bot, request_id)
+    outbox.enqueue_chat_keyboard(session, request_id)
+    await session.commit()
 
     # На этом шаге просто фиксируем "завершено".
     # Следующим этапом повесим сюда запрос оценки и отзыва.
@@ -640,6 +544,8 @@ async def manager_finish_work_handler(
 async def manager_cancel_after_accept_handler(
     callback: CallbackQuery,
     state: FSMContext,
+    identity: Identity,
+    session: AsyncSession,
 ):
     """
     Менеджер/СТО отменяет заявку после того, как клиент принял условия
@@ -651,48 +557,39 @@ async def manager_cancel_after_accept_handler(
         await callback.answer("Некорректные данные кнопки", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request, ServiceCenter)
-            .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
-            .where(Request.id == request_id)
-        )
-        row = result.first()
-
-        if not row:
-            await callback.answer("Заявка не найдена", show_alert=True)
-            return
-
-        request, service_center = row
+    # Только владелец СТО: условие владения — в том же UPDATE, что и смена статуса
+    if identity.user_id is None:
+        await callback.answer("Только представитель сервиса может менять статус.", show_alert=True)
+        return
 
-        result_user = await session.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
+    request = await request_state.transition(
+        session,
+        request_id,
+        "cancelled",
+        where=[request_state.owned_by(identity.user_id)],
+        # Пометка в комментарии, не трогая уже существующий
+        note="Отмена сервиса.",
+    )
+    if request is None:
+        await callback.answer(
+            await _transition_refusal(
+                session,
+                request_id,
+                "Эту заявку нельзя отменить на текущем этапе.",
+                owner_user_id=identity.user_id,
+            ),
+            show_alert=True,
         )
-        actor = result_user.scalar_one_or_none()
-
-        if not actor or not service_center or actor.id != service_center.owner_user_id:
-            await callback.answer("Только представитель сервиса может менять статус.", show_alert=True)
-            return
-
-        if request.status not in ("accepted_by_client", "in_progress"):
-            await callback.answer("Эту заявку нельзя отменить на текущем этапе.", show_alert=True)
-            return
-
-        request.status = "cancelled"
-        request.rejected_at = datetime.utcnow()
-        # Добавим пометку в комментарий, не трогая уже существующий
-        base_comment = request.manager_comment or ""
-        suffix = "\n\nОтмена сервиса." if base_comment else "Отмена сервиса."
-        request.manager_comment = base_comment + suffix
+        return
 
-        await session.commit()
+    outbox.enqueue_chat_keyboard(session, request_id)
+    await session.commit()
 
-    await update_chat_keyboard(callback.bot, request_id)
     await callback.answer("Заявка отменена 🚫")
 
 
 @router.message(ManagerRejectStates.waiting_reason)
-async def manager_reject_reason(message: Message, state: FSMContext):
+async def manager_reject_reason(message: Message, state: FSMContext, session: AsyncSession):
     reason = (message.text or "").strip()
     if not reason:
         await message.answer(
@@ -707,54 +604,45 @@ async def manager_reject_reason(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            loaded = await _load_request_with_user(session, request_id)
-            if not loaded:
-                await message.answer("❌ Заявка не найдена.")
-                await state.clear()
-                return
+    try:
+        request = await request_state.transition(
+            session,
+            request_id,
+            "rejected",
+            values={"manager_comment": reason},
+        )
+        if request is None:
+            await message.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
+                    "Заявка уже завершена или отклонена. Статус изменить нельзя.",
+                )
+            )
+            await state.clear()
+            return
 
-            request, user = loaded
+        user = await session.get(User, request.user_id)
 
-            if request.status in ("completed", "rejected"):
-                await message.answer(
-                    "Заявка уже завершена или отклонена. Статус изменить нельзя."
-                )
-                await state.clear()
-                return
-
-            request.manager_comment = reason
-            request.status = "rejected"
-            request.rejected_at = datetime.now()
-            await session.commit()
-
-            # Уведомляем клиента
-            try:
-                text_client = (
-                    f"❌ Ваша заявка #{request.id} была отклонена.\n\n"
-                    f"Причина:\n{reason}"
-                )
-                await message.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=text_client,
-                )
-            except Exception as send_err:
-                logging.error(
-                    f"❌ Не удалось отправить сообщение клиенту об отклонении заявки #{request.id}: {send_err}"
-                )
+        # Уведомляем клиента и обновляем клавиатуру — через outbox
+        text_client = (
+            f"❌ Ваша заявка #{request.id} была отклонена.\n\n"
+            f"Причина:\n{reason}"
+        )
+        outbox.enqueue_message(session, user.telegram_id, text_client)
+        outbox.enqueue_chat_keyboard(session, request.id)
+        await session.commit()
 
-            await message.answer(
-                f"✅ Заявка #{request.id} отклонена, причина отправлена клиенту."
-            )
-            await update_chat_keyboard(message.bot, request.id)
+        await message.answer(
+            f"✅ Заявка #{request.id} отклонена, причина отправлена клиенту."
+        )
 
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при отклонении заявки #{request_id}: {e}"
-            )
-            await message.answer("❌ Ошибка при изменении статуса. Попробуйте позже.")
+    except Exception as e:
+        await session.rollback()
+        logging.error(
+            f"❌ Ошибка при отклонении заявки #{request_id}: {e}"
+        )
+        await message.answer("❌ Ошибка при изменении статуса. Попробуйте позже.")
 
     await state.clear()
 
@@ -764,7 +652,11 @@ async def manager_reject_reason(message: Message, state: FSMContext):
 # =======================
 
 @router.callback_query(F.data.startswith("offer_accept:"))
-async def client_accept_offer(callback: CallbackQuery):
+async def client_accept_offer(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Клиент принимает условия сервиса по заявке.
     В этот момент мы отправляем сервису номер телефона клиента.
@@ -775,74 +667,59 @@ async def client_accept_offer(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            result = await session.execute(
-                select(Request, User, ServiceCenter)
-                .join(User, Request.user_id == User.id)
-                .join(
-                    ServiceCenter,
-                    Request.service_center_id == ServiceCenter.id,
-                    isouter=True,
-                )
-                .where(Request.id == request_id)
+    try:
+        # Только своя заявка и только из offer_sent — повторное нажатие ничего не меняет
+        request = await request_state.transition(
+            session,
+            request_id,
+            "accepted_by_client",
+            where=[Request.user_id == identity.user_id],
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
+                    "Статус заявки не позволяет принять условия",
+                    client_user_id=identity.user_id,
+                ),
+                show_alert=True,
             )
-            row = result.first()
-            if not row:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user, service_center = row
-
-            # Проверяем, что это тот же пользователь
-            if user.telegram_id != callback.from_user.id:
-                await callback.answer(
-                    "❌ Эта заявка принадлежит другому пользователю",
-                    show_alert=True,
-                )
-                return
+            return
 
-            if request.status != "offer_sent":
-                await callback.answer(
-                    "Статус заявки не позволяет принять условия", show_alert=True
-                )
-                return
+        user = await session.get(User, request.user_id)
 
-            request.status = "accepted_by_client"
-            request.accepted_at = datetime.now()
-            await session.commit()
+        # Текст для уведомления сервиса
+        notify_text = f"✅ Клиент принял условия по заявке #{request.id}."
+        if user.phone_number:
+            notify_text += f"\n📞 Телефон клиента: {user.phone_number}"
 
-            # Текст для уведомления сервиса
-            notify_text = f"✅ Клиент принял условия по заявке #{request.id}."
-            if user.phone_number:
-                notify_text += f"\n📞 Телефон клиента: {user.phone_number}"
+        # Уведомление сервису и карточка заявки в его чате — через outbox
+        _enqueue_service_notice(session, request.id, notify_text)
+        outbox.enqueue_chat_keyboard(session, request.id)
 
-            # Уведомляем сервис
-            await _notify_service_about_client_action(
-                callback.bot,
-                session,
-                request,
-                service_center,
-                text=notify_text,
-            )
+        # Бонус за принятие условий — в той же транзакции
+        # (savepoint: сбой начисления не должен откатить смену статуса)
+        try:
+            async with session.begin_nested():
+                await add_bonus(
+                    callback.from_user.id,
+                    "accept_offer",
+                    description=f"Принятие условий по заявке #{request_id}",
+                    session=session,
+                )
+        except Exception as bonus_err:
+            logging.error(f"❌ Ошибка начисления бонуса за принятие условий: {bonus_err}")
 
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при подтверждении условий клиентом для заявки #{request_id}: {e}"
-            )
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
-            return
+        await session.commit()
 
-    # Бонус за принятие условий
-    try:
-        await add_bonus(
-            callback.from_user.id,
-            "accept_offer",
-            description=f"Принятие условий по заявке #{request_id}",
+    except Exception as e:
+        await session.rollback()
+        logging.error(
+            f"❌ Ошибка при подтверждении условий клиентом для заявки #{request_id}: {e}"
         )
-    except Exception as bonus_err:
-        logging.error(f"❌ Ошибка начисления бонуса за принятие условий: {bonus_err}")
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
     # Сообщение клиенту
     await callback.answer(
@@ -857,16 +734,12 @@ async def client_accept_offer(callback: CallbackQuery):
     except Exception:
         pass
 
-    # Обновляем карточку заявки в чате сервиса (кнопки)
-    try:
-        await update_chat_keyboard(callback.bot, request_id)
-    except Exception as e:
-        logging.error(
-            f"❌ Не удалось обновить клавиатуру в чате заявки #{request_id}: {e}"
-        )
-
 @router.callback_query(F.data.startswith("offer_accept_no_phone:"))
-async def client_accept_offer_no_phone(callback: CallbackQuery):
+async def client_accept_offer_no_phone(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Клиент принимает условия сервиса, НО не отправляет номер телефона.
     Общение идёт только через чат Telegram.
@@ -877,73 +750,59 @@ async def client_accept_offer_no_phone(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            result = await session.execute(
-                select(Request, User, ServiceCenter)
-                .join(User, Request.user_id == User.id)
-                .join(
-                    ServiceCenter,
-                    Request.service_center_id == ServiceCenter.id,
-                    isouter=True,
-                )
-                .where(Request.id == request_id)
+    try:
+        # Только своя заявка и только из offer_sent — повторное нажатие ничего не меняет
+        request = await request_state.transition(
+            session,
+            request_id,
+            "accepted_by_client",
+            where=[Request.user_id == identity.user_id],
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
+                    "Статус заявки не позволяет принять условия",
+                    client_user_id=identity.user_id,
+                ),
+                show_alert=True,
             )
-            row = result.first()
-            if not row:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user, service_center = row
-
-            # Защита от «чужих» заявок
-            if user.telegram_id != callback.from_user.id:
-                await callback.answer(
-                    "❌ Эта заявка принадлежит другому пользователю",
-                    show_alert=True,
-                )
-                return
-
-            if request.status != "offer_sent":
-                await callback.answer(
-                    "Статус заявки не позволяет принять условия", show_alert=True
-                )
-                return
+            return
 
-            request.status = "accepted_by_client"
-            request.accepted_at = datetime.now()
-            await session.commit()
+        # Уведомляем сервис (клиент принял, но номер не дал) и обновляем
+        # карточку в его чате — через outbox
+        _enqueue_service_notice(
+            session,
+            request.id,
+            f"✅ Клиент принял условия по заявке #{request.id}.\n"
+            f"ℹ️ Клиент выбрал НЕ показывать номер телефона.\n"
+            f"Свяжитесь с ним через чат Telegram.",
+        )
+        outbox.enqueue_chat_keyboard(session, request.id)
 
-            # Уведомляем сервис: клиент принял, но номер не дал
-            await _notify_service_about_client_action(
-                callback.bot,
-                session,
-                request,
-                service_center,
-                text=(
-                    f"✅ Клиент принял условия по заявке #{request.id}.\n"
-                    f"ℹ️ Клиент выбрал НЕ показывать номер телефона.\n"
-                    f"Свяжитесь с ним через чат Telegram."
-                ),
-            )
+        # Бонус за принятие условий — в той же транзакции
+        # (savepoint: сбой начисления не должен откатить смену статуса)
+        try:
+            async with session.begin_nested():
+                await add_bonus(
+                    callback.from_user.id,
+                    "accept_offer",
+                    description=f"Принятие условий без показа номера по заявке #{request_id}",
+                    session=session,
+                )
+        except Exception as bonus_err:
+            logging.error(f"❌ Ошибка начисления бонуса за принятие условий: {bonus_err}")
 
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при подтверждении условий (без номера) клиентом для заявки #{request_id}: {e}"
-            )
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
-            return
+        await session.commit()
 
-    # Бонус за принятие условий
-    try:
-        await add_bonus(
-            callback.from_user.id,
-            "accept_offer",
-            description=f"Принятие условий без показа номера по заявке #{request_id}",
+    except Exception as e:
+        await session.rollback()
+        logging.error(
+            f"❌ Ошибка при подтверждении условий (без номера) клиентом для заявки #{request_id}: {e}"
         )
-    except Exception as bonus_err:
-        logging.error(f"❌ Ошибка начисления бонуса за принятие условий: {bonus_err}")
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
     await callback.answer("✅ Вы приняли условия сервиса, не показывая номер.", show_alert=True)
 
@@ -953,17 +812,13 @@ async def client_accept_offer_no_phone(callback: CallbackQuery):
     except Exception:
         pass
 
-    # Обновляем карточку заявки в чате сервиса
-    try:
-        await update_chat_keyboard(callback.bot, request_id)
-    except Exception as e:
-        logging.error(
-            f"❌ Не удалось обновить клавиатуру в чате заявки #{request_id}: {e}"
-        )
-
 
 @router.callback_query(F.data.startswith("offer_accept_show_phone:"))
-async def client_accept_offer_show_phone(callback: CallbackQuery):
+async def client_accept_offer_show_phone(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Клиент принимает предложение сервиса и СОГЛАСЕН передать свой номер телефона.
     """
@@ -973,84 +828,80 @@ async def client_accept_offer_show_phone(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            result = await session.execute(
-                select(Request, User, ServiceCenter)
-                .join(User, Request.user_id == User.id)
-                .join(
-                    ServiceCenter,
-                    Request.service_center_id == ServiceCenter.id,
-                    isouter=True,
-                )
-                .where(Request.id == request_id)
+    try:
+        # помечаем как принята клиентом (только своя заявка и только из offer_sent)
+        request = await request_state.transition(
+            session,
+            request_id,
+            "accepted_by_client",
+            where=[Request.user_id == identity.user_id],
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
+                    "Статус заявки не позволяет принять условия",
+                    client_user_id=identity.user_id,
+                ),
+                show_alert=True,
             )
-            row = result.first()
-            if not row:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user, service_center = row
-
-            if user.telegram_id != callback.from_user.id:
-                await callback.answer(
-                    "❌ Эта заявка принадлежит другому пользователю",
-                    show_alert=True,
-                )
-                return
-
-            if request.status != "offer_sent":
-                await callback.answer(
-                    "Статус заявки не позволяет принять условия", show_alert=True
-                )
-                return
-
-            # помечаем как принята клиентом
-            request.status = "accepted_by_client"
-            request.accepted_at = datetime.now()
-
-            # уведомление сервису + передача телефона
-            notify_text = f"✅ Клиент принял условия по заявке #{request.id}."
-            if user.phone_number:
-                notify_text += f"\n📞 Телефон клиента: {user.phone_number}"
+            return
 
-            await _notify_service_about_client_action(
-                callback.bot,
-                session,
-                request,
-                service_center,
-                text=notify_text,
-            )
+        user = await session.get(User, request.user_id)
 
-            # ⚙️ Автоотказ другим параллельным заявкам
-            await _auto_decline_other_requests(callback.bot, session, request)
+        # уведомление сервису + передача телефона (через outbox)
+        notify_text = f"✅ Клиент принял условия по заявке #{request.id}."
+        if user.phone_number:
+            notify_text += f"\n📞 Телефон клиента: {user.phone_number}"
 
-            # общий коммит
-            await session.commit()
+        _enqueue_service_notice(session, request.id, notify_text)
+        outbox.enqueue_chat_keyboard(session, request.id)
 
+        # ⚙️ Автоотказ другим параллельным заявкам (рассылка — из outbox после коммита)
+        declined = []
+        try:
+            async with session.begin_nested():
+                declined = await auto_decline.decline_competing_requests(session, request)
         except Exception as e:
-            await session.rollback()
             logging.error(
-                f"❌ Ошибка при подтверждении условий клиентом (show_phone) для заявки #{request_id}: {e}"
+                f"❌ Ошибка auto-decline для заявки #{request.id}: {e}"
             )
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
-            return
+        auto_decline.enqueue_notifications(session, declined, client_telegram_id=user.telegram_id)
 
-    # бонусы
-    try:
-        await add_bonus(
-            callback.from_user.id,
-            "accept_offer",
-            description=f"Принятие условий по заявке #{request_id}",
+        # Бонус за принятие условий — в той же транзакции
+        # (savepoint: сбой начисления не должен откатить смену статуса)
+        try:
+            async with session.begin_nested():
+                await add_bonus(
+                    callback.from_user.id,
+                    "accept_offer",
+                    description=f"Принятие условий по заявке #{request_id}",
+                    session=session,
+                )
+        except Exception as bonus_err:
+            logging.error(f"❌ Ошибка начисления бонуса за принятие условий: {bonus_err}")
+
+        # общий коммит
+        await session.commit()
+
+    except Exception as e:
+        await session.rollback()
+        logging.error(
+            f"❌ Ошибка при подтверждении условий клиентом (show_phone) для заявки #{request_id}: {e}"
         )
-    except Exception as bonus_err:
-        logging.error(f"❌ Ошибка начисления бонуса за принятие условий: {bonus_err}")
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
     await callback.answer("✅ Вы приняли условия сервиса и передали свой номер.")
 
 
 @router.callback_query(F.data.startswith("offer_reject:"))
-async def client_reject_offer(callback: CallbackQuery):
+async def client_reject_offer(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Клиент отклоняет условия сервиса по заявке.
     """
@@ -1060,60 +911,42 @@ async def client_reject_offer(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            result = await session.execute(
-                select(Request, User, ServiceCenter)
-                .join(User, Request.user_id == User.id)
-                .join(
-                    ServiceCenter,
-                    Request.service_center_id == ServiceCenter.id,
-                    isouter=True,
-                )
-                .where(Request.id == request_id)
-            )
-            row = result.first()
-            if not row:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user, service_center = row
-
-            if user.telegram_id != callback.from_user.id:
-                await callback.answer(
-                    "❌ Эта заявка принадлежит другому пользователю",
-                    show_alert=True,
-                )
-                return
-
-            if request.status != "offer_sent":
-                await callback.answer(
+    try:
+        request = await request_state.transition(
+            session,
+            request_id,
+            "rejected",
+            allowed=("offer_sent",),
+            where=[Request.user_id == identity.user_id],
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
                     "Статус заявки не позволяет отклонить условия",
-                    show_alert=True,
-                )
-                return
-
-            request.status = "rejected"
-            request.rejected_at = datetime.now()
-            await session.commit()
-
-            # Уведомляем сервис о том, что клиент отклонил условия
-            await _notify_service_about_client_action(
-                callback.bot,
-                session,
-                request,
-                service_center,
-                text=f"❌ Клиент отклонил условия по заявке #{request.id}.",
-            )
-
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при отказе от условий клиентом для заявки #{request_id}: {e}"
+                    client_user_id=identity.user_id,
+                ),
+                show_alert=True,
             )
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
             return
 
+        # Уведомляем сервис о том, что клиент отклонил условия, и обновляем
+        # карточку в его чате — через outbox
+        _enqueue_service_notice(
+            session, request.id, f"❌ Клиент отклонил условия по заявке #{request.id}."
+        )
+        outbox.enqueue_chat_keyboard(session, request.id)
+        await session.commit()
+
+    except Exception as e:
+        await session.rollback()
+        logging.error(
+            f"❌ Ошибка при отказе от условий клиентом для заявки #{request_id}: {e}"
+        )
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
+
     await callback.answer("❌ Вы отклонили условия.", show_alert=True)
 
     # Убираем кнопки у клиента
@@ -1122,21 +955,13 @@ async def client_reject_offer(callback: CallbackQuery):
     except Exception:
         pass
 
-    # Обновляем карточку заявки в чате сервиса (кнопки)
-    try:
-        await update_chat_keyboard(callback.bot, request_id)
-    except Exception as e:
-        logging.error(
-            f"❌ Не удалось обновить клавиатуру в чате заявки #{request_id}: {e}"
-        )
-
 
 # =======================
 # 3. Менеджер: принять / взять в работу / завершить / отменить / обновить
 # =======================
 
 @router.callback_query(F.data.startswith("chat_confirm:"))
-async def manager_confirm_after_client(callback: CallbackQuery):
+async def manager_confirm_after_client(callback: CallbackQuery, session: AsyncSession):
     """
     Менеджер подтверждает заявку после того, как клиент принял условия.
     Статус: accepted_by_client -> accepted
@@ -1151,55 +976,49 @@ async def manager_confirm_after_client(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            data = await _load_request_with_user(session, request_id)
-            if not data:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user = data
-
-            if request.status != "accepted_by_client":
-                await callback.answer(
+    try:
+        request = await request_state.transition(
+            session,
+            request_id,
+            "accepted",
+            allowed=("accepted_by_client",),
+            keep_timestamp=True,
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
                     "Заявка не находится в статусе 'принята клиентом'",
-                    show_alert=True,
-                )
-                return
-
-            request.status = "accepted"
-            if not request.accepted_at:
-                request.accepted_at = datetime.now()
-
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при подтверждении заявки менеджером #{request_id}: {e}"
+                ),
+                show_alert=True,
             )
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
             return
 
-    # Уведомляем клиента
-    try:
-        await callback.bot.send_message(
-            chat_id=user.telegram_id,
-            text=(
-                f"✅ Ваша заявка #{request.id} принята сервисом.\n"
-                f"Скоро работы будут начаты."
-            ),
+        user = await session.get(User, request.user_id)
+
+        # Уведомляем клиента и обновляем клавиатуру — через outbox
+        outbox.enqueue_message(
+            session,
+            user.telegram_id,
+            f"✅ Ваша заявка #{request.id} принята сервисом.\n"
+            f"Скоро работы будут начаты.",
         )
+        outbox.enqueue_chat_keyboard(session, request_id)
+        await session.commit()
     except Exception as e:
+        await session.rollback()
         logging.error(
-            f"❌ Не удалось уведомить клиента о подтверждении заявки #{request_id}: {e}"
+            f"❌ Ошибка при подтверждении заявки менеджером #{request_id}: {e}"
         )
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
-    await update_chat_keyboard(callback.bot, request_id)
     await callback.answer("✅ Заявка подтверждена")
 
 
 @router.callback_query(F.data.startswith("chat_start:"))
-async def manager_start_work(callback: CallbackQuery):
+async def manager_start_work(callback: CallbackQuery, session: AsyncSession):
     """
     Менеджер берёт заявку в работу.
 
@@ -1217,56 +1036,48 @@ async def manager_start_work(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            data = await _load_request_with_user(session, request_id)
-            if not data:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user = data
-
-            if request.status not in ("accepted_by_client", "accepted"):
-                await callback.answer(
+    try:
+        request = await request_state.transition(
+            session,
+            request_id,
+            "in_progress",
+            values={"accepted_at": func.coalesce(Request.accepted_at, func.now())},
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
                     "Заявку можно взять в работу только после принятия условий клиентом",
-                    show_alert=True,
-                )
-                return
-
-            if not request.accepted_at:
-                request.accepted_at = datetime.now()
-
-            request.status = "in_progress"
-            request.in_progress_at = datetime.now()
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(
-                f"❌ Ошибка при переводе заявки #{request_id} в работу: {e}"
+                ),
+                show_alert=True,
             )
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
             return
 
-    # Уведомляем клиента
-    try:
-        await callback.bot.send_message(
-            chat_id=user.telegram_id,
-            text=(
-                f"🔧 Ваш автомобиль по заявке #{request.id} взят в работу.\n"
-                f"По окончании работ вы получите уведомление."
-            ),
+        user = await session.get(User, request.user_id)
+
+        # Уведомляем клиента и обновляем клавиатуру — через outbox
+        outbox.enqueue_message(
+            session,
+            user.telegram_id,
+            f"🔧 Ваш автомобиль по заявке #{request.id} взят в работу.\n"
+            f"По окончании работ вы получите уведомление.",
         )
+        outbox.enqueue_chat_keyboard(session, request_id)
+        await session.commit()
     except Exception as e:
+        await session.rollback()
         logging.error(
-            f"❌ Не удалось уведомить клиента о начале работ по заявке #{request_id}: {e}"
+            f"❌ Ошибка при переводе заявки #{request_id} в работу: {e}"
         )
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
-    await update_chat_keyboard(callback.bot, request_id)
     await callback.answer("✅ Заявка взята в работу")
 
 
 @router.callback_query(F.data.startswith("chat_complete:"))
-async def manager_complete_request(callback: CallbackQuery):
+async def manager_complete_request(callback: CallbackQuery, session: AsyncSession):
     """
     Менеджер завершает заявку (работы выполнены).
     """
@@ -1280,63 +1091,62 @@ async def manager_complete_request(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            data = await _load_request_with_user(session, request_id)
-            if not data:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user = data
-
-            if request.status != "in_progress":
-                await callback.answer(
+    try:
+        request = await request_state.transition(
+            session,
+            request_id,
+            "completed",
+            allowed=("in_progress",),
+        )
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
                     "Завершить можно только заявку, находящуюся в работе",
-                    show_alert=True,
-                )
-                return
-
-            request.status = "completed"
-            request.completed_at = datetime.now()
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"❌ Ошибка завершения заявки #{request_id}: {e}")
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+                ),
+                show_alert=True,
+            )
             return
 
-    # Бонус за завершённую заявку
-    # Бонус за завершённую заявку
-    try:
-        await add_bonus(
-            user.telegram_id,
-            "complete_request",
-            description=f"Завершение заявки #{request_id}",
-        )
-    except Exception as bonus_err:
-        logging.error(f"❌ Ошибка начисления бонуса за завершение заявки: {bonus_err}")
+        user = await session.get(User, request.user_id)
 
-    # Уведомляем клиента и просим оценить сервис
-    try:
-        await callback.bot.send_message(
-            chat_id=user.telegram_id,
-            text=(
-                f"🏁 Работы по вашей заявке #{request.id} завершены.\n"
-                f"Пожалуйста, оцените работу сервиса по шкале от 1 до 5."
-            ),
+        # Уведомляем клиента (с просьбой оценить сервис) и обновляем
+        # клавиатуру — через outbox
+        outbox.enqueue_message(
+            session,
+            user.telegram_id,
+            f"🏁 Работы по вашей заявке #{request.id} завершены.\n"
+            f"Пожалуйста, оцените работу сервиса по шкале от 1 до 5.",
             reply_markup=get_rating_kb(request.id),
         )
+        outbox.enqueue_chat_keyboard(session, request_id)
+
+        # Бонус за завершённую заявку — в той же транзакции
+        # (savepoint: сбой начисления не должен откатить смену статуса)
+        try:
+            async with session.begin_nested():
+                await add_bonus(
+                    user.telegram_id,
+                    "complete_request",
+                    description=f"Завершение заявки #{request_id}",
+                    session=session,
+                )
+        except Exception as bonus_err:
+            logging.error(f"❌ Ошибка начисления бонуса за завершение заявки: {bonus_err}")
+
+        await session.commit()
     except Exception as e:
-        logging.error(
-            f"❌ Не удалось уведомить клиента о завершении заявки #{request_id}: {e}"
-        )
+        await session.rollback()
+        logging.error(f"❌ Ошибка завершения заявки #{request_id}: {e}")
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
-    await update_chat_keyboard(callback.bot, request_id)
     await callback.answer("✅ Заявка завершена")
 
 
 @router.callback_query(F.data.startswith("chat_cancel:"))
-async def manager_cancel_request(callback: CallbackQuery):
+async def manager_cancel_request(callback: CallbackQuery, session: AsyncSession):
     """
     Менеджер отменяет заявку на любом этапе до завершения.
     """
@@ -1350,50 +1160,41 @@ async def manager_cancel_request(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        try:
-            data = await _load_request_with_user(session, request_id)
-            if not data:
-                await callback.answer("❌ Заявка не найдена", show_alert=True)
-                return
-
-            request, user = data
-
-            if request.status in ("completed", "rejected"):
-                await callback.answer(
-                    "Заявка уже завершена или отклонена", show_alert=True
-                )
-                return
-
-            request.status = "rejected"
-            request.rejected_at = datetime.now()
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"❌ Ошибка отмены заявки #{request_id}: {e}")
-            await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+    try:
+        request = await request_state.transition(session, request_id, "rejected")
+        if request is None:
+            await callback.answer(
+                await _transition_refusal(
+                    session,
+                    request_id,
+                    "Заявка уже завершена или отклонена",
+                ),
+                show_alert=True,
+            )
             return
 
-    # Уведомляем клиента
-    try:
-        await callback.bot.send_message(
-            chat_id=user.telegram_id,
-            text=(
-                f"❌ Ваша заявка #{request.id} была отменена сервисом.\n"
-                f"При необходимости вы можете создать новую заявку."
-            ),
+        user = await session.get(User, request.user_id)
+
+        # Уведомляем клиента и обновляем клавиатуру — через outbox
+        outbox.enqueue_message(
+            session,
+            user.telegram_id,
+            f"❌ Ваша заявка #{request.id} была отменена сервисом.\n"
+            f"При необходимости вы можете создать новую заявку.",
         )
+        outbox.enqueue_chat_keyboard(session, request_id)
+        await session.commit()
     except Exception as e:
-        logging.error(
-            f"❌ Не удалось отправить сообщение клиенту об отмене заявки #{request_id}: {e}"
-        )
+        await session.rollback()
+        logging.error(f"❌ Ошибка отмены заявки #{request_id}: {e}")
+        await callback.answer("❌ Ошибка, попробуйте позже", show_alert=True)
+        return
 
-    await update_chat_keyboard(callback.bot, request_id)
     await callback.answer("✅ Заявка отменена")
 
 
 @router.callback_query(F.data.startswith("chat_refresh:"))
-async def manager_refresh_keyboard(callback: CallbackQuery):
+async def manager_refresh_keyboard(callback: CallbackQuery, session: AsyncSession):
     """
     Ручное обновление клавиатуры под заявкой.
     """
@@ -1407,5 +1208,5 @@ async def manager_refresh_keyboard(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    await update_chat_keyboard(callback.bot, request_id)
+    await update_chat_keyboard(callback.bot, request_id, session=session)
     await callback.answer("🔄 Обновлено")
@@ -1,15 +1,15 @@
 import logging
-from datetime import datetime
 from typing import Optional, List
 
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 
-from sqlalchemy import select, func
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import config
 from app.keyboards.main_kb import (
@@ -22,7 +22,11 @@ from app.keyboards.main_kb import (
 
 from app.database.db import AsyncSessionLocal
 from app.database.models import Request, User, Car, ServiceCenter
-from app.services.chat_service import update_chat_keyboard
+from app.services import card_sync, geo_search, outbox, render_cache, request_counters, request_search, request_state, service_routing
+from app.services import identity as identity_service
+from app.services.identity import Identity
+from app.services.pagination import NEXT, PREV, fetch_request_page, page_callback, parse_page_args
+from app.services.specializations import set_service_specializations
 
 router = Router()
 
@@ -33,31 +37,25 @@ PAGE_SIZE = 5
 #   Проверка менеджера
 # ==========================
 
-async def is_manager(user_id: int) -> bool:
+async def is_manager(user_id: int, session: Optional[AsyncSession] = None) -> bool:
     """
     Проверяем, является ли пользователь менеджером автосервиса.
 
     Логика:
     - если user_id входит в ADMIN_USER_IDS → это администратор/менеджер;
-    - иначе проверяем пользователя в БД:
+    - иначе проверяем пользователя (через кэш identity, при промахе — БД):
         • пользователь существует
         • его роль == "service"
+
+    В хендлерах удобнее брать готовый аргумент `identity: Identity`
+    (IdentityMiddleware) — это то же самое без лишнего вызова.
     """
     # 1. Глобальный админ
     if user_id in config.ADMIN_USER_IDS:
         return True
 
-    # 2. Проверяем роль пользователя в БД
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-
-    if not user:
-        return False
-
-    return user.role == "service"
+    # 2. Роль пользователя
+    return (await identity_service.resolve(user_id, session=session)).is_manager
 
 
 # ==========================
@@ -228,6 +226,21 @@ def _get_request_actions_kb(req: Request) -> InlineKeyboardBuilder:
     return kb
 
 
+def _render_request_card(
+    req: Request,
+    user: User,
+    car: Optional[Car],
+) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    Карточка заявки в /manager (текст + действия) — из кэша по версии заявки.
+    """
+    def build() -> tuple[str, Optional[InlineKeyboardMarkup]]:
+        kb = _get_request_actions_kb(req)
+        return _format_request_full(req, user, car), kb.as_markup() if kb.buttons else None
+
+    return render_cache.render(req, "manager_card", build)
+
+
 def _build_requests_list_kb(requests: list[Request]) -> InlineKeyboardBuilder:
     """
     Строим клавиатуру для списка заявок — кнопки "Открыть #id".
@@ -247,19 +260,31 @@ def _build_requests_list_kb(requests: list[Request]) -> InlineKeyboardBuilder:
 # ==========================
 
 @router.message(Command("manager"))
-async def manager_command(message: Message):
+async def manager_command(message: Message, session: AsyncSession):
     """
     /manager — вход в панель заявок автосервиса.
     Доступ:
       - ADMIN_USER_ID
       - пользователи с ролью 'service'
     """
-    if not await is_manager(message.from_user.id):
+    if not await is_manager(message.from_user.id, session=session):
         await message.answer("❌ Команда доступна только представителям автосервисов.")
         return
 
+    sc_id = await get_manager_sc_id(message.from_user.id, session=session)
+    new_count = await request_counters.count_requests(session, sc_id, ["new"])
+    scheduled_count = await request_counters.count_requests(
+        session, sc_id, ["accepted_by_client"]
+    )
+    in_progress_count = await request_counters.count_requests(
+        session, sc_id, ["accepted", "in_progress"]
+    )
+
     await message.answer(
         "🛠 Панель заявок автосервиса.\n\n"
+        f"📥 Новых: {new_count}\n"
+        f"📅 Запланировано: {scheduled_count}\n"
+        f"🔄 В обработке: {in_progress_count}\n\n"
         "Выберите нужный раздел:",
         reply_markup=get_manager_main_kb(),
     )
@@ -329,15 +354,15 @@ async def manager_archive(callback: CallbackQuery):
 async def manager_list_page(callback: CallbackQuery):
     """
     Пагинация списков заявок менеджера.
-    Формат callback_data: manager_list_page:<list_key>:<page>
+    Формат callback_data: manager_list_page:<list_key>:<page>:<n|p>:<id заявки-курсора>
     """
     if not await is_manager(callback.from_user.id):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
     try:
-        _, list_key, raw_page = callback.data.split(":")
-        page = int(raw_page)
+        _, list_key, *page_args = callback.data.split(":")
+        page, direction, cursor_id = parse_page_args(page_args)
     except Exception:
         await callback.answer("Некорректные данные пагинации", show_alert=True)
         return
@@ -361,6 +386,8 @@ async def manager_list_page(callback: CallbackQuery):
         status_filter=statuses,
         list_key=list_key,
         page=page,
+        direction=direction,
+        cursor_id=cursor_id,
     )
 
 
@@ -370,38 +397,24 @@ async def _send_requests_list(
     status_filter: Optional[list[str]] = None,
     list_key: str = "new",
     page: int = 1,
+    direction: str = NEXT,
+    cursor_id: Optional[int] = None,
 ):
     """
     Общая функция отправки списка заявок менеджеру.
-    С учётом привязки к сервису и пагинации.
+    С учётом привязки к сервису и keyset-пагинации (курсор — id крайней заявки).
     """
     if not await is_manager(callback.from_user.id):
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
-    if page < 1:
-        page = 1
-
     # Определяем, к какому сервису относится менеджер
     sc_id = await get_manager_sc_id(callback.from_user.id)
 
     async with AsyncSessionLocal() as session:
-        # Считаем общее количество заявок по фильтру
-        count_stmt = select(func.count()).select_from(Request)
-
-        if sc_id is not None:
-            # Менеджер сервиса видит:
-            #  - заявки своего сервиса
-            #  - и непривязанные заявки (service_center_id IS NULL)
-            count_stmt = count_stmt.where(
-                (Request.service_center_id == sc_id)
-                | (Request.service_center_id.is_(None))
-            )
-
-        if status_filter:
-            count_stmt = count_stmt.where(Request.status.in_(status_filter))
-
-        total = (await session.execute(count_stmt)).scalar() or 0
+        # Общее количество заявок по фильтру — из счётчиков, без count(*) по requests.
+        # Менеджер сервиса видит заявки своего сервиса и непривязанные заявки.
+        total = await request_counters.count_requests(session, sc_id, status_filter)
         if total == 0:
             await callback.message.edit_text(
                 f"{title}\n\nПо данному фильтру заявок не найдено.",
@@ -410,13 +423,6 @@ async def _send_requests_list(
             await callback.answer()
             return
 
-        total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
-        if page > total_pages:
-            page = total_pages
-
-        offset = (page - 1) * PAGE_SIZE
-
-        # Получаем нужную страницу
         stmt = (
             select(Request, User, Car)
             .join(User, Request.user_id == User.id)
@@ -432,10 +438,9 @@ async def _send_requests_list(
         if status_filter:
             stmt = stmt.where(Request.status.in_(status_filter))
 
-        stmt = stmt.order_by(Request.created_at.desc()).offset(offset).limit(PAGE_SIZE)
-
-        result = await session.execute(stmt)
-        rows = result.all()
+        rows, has_prev, has_next = await fetch_request_page(
+            session, stmt, cursor_id, direction, PAGE_SIZE
+        )
 
     if not rows:
         await callback.message.edit_text(
@@ -445,6 +450,14 @@ async def _send_requests_list(
         await callback.answer()
         return
 
+    # Номер страницы — для подписи; счётчики могли измениться между кликами
+    total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+    if not has_prev:
+        page = 1
+    page = max(1, min(page, total_pages))
+    if has_next and page == total_pages:
+        total_pages += 1
+
     requests = [r[0] for r in rows]
 
     lines = [f"{title} (стр. {page}/{total_pages})", ""]
@@ -457,20 +470,21 @@ async def _send_requests_list(
 
     # Добавляем пагинацию
     nav_builder = InlineKeyboardBuilder()
-    if total_pages > 1:
-        if page > 1:
+    if has_prev or has_next:
+        prefix = f"manager_list_page:{list_key}"
+        if has_prev:
             nav_builder.button(
                 text="⬅️ Назад",
-                callback_data=f"manager_list_page:{list_key}:{page - 1}",
+                callback_data=page_callback(prefix, page - 1, PREV, requests[0].id),
             )
         nav_builder.button(
             text=f"Стр. {page}/{total_pages}",
             callback_data="manager_list_page:noop:0",
         )
-        if page < total_pages:
+        if has_next:
             nav_builder.button(
                 text="Вперёд ➡️",
-                callback_data=f"manager_list_page:{list_key}:{page + 1}",
+                callback_data=page_callback(prefix, page + 1, NEXT, requests[-1].id),
             )
         nav_builder.adjust(3)
 
@@ -514,11 +528,18 @@ async def manager_search(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(ManagerSearchStates.waiting_query)
-async def manager_search_process(message: Message, state: FSMContext):
+async def manager_search_process(
+    message: Message,
+    state: FSMContext,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Обработка текстового запроса поиска.
+    Точные совпадения (номер заявки, госномер, VIN, телефон) идут первыми,
+    дальше — полнотекстовые по релевантности.
     """
-    if not await is_manager(message.from_user.id):
+    if not identity.is_manager:
         await message.answer("❌ Нет доступа к поиску заявок.")
         return
 
@@ -527,36 +548,8 @@ async def manager_search_process(message: Message, state: FSMContext):
         await message.answer("Введите непустой поисковый запрос.")
         return
 
-    like = f"%{query.upper()}%"
-
     # СТО менеджера (или None для админа)
-    sc_id = await get_manager_sc_id(message.from_user.id)
-
-    async with AsyncSessionLocal() as session:
-        stmt = (
-            select(Request, User, Car)
-            .join(User, Request.user_id == User.id)
-            .join(Car, Request.car_id == Car.id, isouter=True)
-            .where(
-                func.upper(User.full_name).like(like)
-                | func.upper(User.phone_number).like(like)
-                | func.upper(Car.license_plate).like(like)
-                | func.upper(Car.vin).like(like)
-                | func.upper(Request.description).like(like)
-            )
-            .order_by(Request.created_at.desc())
-            .limit(20)
-        )
-
-        if sc_id is not None:
-            # Менеджер сервиса видит только свои и непривязанные заявки
-            stmt = stmt.where(
-                (Request.service_center_id == sc_id)
-                | (Request.service_center_id.is_(None))
-            )
-
-        result = await session.execute(stmt)
-        rows = result.all()
+    rows = await request_search.search_requests(session, query, identity.manager_sc_id)
 
     if not rows:
         await message.answer(
@@ -588,12 +581,16 @@ async def manager_search_process(message: Message, state: FSMContext):
 # ==========================
 
 @router.callback_query(F.data.startswith("manager_open_request:"))
-async def manager_open_request(callback: CallbackQuery):
+async def manager_open_request(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Открытие полной информации по заявке из списка/поиска.
     Здесь же показываем времена стадий.
     """
-    if not await is_manager(callback.from_user.id):
+    if not identity.is_manager:
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
@@ -605,18 +602,17 @@ async def manager_open_request(callback: CallbackQuery):
         return
 
     # СТО менеджера (или None для админа)
-    sc_id = await get_manager_sc_id(callback.from_user.id)
+    sc_id = identity.manager_sc_id
 
-    async with AsyncSessionLocal() as session:
-        stmt = (
-            select(Request, User, Car)
-            .join(User, Request.user_id == User.id)
-            .join(Car, Request.car_id == Car.id, isouter=True)
-            .where(Request.id == request_id)
-        )
+    stmt = (
+        select(Request, User, Car)
+        .join(User, Request.user_id == User.id)
+        .join(Car, Request.car_id == Car.id, isouter=True)
+        .where(Request.id == request_id)
+    )
 
-        result = await session.execute(stmt)
-        row = result.first()
+    result = await session.execute(stmt)
+    row = result.first()
 
     if not row:
         await callback.answer("Заявка не найдена", show_alert=True)
@@ -629,13 +625,9 @@ async def manager_open_request(callback: CallbackQuery):
         await callback.answer("❌ У вас нет доступа к этой заявке.", show_alert=True)
         return
 
-    text = _format_request_full(req, user, car)
-    kb = _get_request_actions_kb(req)
+    text, markup = _render_request_card(req, user, car)
 
-    await callback.message.edit_text(
-        text,
-        reply_markup=kb.as_markup() if kb.buttons else None,
-    )
+    await callback.message.edit_text(text, reply_markup=markup)
     await callback.answer()
 
 
@@ -643,15 +635,29 @@ async def manager_open_request(callback: CallbackQuery):
 #   Изменение статуса заявки
 # ==========================
 
+# Куда менеджер переводит заявку из карточки /manager
+MANAGER_TARGET_STATUSES = ("accepted", "in_progress", "completed", "rejected")
+# Из каких статусов (завершённые/отклонённые не трогаем)
+MANAGER_SOURCE_STATUSES = ("new", "offer_sent", "accepted_by_client", "accepted", "in_progress", "cancelled")
+
+
 @router.callback_query(F.data.startswith("manager_set_status:"))
-async def manager_set_status(callback: CallbackQuery):
+async def manager_set_status(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    identity: Identity,
+):
     """
     Менеджер меняет статус заявки из карточки /manager.
 
     Формат callback_data:
         manager_set_status:<status>:<request_id>
+
+    Смена статуса и постановка уведомлений в outbox идут одной транзакцией
+    в сессии апдейта (DbSessionMiddleware), права берутся из identity без
+    запроса в БД. В Telegram до ответа на нажатие ничего не отправляется.
     """
-    if not await is_manager(callback.from_user.id):
+    if not identity.is_manager:
         await callback.answer("❌ Нет доступа", show_alert=True)
         return
 
@@ -662,137 +668,101 @@ async def manager_set_status(callback: CallbackQuery):
         await callback.answer("Некорректные данные", show_alert=True)
         return
 
-    # СТО менеджера (или None для админа)
-    sc_id = await get_manager_sc_id(callback.from_user.id)
+    if status not in MANAGER_TARGET_STATUSES:
+        await callback.answer("Неизвестный статус", show_alert=True)
+        return
 
-    # 1. Обновляем статус заявки
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request).where(Request.id == request_id)
-        )
-        req = result.scalar_one_or_none()
+    # СТО менеджера (или None для админа)
+    sc_id = identity.manager_sc_id
+
+    # 1. Смена статуса — один условный UPDATE ... RETURNING: принадлежность СТО
+    #    и допустимый исходный статус проверяются в WHERE, повторное нажатие
+    #    ничего не меняет
+    req = await request_state.transition(
+        session,
+        request_id,
+        status,
+        allowed=[source for source in MANAGER_SOURCE_STATUSES if source != status],
+        where=[Request.service_center_id == sc_id] if sc_id is not None else [],
+        keep_timestamp=True,
+    )
 
-        if not req:
+    if req is None:
+        # Редкий путь: выясняем, почему переход не прошёл
+        current = (
+            await session.execute(
+                select(Request.service_center_id, Request.status).where(Request.id == request_id)
+            )
+        ).first()
+        if current is None:
             await callback.answer("Заявка не найдена", show_alert=True)
-            return
-
-        # Проверяем принадлежность заявки текущему сервису
-        if sc_id is not None and req.service_center_id != sc_id:
+        elif sc_id is not None and current.service_center_id != sc_id:
             await callback.answer("❌ У вас нет прав изменять эту заявку.", show_alert=True)
-            return
-
-        # Не трогаем завершённые/отклонённые
-        if req.status in ("completed", "rejected"):
+        elif current.status in ("completed", "rejected"):
             await callback.answer("Заявка уже завершена/отклонена.", show_alert=True)
-            return
-
-        now = datetime.now()
-
-        # Применяем переходы
-        if status == "accepted":
-            req.status = "accepted"
-            if not req.accepted_at:
-                req.accepted_at = now
-
-        elif status == "in_progress":
-            req.status = "in_progress"
-            if not req.in_progress_at:
-                req.in_progress_at = now
-
-        elif status == "completed":
-            req.status = "completed"
-            if not req.completed_at:
-                req.completed_at = now
-
-        elif status == "rejected":
-            req.status = "rejected"
-            if not req.rejected_at:
-                req.rejected_at = now
         else:
-            await callback.answer("Неизвестный статус", show_alert=True)
-            return
-
-        await session.commit()
-
-    # 2. Ещё раз читаем заявку вместе с пользователем и машиной
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request, User, Car)
-            .join(User, Request.user_id == User.id)
-            .join(Car, Request.car_id == Car.id, isouter=True)
-            .where(Request.id == request_id)
-        )
-        row = result.first()
-
-    if not row:
-        await callback.answer(
-            "Заявка обновлена, но загрузить карточку не удалось.", show_alert=True
-        )
+            await callback.answer("Статус заявки уже изменён.", show_alert=True)
         return
 
-    req, user, car = row
+    # 2. Клиент и машина — для уведомления и карточки
+    result = await session.execute(
+        select(User, Car)
+        .outerjoin(Car, Car.id == req.car_id)
+        .where(User.id == req.user_id)
+    )
+    user, car = result.one()
 
-    # 3. Уведомляем клиента о смене статуса
+    # 3. Уведомление клиенту и клавиатура в чате сервиса — через outbox, в той же
+    #    транзакции: доставит диспетчер после коммита, ответ на нажатие не ждёт Telegram
+    client_text: Optional[str] = None
     reply_markup = None
-    try:
-        client_text: Optional[str] = None
 
-        if req.status == "accepted":
-            client_text = (
-                f"✅ Ваша заявка #{req.id} принята автосервисом.\n"
-                f"Скоро с вами свяжутся для уточнения деталей."
-            )
-        elif req.status == "in_progress":
-            client_text = (
-                f"⚙️ Ваша заявка #{req.id} сейчас в работе.\n"
-                f"Автосервис выполняет согласованные работы."
-            )
-        elif req.status == "completed":
-            client_text = (
-                f"🏁 Работы по вашей заявке #{req.id} завершены.\n"
-                f"Пожалуйста, оцените работу сервиса по шкале от 1 до 5."
-            )
-            # 👇 При завершении добавляем клавиатуру оценки
-            reply_markup = get_rating_kb(req.id)
-        elif req.status == "rejected":
-            client_text = (
-                f"❌ К сожалению, автосервис отклонил вашу заявку #{req.id}.\n"
-                f"Вы можете создать новую заявку или выбрать другой сервис."
-            )
-
-        if client_text and user.telegram_id:
-            await callback.bot.send_message(
-                chat_id=user.telegram_id,
-                text=client_text,
-                reply_markup=reply_markup,
-            )
-    except Exception as e:
-        logging.error(
-            f"❌ Не удалось отправить уведомление клиенту по заявке #{request_id}: {e}"
+    if req.status == "accepted":
+        client_text = (
+            f"✅ Ваша заявка #{req.id} принята автосервисом.\n"
+            f"Скоро с вами свяжутся для уточнения деталей."
+        )
+    elif req.status == "in_progress":
+        client_text = (
+            f"⚙️ Ваша заявка #{req.id} сейчас в работе.\n"
+            f"Автосервис выполняет согласованные работы."
         )
+    elif req.status == "completed":
+        client_text = (
+            f"🏁 Работы по вашей заявке #{req.id} завершены.\n"
+            f"Пожалуйста, оцените работу сервиса по шкале от 1 до 5."
+        )
+        # 👇 При завершении добавляем клавиатуру оценки
+        reply_markup = get_rating_kb(req.id)
+    elif req.status == "rejected":
+        client_text = (
+            f"❌ К сожалению, автосервис отклонил вашу заявку #{req.id}.\n"
+            f"Вы можете создать новую заявку или выбрать другой сервис."
+        )
+
+    if client_text and user.telegram_id:
+        outbox.enqueue_message(session, user.telegram_id, client_text, reply_markup=reply_markup)
+    outbox.enqueue_chat_keyboard(session, request_id)
+
+    await session.commit()
+    await callback.answer("Статус заявки обновлён.")
 
     # 4. Обновляем карточку в /manager
-    text = _format_request_full(req, user, car)
-    kb = _get_request_actions_kb(req)
+    text, markup = _render_request_card(req, user, car)
 
     try:
-        await callback.message.edit_text(
+        await card_sync.edit_text(
+            callback.bot,
+            callback.message.chat.id,
+            callback.message.message_id,
             text,
-            reply_markup=kb.as_markup() if kb.buttons else None,
+            reply_markup=markup,
         )
     except Exception as e:
         logging.error(
             f"❌ Не удалось обновить сообщение менеджера по заявке #{request_id}: {e}"
         )
 
-    # 5. Синхронизируем основную карточку в чате сервиса
-    try:
-        await update_chat_keyboard(callback.bot, request_id)
-    except Exception as e:
-        logging.error(f"❌ Не удалось обновить чат заявки #{request_id}: {e}")
-
-    await callback.answer("Статус заявки обновлён.")
-
 
 def _format_specializations_human(specializations: str | None) -> str:
     """
@@ -1111,39 +1081,39 @@ async def manager_settings_location(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(ServiceSettingsStates.waiting_location, F.location)
-async def service_settings_set_location_geo(message: Message, state: FSMContext):
+async def service_settings_set_location_geo(message: Message, state: FSMContext, session: AsyncSession):
     loc = message.location
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter)
-            .join(User, ServiceCenter.owner_user_id == User.id)
-            .where(User.telegram_id == message.from_user.id)
-        )
-        sc: ServiceCenter | None = result.scalar_one_or_none()
+    result = await session.execute(
+        select(ServiceCenter)
+        .join(User, ServiceCenter.owner_user_id == User.id)
+        .where(User.telegram_id == message.from_user.id)
+    )
+    sc: ServiceCenter | None = result.scalar_one_or_none()
 
-        if not sc:
-            await state.clear()
-            await message.answer("❌ Автосервис не найден. Попробуйте /start.")
-            return
+    if not sc:
+        await state.clear()
+        await message.answer("❌ Автосервис не найден. Попробуйте /start.")
+        return
 
-        sc.location_lat = loc.latitude
-        sc.location_lon = loc.longitude
+    sc.location_lat = loc.latitude
+    sc.location_lon = loc.longitude
 
-        try:
-            await session.commit()
-            await message.answer(
-                f"✅ Геолокация обновлена: {loc.latitude:.5f}, {loc.longitude:.5f}"
-            )
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"[settings] Ошибка сохранения геолокации СТО: {e}")
-            await message.answer("❌ Не удалось сохранить геолокацию. Попробуйте позже.")
+    try:
+        await session.commit()
+        await geo_search.sync_service_center(sc)
+        await message.answer(
+            f"✅ Геолокация обновлена: {loc.latitude:.5f}, {loc.longitude:.5f}"
+        )
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"[settings] Ошибка сохранения геолокации СТО: {e}")
+        await message.answer("❌ Не удалось сохранить геолокацию. Попробуйте позже.")
 
     await state.clear()
 
 @router.message(ServiceSettingsStates.waiting_location)
-async def service_settings_set_location_text(message: Message, state: FSMContext):
+async def service_settings_set_location_text(message: Message, state: FSMContext, session: AsyncSession):
     text = (message.text or "").strip().lower()
 
     if text in ("отмена", "cancel"):
@@ -1151,36 +1121,36 @@ async def service_settings_set_location_text(message: Message, state: FSMContext
         await message.answer("❌ Изменение геолокации отменено.")
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter)
-            .join(User, ServiceCenter.owner_user_id == User.id)
-            .where(User.telegram_id == message.from_user.id)
-        )
-        sc: ServiceCenter | None = result.scalar_one_or_none()
+    result = await session.execute(
+        select(ServiceCenter)
+        .join(User, ServiceCenter.owner_user_id == User.id)
+        .where(User.telegram_id == message.from_user.id)
+    )
+    sc: ServiceCenter | None = result.scalar_one_or_none()
 
-        if not sc:
-            await state.clear()
-            await message.answer("❌ Автосервис не найден. Попробуйте /start.")
-            return
+    if not sc:
+        await state.clear()
+        await message.answer("❌ Автосервис не найден. Попробуйте /start.")
+        return
 
-        if text in ("удалить", "очистить", "delete", "clear"):
-            sc.location_lat = None
-            sc.location_lon = None
-
-            try:
-                await session.commit()
-                await message.answer("✅ Геолокация автосервиса очищена.")
-            except Exception as e:
-                await session.rollback()
-                logging.error(f"[settings] Ошибка очистки геолокации СТО: {e}")
-                await message.answer("❌ Не удалось очистить геолокацию. Попробуйте позже.")
-        else:
-            await message.answer(
-                "❌ Не понял ответ.\n"
-                "Отправьте геолокацию через кнопку или напишите «удалить» / «отмена».",
-            )
-            return
+    if text in ("удалить", "очистить", "delete", "clear"):
+        sc.location_lat = None
+        sc.location_lon = None
+
+        try:
+            await session.commit()
+            await geo_search.sync_service_center(sc)
+            await message.answer("✅ Геолокация автосервиса очищена.")
+        except Exception as e:
+            await session.rollback()
+            logging.error(f"[settings] Ошибка очистки геолокации СТО: {e}")
+            await message.answer("❌ Не удалось очистить геолокацию. Попробуйте позже.")
+    else:
+        await message.answer(
+            "❌ Не понял ответ.\n"
+            "Отправьте геолокацию через кнопку или напишите «удалить» / «отмена».",
+        )
+        return
 
     await state.clear()
 
@@ -1226,46 +1196,47 @@ async def manager_settings_specs(callback: CallbackQuery, state: FSMContext):
     ServiceSettingsStates.waiting_specializations,
     F.data.startswith("spec_toggle:"),
 )
-async def settings_toggle_specialization(callback: CallbackQuery, state: FSMContext):
+async def settings_toggle_specialization(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     code = callback.data.split(":", 1)[1]
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter)
-            .join(User, ServiceCenter.owner_user_id == User.id)
-            .where(User.telegram_id == callback.from_user.id)
-        )
-        sc: ServiceCenter | None = result.scalar_one_or_none()
+    result = await session.execute(
+        select(ServiceCenter)
+        .join(User, ServiceCenter.owner_user_id == User.id)
+        .where(User.telegram_id == callback.from_user.id)
+    )
+    sc: ServiceCenter | None = result.scalar_one_or_none()
 
-        if not sc:
-            await state.clear()
-            await callback.message.edit_text("❌ Автосервис не найден. Попробуйте /start.")
-            await callback.answer()
-            return
+    if not sc:
+        await state.clear()
+        await callback.message.edit_text("❌ Автосервис не найден. Попробуйте /start.")
+        await callback.answer()
+        return
 
-        if sc.specializations:
-            selected = {c.strip() for c in sc.specializations.split(",") if c.strip()}
-        else:
-            selected = set()
+    if sc.specializations:
+        selected = {c.strip() for c in sc.specializations.split(",") if c.strip()}
+    else:
+        selected = set()
 
-        if code in selected:
-            selected.remove(code)
-        else:
-            selected.add(code)
+    if code in selected:
+        selected.remove(code)
+    else:
+        selected.add(code)
 
-        sc.specializations = ",".join(sorted(selected)) if selected else None
+    await set_service_specializations(session, sc, selected)
 
-        try:
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"[settings] Ошибка смены специализаций СТО: {e}")
-            await callback.answer("❌ Не удалось сохранить, попробуйте позже.", show_alert=True)
-            return
+    try:
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"[settings] Ошибка смены специализаций СТО: {e}")
+        await callback.answer("❌ Не удалось сохранить, попробуйте позже.", show_alert=True)
+        return
 
-        kb = get_service_specializations_kb(selected)
-        await callback.message.edit_reply_markup(reply_markup=kb)
-        await callback.answer()
+    await geo_search.sync_service_center(sc)
+
+    kb = get_service_specializations_kb(selected)
+    await callback.message.edit_reply_markup(reply_markup=kb)
+    await callback.answer()
 
 
 @router.callback_query(
@@ -1283,32 +1254,33 @@ async def settings_specs_done(callback: CallbackQuery, state: FSMContext):
     ServiceSettingsStates.waiting_specializations,
     F.data == "spec_skip",
 )
-async def settings_specs_skip(callback: CallbackQuery, state: FSMContext):
+async def settings_specs_skip(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """
     Очищаем специализации — считаем сервис универсальным.
     """
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter)
-            .join(User, ServiceCenter.owner_user_id == User.id)
-            .where(User.telegram_id == callback.from_user.id)
-        )
-        sc: ServiceCenter | None = result.scalar_one_or_none()
+    result = await session.execute(
+        select(ServiceCenter)
+        .join(User, ServiceCenter.owner_user_id == User.id)
+        .where(User.telegram_id == callback.from_user.id)
+    )
+    sc: ServiceCenter | None = result.scalar_one_or_none()
 
-        if not sc:
-            await state.clear()
-            await callback.message.edit_text("❌ Автосервис не найден. Попробуйте /start.")
-            await callback.answer()
-            return
+    if not sc:
+        await state.clear()
+        await callback.message.edit_text("❌ Автосервис не найден. Попробуйте /start.")
+        await callback.answer()
+        return
 
-        sc.specializations = None
-        try:
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"[settings] Ошибка сброса специализаций СТО: {e}")
-            await callback.answer("❌ Не удалось сохранить, попробуйте позже.", show_alert=True)
-            return
+    await set_service_specializations(session, sc, None)
+    try:
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"[settings] Ошибка сброса специализаций СТО: {e}")
+        await callback.answer("❌ Не удалось сохранить, попробуйте позже.", show_alert=True)
+        return
+
+    await geo_search.sync_service_center(sc)
 
     try:
         await callback.message.edit_reply_markup(reply_markup=None)
@@ -1342,47 +1314,47 @@ async def manager_settings_notify(callback: CallbackQuery, state: FSMContext):
     ServiceSettingsStates.waiting_notifications,
     F.data.in_(["sc_notif_owner", "sc_notif_group"]),
 )
-async def settings_choose_notifications(callback: CallbackQuery, state: FSMContext):
+async def settings_choose_notifications(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     choice = callback.data
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter)
-            .join(User, ServiceCenter.owner_user_id == User.id)
-            .where(User.telegram_id == callback.from_user.id)
-        )
-        sc: ServiceCenter | None = result.scalar_one_or_none()
+    result = await session.execute(
+        select(ServiceCenter)
+        .join(User, ServiceCenter.owner_user_id == User.id)
+        .where(User.telegram_id == callback.from_user.id)
+    )
+    sc: ServiceCenter | None = result.scalar_one_or_none()
 
-        if not sc:
-            await state.clear()
-            await callback.message.edit_text("❌ Автосервис не найден. Попробуйте /start.")
-            await callback.answer()
-            return
+    if not sc:
+        await state.clear()
+        await callback.message.edit_text("❌ Автосервис не найден. Попробуйте /start.")
+        await callback.answer()
+        return
 
-        if choice == "sc_notif_owner":
-            sc.send_to_owner = True
-            sc.send_to_group = False
-            sc.manager_chat_id = None
-            text = (
-                "✅ Заявки будут приходить <b>в личные сообщения</b> владельцу этого аккаунта."
-            )
-        else:
-            # sc_notif_group
-            sc.send_to_owner = False
-            sc.send_to_group = True
-            # manager_chat_id должен быть выставлен командой /bind_group
-            text = (
-                "✅ Заявки будут отправляться <b>в привязанную группу</b>.\n\n"
-                "Убедитесь, что вы привязали группу командой /bind_group из этой группы."
-            )
+    if choice == "sc_notif_owner":
+        sc.send_to_owner = True
+        sc.send_to_group = False
+        sc.manager_chat_id = None
+        text = (
+            "✅ Заявки будут приходить <b>в личные сообщения</b> владельцу этого аккаунта."
+        )
+    else:
+        # sc_notif_group
+        sc.send_to_owner = False
+        sc.send_to_group = True
+        # manager_chat_id должен быть выставлен командой /bind_group
+        text = (
+            "✅ Заявки будут отправляться <b>в привязанную группу</b>.\n\n"
+            "Убедитесь, что вы привязали группу командой /bind_group из этой группы."
+        )
 
-        try:
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"[settings] Ошибка смены уведомлений СТО: {e}")
-            await callback.answer("❌ Не удалось сохранить настройки, попробуйте позже.", show_alert=True)
-            return
+    try:
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"[settings] Ошибка смены уведомлений СТО: {e}")
+        await callback.answer("❌ Не удалось сохранить настройки, попробуйте позже.", show_alert=True)
+        return
+    service_routing.invalidate(sc.id)
 
     await state.clear()
     await callback.message.edit_text(text, parse_mode="HTML")
@@ -1393,23 +1365,14 @@ async def settings_choose_notifications(callback: CallbackQuery, state: FSMConte
 #   Вспомогалка: СТО менеджера
 # ==========================
 
-async def get_manager_sc_id(user_id: int) -> Optional[int]:
+async def get_manager_sc_id(
+    user_id: int,
+    session: Optional[AsyncSession] = None,
+) -> Optional[int]:
     """
     Возвращает id ServiceCenter, к которому относится менеджер.
 
     - Если это админ (ADMIN_USER_IDS) — возвращаем None (видит все заявки).
     - Если пользователь — владелец сервиса, вернём id этого сервиса.
     """
-    # Админы видят все заявки, без привязки к конкретному СТО
-    if user_id in config.ADMIN_USER_IDS:
-        return None
-
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter).join(
-                User, ServiceCenter.owner_user_id == User.id
-            ).where(User.telegram_id == user_id)
-        )
-        sc = result.scalar_one_or_none()
-
-    return sc.id if sc else None
+    return (await identity_service.resolve(user_id, session=session)).manager_sc_id
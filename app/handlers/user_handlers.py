@@ -15,18 +15,19 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from datetime import datetime
-from math import radians, sin, cos, sqrt, atan2
+from typing import Optional
 import logging
 
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.services.notification_service import notify_manager_about_new_request
 from app.services.bonus_service import add_bonus, get_user_balance
 from app.database.models import User, Car, Request, ServiceCenter
-from app.database.comment_models import Comment
 from app.database.db import AsyncSessionLocal
-from app.services.chat_service import update_chat_keyboard
+from app.services import auto_decline, geo_search, matching, outbox, rating_service, request_state, service_routing
+from app.services import identity as identity_service
+from app.services.pagination import NEXT, PREV, fetch_request_page, page_callback, parse_page_args
+from app.services.specializations import set_service_specializations
 from app.keyboards.main_kb import (
     get_main_kb, get_registration_kb,
     get_phone_reply_kb, get_garage_kb,
@@ -120,6 +121,9 @@ class ServiceSearchStates(StatesGroup):
 
 router = Router()
 
+# Сколько СТО максимум показываем в списке выбора сервиса
+SERVICE_LIST_LIMIT = 20
+
 
 @router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
@@ -282,37 +286,45 @@ async def cmd_reset_profile(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data == "reset_profile_full")
-async def reset_profile_full(callback: CallbackQuery, state: FSMContext):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+async def reset_profile_full(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    result = await session.execute(
+        select(User).where(User.telegram_id == callback.from_user.id)
+    )
+    user = result.scalar_one_or_none()
 
-        if not user:
-            await callback.answer("❌ Профиль не найден. Нажмите /start.", show_alert=True)
-            return
+    if not user:
+        await callback.answer("❌ Профиль не найден. Нажмите /start.", show_alert=True)
+        return
 
-        # Сбрасываем ключевые поля профиля,
-        # но НЕ трогаем бонусы, авто и заявки
-        user.phone_number = None
+    # Сбрасываем ключевые поля профиля,
+    # но НЕ трогаем бонусы, авто и заявки
+    user.phone_number = None
 
-        # ВАЖНО: не ставим None в поле с NOT NULL
-        # Превращаем любого в клиента
-        user.role = "client"
+    # ВАЖНО: не ставим None в поле с NOT NULL
+    # Превращаем любого в клиента
+    user.role = "client"
 
-        user.service_name = None
-        user.service_address = None
+    user.service_name = None
+    user.service_address = None
 
-        # Если был владельцем СТО — отвяжем, но не удаляем сам сервис
-        sc_result = await session.execute(
-            select(ServiceCenter).where(ServiceCenter.owner_user_id == user.id)
-        )
-        service_center = sc_result.scalar_one_or_none()
-        if service_center:
-            service_center.owner_user_id = None
+    # Если был владельцем СТО — отвяжем, но не удаляем сам сервис
+    sc_result = await session.execute(
+        select(ServiceCenter).where(ServiceCenter.owner_user_id == user.id)
+    )
+    service_center = sc_result.scalar_one_or_none()
+    if service_center:
+        service_center.owner_user_id = None
 
-        await session.commit()
+    await session.commit()
+
+    if service_center:
+        # Владелец отвязан — его ЛС больше не канал доставки
+        service_routing.invalidate(service_center.id)
+        await session.refresh(service_center)
+        await geo_search.sync_service_center(service_center)
+
+    # Роль сменилась и СТО отвязан — кэшированная identity устарела
+    await identity_service.invalidate(callback.from_user.id)
 
     await state.clear()
     await callback.message.edit_text(
@@ -404,7 +416,7 @@ async def back_to_main(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "service_centers_list")
-async def service_centers_list(callback: CallbackQuery, state: FSMContext):
+async def service_centers_list(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """
     Показать пользователю список доступных автосервисов.
     Показываем только активные СТО (есть владелец),
@@ -412,11 +424,13 @@ async def service_centers_list(callback: CallbackQuery, state: FSMContext):
     """
     await state.clear()
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter).where(ServiceCenter.owner_user_id.isnot(None))
-        )
-        services = result.scalars().all()
+    # Лучшие по байесовскому рейтингу сверху (индекс ix_service_centers_rating_sort)
+    result = await session.execute(
+        select(ServiceCenter)
+        .where(ServiceCenter.owner_user_id.isnot(None))
+        .order_by(ServiceCenter.rating_sort.desc(), ServiceCenter.id.desc())
+    )
+    services = result.scalars().all()
 
     if not services:
         await callback.message.edit_text(
@@ -774,7 +788,7 @@ async def skip_service_specializations(callback: CallbackQuery, state: FSMContex
 
 
 @router.message(Registration.phone)
-async def process_phone_registration(message: Message, state: FSMContext):
+async def process_phone_registration(message: Message, state: FSMContext, session: AsyncSession):
     """
     Завершение шага регистрации:
     - получаем телефон (контакт),
@@ -809,107 +823,109 @@ async def process_phone_registration(message: Message, state: FSMContext):
     service_location_lat = data.get("service_location_lat")
     service_location_lon = data.get("service_location_lon")
 
-    async with AsyncSessionLocal() as session:
-        try:
-            # --- 1. Находим или создаём пользователя ---
-            result = await session.execute(
-                select(User).where(User.telegram_id == message.from_user.id)
-            )
-            user: User | None = result.scalar_one_or_none()
-            is_new_user = user is None
-
-            if user:
-                # Обновляем существующего
-                user.full_name = name
-                user.phone_number = phone_number
-                user.role = role
-                if role == "service":
-                    user.service_name = service_name or name
-                    user.service_address = service_address
-                else:
-                    user.service_name = None
-                    user.service_address = None
-            else:
-                # Создаём нового
-                user = User(
-                    telegram_id=message.from_user.id,
-                    full_name=name,
-                    phone_number=phone_number,
-                    role=role,
-                    service_name=service_name if role == "service" else None,
-                    service_address=service_address if role == "service" else None,
-                )
-                session.add(user)
-
-            service_center_id: int | None = None
-
-            # --- 2. Если это автосервис — создаём/обновляем ServiceCenter ---
+    try:
+        # --- 1. Находим или создаём пользователя ---
+        result = await session.execute(
+            select(User).where(User.telegram_id == message.from_user.id)
+        )
+        user: User | None = result.scalar_one_or_none()
+        is_new_user = user is None
+
+        if user:
+            # Обновляем существующего
+            user.full_name = name
+            user.phone_number = phone_number
+            user.role = role
             if role == "service":
-                sc_result = await session.execute(
-                    select(ServiceCenter).where(ServiceCenter.owner_user_id == user.id)
-                )
-                service_center: ServiceCenter | None = sc_result.scalar_one_or_none()
+                user.service_name = service_name or name
+                user.service_address = service_address
+            else:
+                user.service_name = None
+                user.service_address = None
+        else:
+            # Создаём нового
+            user = User(
+                telegram_id=message.from_user.id,
+                full_name=name,
+                phone_number=phone_number,
+                role=role,
+                service_name=service_name if role == "service" else None,
+                service_address=service_address if role == "service" else None,
+            )
+            session.add(user)
 
-                if not service_center:
-                    service_center = ServiceCenter(
-                        name=user.service_name or user.full_name,
-                        address=user.service_address,
-                        phone=user.phone_number,
-                        owner_user_id=user.id,
-                        location_lat=service_location_lat,
-                        location_lon=service_location_lon,
-                        send_to_owner=True,
-                        send_to_group=False,
-                        manager_chat_id=None,
-                    )
-                    session.add(service_center)
-                else:
-                    service_center.name = user.service_name or user.full_name
-                    service_center.address = user.service_address
-                    service_center.phone = user.phone_number
-
-                    if (
-                        service_location_lat is not None
-                        and service_location_lon is not None
-                    ):
-                        service_center.location_lat = service_location_lat
-                        service_center.location_lon = service_location_lon
-
-                # Специализации сервиса
-                if service_specializations is not None:
-                    if service_specializations:
-                        service_center.specializations = ",".join(service_specializations)
-                    else:
-                        service_center.specializations = None
-
-            # --- 3. Один общий коммит ---
-            await session.commit()
+        service_center_id: int | None = None
 
-            # Обновляем объекты в памяти
-            await session.refresh(user)
-            if role == "service":
-                await session.refresh(service_center)
-                service_center_id = service_center.id
-                logging.info(
-                    f"✅ Зарегистрирован/обновлён автосервис для пользователя {message.from_user.id} "
-                    f"(ServiceCenter id={service_center.id}, "
-                    f"specializations={service_center.specializations!r}, "
-                    f"location=({service_center.location_lat}, {service_center.location_lon}))"
+        # --- 2. Если это автосервис — создаём/обновляем ServiceCenter ---
+        if role == "service":
+            sc_result = await session.execute(
+                select(ServiceCenter).where(ServiceCenter.owner_user_id == user.id)
+            )
+            service_center: ServiceCenter | None = sc_result.scalar_one_or_none()
+
+            if not service_center:
+                service_center = ServiceCenter(
+                    name=user.service_name or user.full_name,
+                    address=user.service_address,
+                    phone=user.phone_number,
+                    owner_user_id=user.id,
+                    location_lat=service_location_lat,
+                    location_lon=service_location_lon,
+                    send_to_owner=True,
+                    send_to_group=False,
+                    manager_chat_id=None,
                 )
+                session.add(service_center)
             else:
-                logging.info(
-                    f"✅ Пользователь {message.from_user.id} зарегистрирован/обновлён как клиент "
-                    f"(role={role}, phone={phone_number})"
+                service_center.name = user.service_name or user.full_name
+                service_center.address = user.service_address
+                service_center.phone = user.phone_number
+
+                if (
+                    service_location_lat is not None
+                    and service_location_lon is not None
+                ):
+                    service_center.location_lat = service_location_lat
+                    service_center.location_lon = service_location_lon
+
+            # Специализации сервиса
+            if service_specializations is not None:
+                await set_service_specializations(
+                    session, service_center, service_specializations
                 )
 
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"❌ Ошибка при сохранении регистрации: {e}")
-            await message.answer(
-                "❌ Произошла ошибка при сохранении данных. Попробуйте позже.",
+        # --- 3. Один общий коммит ---
+        await session.commit()
+
+        # Обновляем объекты в памяти
+        await session.refresh(user)
+        if role == "service":
+            await session.refresh(service_center)
+            service_center_id = service_center.id
+            await geo_search.sync_service_center(service_center)
+            logging.info(
+                f"✅ Зарегистрирован/обновлён автосервис для пользователя {message.from_user.id} "
+                f"(ServiceCenter id={service_center.id}, "
+                f"specializations={service_center.specializations!r}, "
+                f"location=({service_center.location_lat}, {service_center.location_lon}))"
+            )
+        else:
+            logging.info(
+                f"✅ Пользователь {message.from_user.id} зарегистрирован/обновлён как клиент "
+                f"(role={role}, phone={phone_number})"
             )
-            await state.clear()
-            return
+
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"❌ Ошибка при сохранении регистрации: {e}")
+        await message.answer(
+            "❌ Произошла ошибка при сохранении данных. Попробуйте позже.",
+        )
+        await state.clear()
+        return
+
+    # Новая роль / СТО — сбрасываем кэш identity (в нём мог быть "не зарегистрирован")
+    await identity_service.invalidate(message.from_user.id)
 
     # Сохраняем id в FSM (на всякий случай)
     await state.update_data(user_id=user.id, service_center_id=service_center_id)
@@ -1086,6 +1102,7 @@ async def registration_choose_notifications(callback: CallbackQuery, state: FSMC
             service_center.send_to_group = False
             service_center.manager_chat_id = None
             await session.commit()
+            service_routing.invalidate(service_center.id)
 
             await state.clear()
 
@@ -1119,6 +1136,7 @@ async def registration_choose_notifications(callback: CallbackQuery, state: FSMC
         service_center.send_to_group = True
         service_center.manager_chat_id = None
         await session.commit()
+        service_routing.invalidate(service_center.id)
 
     await state.clear()
 
@@ -1145,7 +1163,7 @@ async def registration_choose_notifications(callback: CallbackQuery, state: FSMC
 
 
 @router.message(Registration.group_chat)
-async def registration_bind_group_chat(message: Message, state: FSMContext):
+async def registration_bind_group_chat(message: Message, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
     service_center_id = data.get("service_center_id")
     send_to_owner_also = data.get("send_to_owner_also", False)
@@ -1179,27 +1197,27 @@ async def registration_bind_group_chat(message: Message, state: FSMContext):
 
     group_chat_id = fwd_chat.id
 
-    async with AsyncSessionLocal() as session:
-        from app.database.models import ServiceCenter  # на случай локального импорта
+    from app.database.models import ServiceCenter  # на случай локального импорта
 
-        result = await session.execute(
-            select(ServiceCenter).where(ServiceCenter.id == service_center_id)
-        )
-        service_center = result.scalar_one_or_none()
+    result = await session.execute(
+        select(ServiceCenter).where(ServiceCenter.id == service_center_id)
+    )
+    service_center = result.scalar_one_or_none()
 
-        if not service_center:
-            await state.clear()
-            await message.answer(
-                "❌ Профиль автосервиса не найден. Попробуйте /start ещё раз.",
-                reply_markup=ReplyKeyboardRemove(),
-            )
-            return
+    if not service_center:
+        await state.clear()
+        await message.answer(
+            "❌ Профиль автосервиса не найден. Попробуйте /start ещё раз.",
+            reply_markup=ReplyKeyboardRemove(),
+        )
+        return
 
-        service_center.manager_chat_id = group_chat_id
-        service_center.send_to_group = True
-        service_center.send_to_owner = bool(send_to_owner_also)
+    service_center.manager_chat_id = group_chat_id
+    service_center.send_to_group = True
+    service_center.send_to_owner = bool(send_to_owner_also)
 
-        await session.commit()
+    await session.commit()
+    service_routing.invalidate(service_center.id)
 
     await state.clear()
 
@@ -2265,28 +2283,15 @@ async def _ask_service_center_for_request(callback: CallbackQuery, state: FSMCon
     category_code = data.get("category_code")
     can_drive = data.get("can_drive")  # может пригодиться дальше
 
-    async with AsyncSessionLocal() as session:
-        # Базовый запрос: только активные СТО (есть владелец)
-        base_query = select(ServiceCenter).where(ServiceCenter.owner_user_id.isnot(None))
-
-        if category_code:
-            # Сервисы, у которых либо:
-            # - есть специализации и среди них есть наш category_code
-            # - либо специализации нет (универсальный сервис)
-            spec_like = f"%{category_code}%"
-            base_query = base_query.where(
-                (ServiceCenter.specializations.ilike(spec_like))
-                | (ServiceCenter.specializations.is_(None))
-            )
-
-        # Упорядочим по рейтингу (сначала самые высокие), потом по id
-        base_query = base_query.order_by(
-            ServiceCenter.rating.desc().nullslast(),
-            ServiceCenter.id.desc(),
-        )
-
-        result = await session.execute(base_query)
-        services = result.scalars().all()
+    # Подходящие активные СТО (универсальные или с нужной специализацией),
+    # лучшие по рейтингу / загрузке / расстоянию (если гео авто уже известно) — сверху
+    matched = await matching.match_service_centers(
+        lat=data.get("location_lat"),
+        lon=data.get("location_lon"),
+        category_code=category_code,
+        limit=SERVICE_LIST_LIMIT,
+    )
+    services = [sc for sc, _ in matched]
 
     # Если подходящих нет — позволяем создать заявку без привязки к СТО
     if not services:
@@ -2460,31 +2465,14 @@ async def request_nearest_location(message: Message, state: FSMContext):
     radius_km = float(data.get("nearest_radius_km", 10))
     category_code = data.get("category_code")
 
-    async with AsyncSessionLocal() as session:
-        # Берём только "живые" сервисы, у которых есть владелец и координаты
-        query = select(ServiceCenter).where(
-            ServiceCenter.owner_user_id.isnot(None),
-            ServiceCenter.location_lat.is_not(None),
-            ServiceCenter.location_lon.is_not(None),
-        )
-
-        if category_code:
-            spec_like = f"%{category_code}%"
-            query = query.where(
-                (ServiceCenter.specializations.ilike(spec_like))
-                | (ServiceCenter.specializations.is_(None))
-            )
-
-        result = await session.execute(query)
-        services = result.scalars().all()
-
-    nearby: list[tuple[ServiceCenter, float]] = []
-    for sc in services:
-        dist = _haversine_km(user_lat, user_lon, sc.location_lat, sc.location_lon)
-        if dist <= radius_km:
-            nearby.append((sc, dist))
-
-    nearby.sort(key=lambda x: x[1])
+    # Берём только "живые" сервисы с координатами в радиусе, лучшие — сверху
+    nearby = await matching.match_service_centers(
+        user_lat,
+        user_lon,
+        category_code=category_code,
+        radius_km=radius_km,
+        limit=SERVICE_LIST_LIMIT,
+    )
 
     # Убираем реплай-клавиатуру с гео
     await message.answer("Спасибо, локация получена ✅", reply_markup=ReplyKeyboardRemove())
@@ -2949,10 +2937,11 @@ async def process_can_drive(callback: CallbackQuery, state: FSMContext):
 async def confirm_request(
     callback: CallbackQuery,
     state: FSMContext,
+    session: AsyncSession,
 ):
     """
     Клиент подтвердил заполненную заявку.
-    Здесь создаём Request в БД, отправляем уведомление сервису/менеджеру
+    Здесь создаём Request в БД, ставим карточку для сервиса в outbox
     и начисляем бонус за создание заявки.
     """
     await callback.answer()
@@ -2972,83 +2961,75 @@ async def confirm_request(
     can_drive = data.get("can_drive")
     preferred_date = data.get("preferred_date")
 
-    async with AsyncSessionLocal() as session:
-        # Находим пользователя в БД (он точно существует, т.к. регистрацию уже проходил)
-        result = await session.execute(
-            select(User).where(User.telegram_id == user_id)
+    # Находим пользователя в БД (он точно существует, т.к. регистрацию уже проходил)
+    result = await session.execute(
+        select(User).where(User.telegram_id == user_id)
+    )
+    db_user: User | None = result.scalar_one_or_none()
+    if not db_user:
+        # На всякий случай, если вдруг нет записи
+        db_user = User(
+            telegram_id=user_id,
+            full_name=callback.from_user.full_name,
         )
-        db_user: User | None = result.scalar_one_or_none()
-        if not db_user:
-            # На всякий случай, если вдруг нет записи
-            db_user = User(
-                telegram_id=user_id,
-                full_name=callback.from_user.full_name,
-            )
-            session.add(db_user)
-            await session.flush()
-
-        # На всякий случай проверим, что машина принадлежит этому пользователю
-        if car_id:
-            car_result = await session.execute(
-                select(Car).where(
-                    Car.id == car_id,
-                    Car.user_id == db_user.id,
-                )
-            )
-            car = car_result.scalar_one_or_none()
-            if not car:
-                car_id = None  # не нашли — не привязываем
+        session.add(db_user)
+        await session.flush()
 
-        new_request = Request(
-            user_id=db_user.id,
-            car_id=car_id,
-            service_center_id=service_center_id,
-            service_type=service_type,
-            category_code=category_code,
-            description=description,
-            photo_file_id=photo_file_id,
-            location_lat=location_lat,
-            location_lon=location_lon,
-            location_description=location_description,
-            can_drive=can_drive,
-            preferred_date=preferred_date,
-            status="new",
+    # На всякий случай проверим, что машина принадлежит этому пользователю
+    if car_id:
+        car_result = await session.execute(
+            select(Car).where(
+                Car.id == car_id,
+                Car.user_id == db_user.id,
+            )
         )
-        session.add(new_request)
-        await session.flush()  # чтобы получить new_request.id
+        car = car_result.scalar_one_or_none()
+        if not car:
+            car_id = None  # не нашли — не привязываем
+
+    new_request = Request(
+        user_id=db_user.id,
+        car_id=car_id,
+        service_center_id=service_center_id,
+        service_type=service_type,
+        category_code=category_code,
+        description=description,
+        photo_file_id=photo_file_id,
+        location_lat=location_lat,
+        location_lon=location_lon,
+        location_description=location_description,
+        can_drive=can_drive,
+        preferred_date=preferred_date,
+        status="new",
+    )
+    session.add(new_request)
+    await session.flush()  # чтобы получить new_request.id
 
-        request_id = new_request.id
+    request_id = new_request.id
 
-        # Бонус за создание заявки
-        try:
+    # Бонус за создание заявки
+    try:
+        # savepoint: сбой начисления не должен откатить саму заявку
+        async with session.begin_nested():
             await add_bonus(
-                session=session,
-                user=db_user,
-                action="new_request",
+                db_user.telegram_id,
+                "new_request",
                 description=f"Создание заявки #{request_id}",
+                session=session,
             )
-        except Exception as e:
-            logging.error(
-                "❌ Ошибка начисления бонусов за создание заявки #%s: %s",
-                request_id,
-                e,
-            )
-
-        await session.commit()
-
-    # Уведомляем менеджера/СТО о новой заявке (логика уже была реализована)
-    try:
-        await notify_manager_about_new_request(
-            bot=callback.bot,
-            request_id=request_id,
-        )
     except Exception as e:
         logging.error(
-            "❌ Ошибка при отправке уведомления менеджеру по заявке #%s: %s",
+            "❌ Ошибка начисления бонусов за создание заявки #%s: %s",
             request_id,
             e,
         )
 
+    # Карточка заявки в чат СТО — через outbox в той же транзакции:
+    # отправит диспетчер после коммита, клиент Telegram не ждёт
+    outbox.enqueue_request_card(session, request_id)
+
+    await session.commit()
+
     await state.clear()
     await callback.message.edit_text(
         "✅ Заявка отправлена.\n\n"
@@ -3264,21 +3245,27 @@ async def history_archived(callback: CallbackQuery, state: FSMContext):
 async def history_filter(callback: CallbackQuery, state: FSMContext):
     """
     Универсальный обработчик фильтров/страниц истории.
-    Формат callback_data: history_filter:<filter_key>:<page>
+    Формат callback_data: history_filter:<filter_key>:<page>[:<n|p>:<id заявки-курсора>]
     """
     if not callback.data:
         await callback.answer()
         return
 
     try:
-        _, filter_key, raw_page = callback.data.split(":")
-        page = int(raw_page)
+        _, filter_key, *page_args = callback.data.split(":")
+        page, direction, cursor_id = parse_page_args(page_args)
     except Exception:
         await callback.answer("Некорректные данные фильтра.", show_alert=True)
         return
 
     await state.clear()
-    await show_requests_list(callback, filter_key=filter_key, page=page)
+    await show_requests_list(
+        callback,
+        filter_key=filter_key,
+        page=page,
+        direction=direction,
+        cursor_id=cursor_id,
+    )
     await callback.answer()
 
 
@@ -3378,9 +3365,11 @@ async def show_requests_list(
     callback: CallbackQuery,
     filter_key: str = "all",
     page: int = 1,
+    direction: str = NEXT,
+    cursor_id: Optional[int] = None,
 ):
     """
-    Список заявок клиента с учётом фильтра и пагинации.
+    Список заявок клиента с учётом фильтра и keyset-пагинации.
 
     Используется хендлерами:
       - my_requests
@@ -3388,9 +3377,6 @@ async def show_requests_list(
       - history_archived
       - history_filter
     """
-    if page < 1:
-        page = 1
-
     # Проверяем фильтр
     if filter_key not in CLIENT_STATUS_FILTERS:
         filter_key = "all"
@@ -3400,32 +3386,42 @@ async def show_requests_list(
     async with AsyncSessionLocal() as session:
         # 1. Находим пользователя
         user_res = await session.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
+            select(User.id).where(User.telegram_id == callback.from_user.id)
         )
-        user = user_res.scalar_one_or_none()
+        user_id = user_res.scalar_one_or_none()
 
-        if not user:
+        if user_id is None:
             await callback.message.edit_text(
                 "❌ Пользователь не найден. Начните с /start"
             )
             await callback.answer()
             return
 
-        # 2. Загружаем ВСЕ его заявки + привязанное авто
-        req_res = await session.execute(
+        # 2. Количество заявок по фильтру — для "стр. N/M".
+        # Счётчики ведутся по СТО, не по клиентам, поэтому здесь count по
+        # заявкам одного клиента (индекс по user_id, статус фильтруется в SQL)
+        count_stmt = select(func.count(Request.id)).where(Request.user_id == user_id)
+        if status_filter:
+            count_stmt = count_stmt.where(Request.status.in_(status_filter))
+        total = (await session.execute(count_stmt)).scalar() or 0
+
+        # 3. Только нужная страница заявок + привязанное авто
+        stmt = (
             select(Request, Car)
             .join(Car, Request.car_id == Car.id, isouter=True)
-            .where(Request.user_id == user.id)
-            .order_by(Request.created_at.desc())
+            .where(Request.user_id == user_id)
         )
-        rows = req_res.all()
-
-    # Фильтруем по статусу в Python, чтобы не тянуть func/count и т.п.
-    if status_filter:
-        rows = [row for row in rows if row[0].status in status_filter]
+        if status_filter:
+            stmt = stmt.where(Request.status.in_(status_filter))
+
+        page_rows = []
+        has_prev = has_next = False
+        if total:
+            page_rows, has_prev, has_next = await fetch_request_page(
+                session, stmt, cursor_id, direction, CLIENT_PAGE_SIZE
+            )
 
-    total = len(rows)
-    if total == 0:
+    if not page_rows:
         title = CLIENT_FILTER_TITLES.get(filter_key, "Заявки")
         await callback.message.edit_text(
             f"📋 <b>{title}</b>\n\n"
@@ -3437,12 +3433,11 @@ async def show_requests_list(
         return
 
     total_pages = max(1, (total + CLIENT_PAGE_SIZE - 1) // CLIENT_PAGE_SIZE)
-    if page > total_pages:
-        page = total_pages
-
-    start = (page - 1) * CLIENT_PAGE_SIZE
-    end = start + CLIENT_PAGE_SIZE
-    page_rows = rows[start:end]
+    if not has_prev:
+        page = 1
+    page = max(1, min(page, total_pages))
+    if has_next and page == total_pages:
+        total_pages += 1
 
     status_map = {
         "new": "🆕 Новая",
@@ -3499,7 +3494,19 @@ async def show_requests_list(
         )
 
     # Склеиваем с навигацией по фильтрам/страницам
-    nav_kb = _build_history_kb(filter_key, page, total_pages)
+    prefix = f"history_filter:{filter_key}"
+    nav_kb = _build_history_kb(
+        filter_key,
+        page,
+        total_pages,
+        prev_data=page_callback(prefix, page - 1, PREV, page_rows[0][0].id) if has_prev else None,
+        next_data=page_callback(prefix, page + 1, NEXT, page_rows[-1][0].id) if has_next else None,
+        current_data=(
+            page_callback(prefix, page, direction, cursor_id)
+            if cursor_id is not None
+            else f"{prefix}:1"
+        ),
+    )
 
     # Соберём итоговую клавиатуру: сначала кнопки заявок, потом фильтры/страницы
     full_kb = InlineKeyboardBuilder()
@@ -3516,9 +3523,17 @@ async def show_requests_list(
     await callback.answer()
 
 
-def _build_history_kb(filter_key: str, page: int, total_pages: int):
+def _build_history_kb(
+    filter_key: str,
+    page: int,
+    total_pages: int,
+    prev_data: Optional[str] = None,
+    next_data: Optional[str] = None,
+    current_data: Optional[str] = None,
+):
     """
     Клавиатура для истории заявок: фильтры + пагинация.
+    prev_data / next_data — callback_data соседних страниц (с курсором) или None.
     """
     builder = InlineKeyboardBuilder()
 
@@ -3568,26 +3583,26 @@ def _build_history_kb(filter_key: str, page: int, total_pages: int):
     )
 
     # Пагинация
-    if total_pages > 1:
+    if prev_data or next_data:
         nav_buttons = []
-        if page > 1:
+        if prev_data:
             nav_buttons.append(
                 InlineKeyboardButton(
                     text="⬅️ Назад",
-                    callback_data=f"history_filter:{filter_key}:{page - 1}",
+                    callback_data=prev_data,
                 )
             )
         nav_buttons.append(
             InlineKeyboardButton(
                 text=f"Стр. {page}/{total_pages}",
-                callback_data=f"history_filter:{filter_key}:{page}",
+                callback_data=current_data or f"history_filter:{filter_key}:1",
             )
         )
-        if page < total_pages:
+        if next_data:
             nav_buttons.append(
                 InlineKeyboardButton(
                     text="Вперёд ➡️",
-                    callback_data=f"history_filter:{filter_key}:{page + 1}",
+                    callback_data=next_data,
                 )
             )
 
@@ -3608,6 +3623,7 @@ def _build_history_kb(filter_key: str, page: int, total_pages: int):
 async def client_accept_offer(
     callback: CallbackQuery,
     state: FSMContext,
+    session: AsyncSession,
 ) -> None:
     """
     Клиент нажал 'Принять условия'.
@@ -3622,62 +3638,53 @@ async def client_accept_offer(
         await callback.message.answer("Не удалось определить заявку.")
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request, User)
-            .join(User, Request.user_id == User.id)
-            .where(Request.id == request_id)
+    # Статус после принятия клиентом
+    # ВАЖНО: чтобы не ломать старую логику кнопок у менеджера,
+    # выставляем status='accepted' (как будто заявка принята сервисом).
+    # Условный UPDATE только из offer_sent: повторное нажатие не даёт
+    # второго автоотказа и второго бонуса.
+    request = await request_state.transition(
+        session,
+        request_id,
+        "accepted",
+        allowed=("offer_sent",),
+    )
+    if request is None:
+        await callback.message.edit_text(
+            "Заявка не найдена или условия по ней уже приняты / отклонены."
         )
-        row = result.first()
-        if not row:
-            await callback.message.edit_text("Заявка не найдена.")
-            return
-
-        request: Request = row[0]
-        db_user: User = row[1]
-
-        # Статус после принятия клиентом
-        # ВАЖНО: чтобы не ломать старую логику кнопок у менеджера,
-        # выставляем status='accepted' (как будто заявка принята сервисом).
-        request.status = "accepted"
-        request.accepted_at = datetime.utcnow()
-
-        # Автоотказ остальных заявок по той же машине и типу услуги
-        try:
-            await _auto_decline_other_requests(
-                session=session,
-                current_request=request,
-                bot=callback.bot,
-            )
-        except Exception as e:
-            logging.error(
-                "❌ Ошибка auto-decline для заявки #%s: %s",
-                request.id,
-                e,
-            )
+        return
 
-        await session.commit()
+    db_user = await session.get(User, request.user_id)
 
-    # Обновляем клавиатуру в чате сервиса (кнопки 'В работу', 'Завершить' и т.п.)
+    # Автоотказ остальных заявок по той же машине и типу услуги
+    # (savepoint: сбой автоотказа не должен откатить принятие условий)
+    declined = []
     try:
-        await update_chat_keyboard(callback.bot, request_id)
+        async with session.begin_nested():
+            declined = await auto_decline.decline_competing_requests(session, request)
     except Exception as e:
         logging.error(
-            "❌ Не удалось обновить клавиатуру по заявке #%s после accept_offer: %s",
-            request_id,
+            "❌ Ошибка auto-decline для заявки #%s: %s",
+            request.id,
             e,
         )
 
-    # Бонус клиенту за принятие условий
+    # Уведомления по отклонённым заявкам и клавиатура в чате сервиса
+    # (кнопки 'В работу', 'Завершить' и т.п.) — через outbox, после коммита
+    auto_decline.enqueue_notifications(session, declined, client_telegram_id=db_user.telegram_id)
+    outbox.enqueue_chat_keyboard(session, request_id)
+
+    # Бонус клиенту за принятие условий — в той же транзакции
+    # (savepoint: сбой начисления не должен откатить принятие)
     try:
-        async with AsyncSessionLocal() as session:
+        async with session.begin_nested():
             await add_bonus(
-                session=session,
-                user=db_user,
-                action="accept_offer",
+                db_user.telegram_id,
+                "accept_offer",
                 description=f"Принятие условий по заявке #{request_id}",
+                session=session,
             )
-            await session.commit()
     except Exception as e:
         logging.error(
             "❌ Ошибка начисления бонусов за accept_offer по заявке #%s: %s",
@@ -3685,65 +3692,19 @@ async def client_accept_offer(
             e,
         )
 
+    await session.commit()
+
     await callback.message.edit_text(
         "✅ Условия приняты.\n\n"
         "Сервис свяжется с вами для уточнения деталей и записи."
     )
 
 
-# === ВСПОМОГАТЕЛЬНО: автоотказ других заявок по той же машине и типу услуги ===
-
-async def _auto_decline_other_requests(
-    session: AsyncSession,
-    current_request: Request,
-    bot,
-) -> None:
-    """
-    Автоотказ по другим активным заявкам того же пользователя, той же машины и того же типа услуги,
-    когда клиент принял условия по одной из них.
-
-    Ничего не делаем, если у текущей заявки нет car_id или service_type.
-    """
-    if not current_request.car_id or not current_request.service_type:
-        return
-
-    result = await session.execute(
-        select(Request, ServiceCenter)
-        .join(ServiceCenter, Request.service_center_id == ServiceCenter.id)
-        .where(
-            Request.user_id == current_request.user_id,
-            Request.id != current_request.id,
-            Request.service_type == current_request.service_type,
-            Request.car_id == current_request.car_id,
-            Request.status.in_(["new", "offer_sent", "accepted"]),
-        )
-    )
-    rows = result.all()
-
-    for other, sc in rows:
-        other.status = "rejected"
-        other.rejected_at = datetime.utcnow()
-        # Добавляем пометку в комментарий
-        if other.manager_comment:
-            other.manager_comment += "\n\nАвтоотказ: клиент выбрал другой сервис."
-        else:
-            other.manager_comment = "Автоотказ: клиент выбрал другой сервис."
-
-        # Обновляем клавиатуру в чате сервиса, если есть чат_message_id
-        try:
-            await update_chat_keyboard(bot, other.id)
-        except Exception as e:
-            logging.error(
-                "❌ Не удалось обновить клавиатуру по заявке #%s после auto-decline: %s",
-                other.id,
-                e,
-            )
-
-
 @router.callback_query(F.data.startswith("client_reject_offer:"))
 async def client_reject_offer(
     callback: CallbackQuery,
     state: FSMContext,
+    session: AsyncSession,
 ) -> None:
     """
     Клиент нажал 'Отклонить предложение'.
@@ -3757,33 +3718,22 @@ async def client_reject_offer(
         await callback.message.answer("Не удалось определить заявку.")
         return
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request).where(Request.id == request_id)
-        )
-        request: Request | None = result.scalar_one_or_none()
-        if not request:
-            await callback.message.edit_text("Заявка не найдена.")
-            return
-
-        request.status = "rejected"
-        request.rejected_at = datetime.utcnow()
+    request = await request_state.transition(
+        session,
+        request_id,
+        "rejected",
+        allowed=("offer_sent",),
         # Дописать пометку в комментарий, что отклонено клиентом
-        if request.manager_comment:
-            request.manager_comment += "\n\nОтклонено клиентом."
-        else:
-            request.manager_comment = "Отклонено клиентом."
-
-        await session.commit()
-
-    try:
-        await update_chat_keyboard(callback.bot, request_id)
-    except Exception as e:
-        logging.error(
-            "❌ Не удалось обновить клавиатуру по заявке #%s после reject_offer: %s",
-            request_id,
-            e,
+        note="Отклонено клиентом.",
+    )
+    if request is None:
+        await callback.message.edit_text(
+            "Заявка не найдена или условия по ней уже приняты / отклонены."
         )
+        return
+
+    outbox.enqueue_chat_keyboard(session, request_id)
+    await session.commit()
 
     await callback.message.edit_text(
         "❌ Предложение сервиса отклонено.\n\n"
@@ -3832,7 +3782,7 @@ async def my_points(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(Command("bind_group"))
-async def bind_group_cmd(message: Message):
+async def bind_group_cmd(message: Message, session: AsyncSession):
     """
     Привязка текущей группы к автосервису.
 
@@ -3848,38 +3798,38 @@ async def bind_group_cmd(message: Message):
         )
         return
 
-    async with AsyncSessionLocal() as session:
-        # 2. Находим пользователя
-        result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
+    # 2. Находим пользователя
+    result = await session.execute(
+        select(User).where(User.telegram_id == message.from_user.id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user or user.role != "service":
+        await message.answer(
+            "Команда доступна только владельцам автосервисов.\n\n"
+            "Отправьте /bind_group из-под аккаунта, который регистрировал сервис.",
         )
-        user = result.scalar_one_or_none()
+        return
 
-        if not user or user.role != "service":
-            await message.answer(
-                "Команда доступна только владельцам автосервисов.\n\n"
-                "Отправьте /bind_group из-под аккаунта, который регистрировал сервис.",
-            )
-            return
+    # 3. Находим автосервис этого пользователя
+    sc_result = await session.execute(
+        select(ServiceCenter).where(ServiceCenter.owner_user_id == user.id)
+    )
+    service_center = sc_result.scalar_one_or_none()
 
-        # 3. Находим автосервис этого пользователя
-        sc_result = await session.execute(
-            select(ServiceCenter).where(ServiceCenter.owner_user_id == user.id)
+    if not service_center:
+        await message.answer(
+            "Профиль автосервиса не найден.\n"
+            "Попробуйте пройти регистрацию заново через /start.",
         )
-        service_center = sc_result.scalar_one_or_none()
+        return
 
-        if not service_center:
-            await message.answer(
-                "Профиль автосервиса не найден.\n"
-                "Попробуйте пройти регистрацию заново через /start.",
-            )
-            return
-
-        # 4. Привязываем текущую группу
-        service_center.manager_chat_id = message.chat.id
-        service_center.send_to_group = True
-        # send_to_owner не трогаем — сохраняем выбор из мастера
-        await session.commit()
+    # 4. Привязываем текущую группу
+    service_center.manager_chat_id = message.chat.id
+    service_center.send_to_group = True
+    # send_to_owner не трогаем — сохраняем выбор из мастера
+    await session.commit()
+    service_routing.invalidate(service_center.id)
 
     await message.answer(
         "✅ Эта группа успешно привязана к вашему автосервису.\n"
@@ -3888,7 +3838,7 @@ async def bind_group_cmd(message: Message):
 
 
 @router.callback_query(F.data.startswith("rate_request:"))
-async def handle_rate_request(callback: CallbackQuery):
+async def handle_rate_request(callback: CallbackQuery, session: AsyncSession):
     """
     Клиент ставит оценку сервису по заявке.
 
@@ -3907,86 +3857,72 @@ async def handle_rate_request(callback: CallbackQuery):
         await callback.answer("Оценка должна быть от 1 до 5", show_alert=True)
         return
 
-    async with AsyncSessionLocal() as session:
-        # 1. Грузим заявку с клиентом и сервисом
-        result = await session.execute(
-            select(Request, User, ServiceCenter)
-            .join(User, Request.user_id == User.id)
-            .join(ServiceCenter, Request.service_center_id == ServiceCenter.id, isouter=True)
-            .where(Request.id == request_id)
-        )
-        row = result.first()
-
-        if not row:
-            await callback.answer("Заявка не найдена", show_alert=True)
-            return
+    # 1. Грузим заявку с клиентом и сервисом
+    result = await session.execute(
+        select(Request, User, ServiceCenter)
+        .join(User, Request.user_id == User.id)
+        .join(ServiceCenter, Request.service_center_id == ServiceCenter.id, isouter=True)
+        .where(Request.id == request_id)
+    )
+    row = result.first()
 
-        request, user, service_center = row
+    if not row:
+        await callback.answer("Заявка не найдена", show_alert=True)
+        return
 
-        # Проверяем, что оценку ставит владелец заявки
-        if user.telegram_id != callback.from_user.id:
-            await callback.answer("Вы не можете оценить чужую заявку.", show_alert=True)
-            return
+    request, user, service_center = row
 
-        # Разрешаем оценку только по завершённой заявке
-        if request.status != "completed":
-            await callback.answer(
-                "Оценить можно только завершённую заявку.",
-                show_alert=True,
-            )
-            return
+    # Проверяем, что оценку ставит владелец заявки
+    if user.telegram_id != callback.from_user.id:
+        await callback.answer("Вы не можете оценить чужую заявку.", show_alert=True)
+        return
 
-        # 2. Проверяем, не ставил ли пользователь уже рейтинг по этой заявке
-        result = await session.execute(
-            select(Comment)
-            .where(
-                Comment.request_id == request.id,
-                Comment.user_id == user.id,
-                Comment.message.like("RATING:%"),
-            )
+    # Разрешаем оценку только по завершённой заявке
+    if request.status != "completed":
+        await callback.answer(
+            "Оценить можно только завершённую заявку.",
+            show_alert=True,
         )
-        existing_rating = result.scalar_one_or_none()
-        if existing_rating:
-            await callback.answer("Вы уже оценили этот сервис по данной заявке.", show_alert=True)
-            return
+        return
 
-        # 3. Сохраняем "оценочный" комментарий
-        rating_comment = Comment(
+    # 2–3. Оценка в ratings (повтор отсекает уникальный индекс) и пересчёт
+    #      рейтинга СТО одним UPDATE — в одной транзакции
+    try:
+        added = await rating_service.add_rating(
+            session,
             request_id=request.id,
             user_id=user.id,
-            message=f"RATING:{score}",
-            is_manager=False,
+            service_center_id=request.service_center_id,
+            score=score,
         )
-        session.add(rating_comment)
-
-        # 4. Обновляем средний рейтинг сервиса
-        if service_center:
-            old_avg = service_center.rating or 0.0
-            old_count = service_center.ratings_count or 0
-
-            new_count = old_count + 1
-            new_avg = (old_avg * old_count + score) / new_count
-
-            service_center.rating = new_avg
-            service_center.ratings_count = new_count
+        if not added:
+            await callback.answer("Вы уже оценили этот сервис по данной заявке.", show_alert=True)
+            return
 
+        # 4. Бонус за оценку — в той же транзакции
+        # (savepoint: сбой начисления не должен откатить саму оценку)
         try:
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"❌ Ошибка при сохранении оценки по заявке #{request_id}: {e}")
-            await callback.answer("Ошибка при сохранении оценки, попробуйте позже.", show_alert=True)
-            return
+            async with session.begin_nested():
+                await add_bonus(
+                    callback.from_user.id,
+                    "rate_service",
+                    description=f"Оценка сервиса по заявке #{request_id} на {score}⭐",
+                    session=session,
+                )
+        except Exception as bonus_err:
+            logging.error(f"⚠️ Не удалось начислить бонус за оценку: {bonus_err}")
 
-    # 5. Начисляем бонус за оценку
-    try:
-        await add_bonus(
-            callback.from_user.id,
-            "rate_service",
-            description=f"Оценка сервиса по заявке #{request_id} на {score}⭐",
-        )
-    except Exception as bonus_err:
-        logging.error(f"⚠️ Не удалось начислить бонус за оценку: {bonus_err}")
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        logging.error(f"❌ Ошибка при сохранении оценки по заявке #{request_id}: {e}")
+        await callback.answer("Ошибка при сохранении оценки, попробуйте позже.", show_alert=True)
+        return
+
+    # Рейтинг сервиса изменился — сбрасываем гео-кэш / снапшот
+    if service_center:
+        await session.refresh(service_center)
+        await geo_search.sync_service_center(service_center)
 
     await callback.answer("Спасибо за вашу оценку! 🙌", show_alert=True)
 
@@ -4005,25 +3941,6 @@ async def service_back_to_groups(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Расстояние между двумя точками по сфере (приблизительно по Земле) в километрах.
-    """
-    R = 6371.0  # радиус Земли, км
-
-    lat1_r = radians(lat1)
-    lon1_r = radians(lon1)
-    lat2_r = radians(lat2)
-    lon2_r = radians(lon2)
-
-    dlat = lat2_r - lat1_r
-    dlon = lon2_r - lon1_r
-
-    a = sin(dlat / 2) ** 2 + cos(lat1_r) * cos(lat2_r) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
-
 @router.callback_query(F.data == "service_centers_search")
 async def service_centers_search(callback: CallbackQuery, state: FSMContext):
     """
@@ -4075,27 +3992,10 @@ async def search_services_by_geo(message: Message, state: FSMContext):
     data = await state.get_data()
     radius = data.get("radius", 10)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter).where(ServiceCenter.owner_user_id.isnot(None))
-        )
-        all_services = result.scalars().all()
-
-    # ===== Фильтруем по радиусу =====
-    nearby = []
-    far_services = []
-    no_geo = []
-
-    for sc in all_services:
-        if sc.location_lat is None or sc.location_lon is None:
-            no_geo.append(sc)
-            continue
-
-        dist = _haversine_km(user_lat, user_lon, sc.location_lat, sc.location_lon)
-        if dist <= radius:
-            nearby.append((sc, dist))
-        else:
-            far_services.append((sc, dist))
+    # ===== Фильтруем по радиусу и ранжируем =====
+    nearby = await matching.match_service_centers(
+        user_lat, user_lon, radius_km=radius, limit=SERVICE_LIST_LIMIT
+    )
 
     # ===== Если внутри радиуса НИКОГО =====
     if not nearby:
@@ -4123,8 +4023,6 @@ async def search_services_by_geo(message: Message, state: FSMContext):
         return
 
     # ===== Вывод СТО по радиусу =====
-    nearby.sort(key=lambda x: x[1])
-
     lines = ["🏭 <b>Сервисы рядом с вами</b>\n"]
     kb = InlineKeyboardBuilder()
 
@@ -4149,16 +4047,18 @@ async def search_services_by_geo(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data == "show_all_services")
-async def show_all_services(callback: CallbackQuery, state: FSMContext):
+async def show_all_services(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     """
     Показывает все СТО: с геолокацией и без неё.
     Используется как fallback.
     """
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ServiceCenter).where(ServiceCenter.owner_user_id.isnot(None))
-        )
-        services = result.scalars().all()
+    # Лучшие по байесовскому рейтингу сверху (индекс ix_service_centers_rating_sort)
+    result = await session.execute(
+        select(ServiceCenter)
+        .where(ServiceCenter.owner_user_id.isnot(None))
+        .order_by(ServiceCenter.rating_sort.desc(), ServiceCenter.id.desc())
+    )
+    services = result.scalars().all()
 
     if not services:
         await callback.message.edit_text(
@@ -4259,24 +4159,8 @@ async def service_search_radius(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
 
-    async with AsyncSessionLocal() as session:
-        # 🔹 здесь добавили фильтр по owner_user_id, как в списке "Автосервисы"
-        result = await session.execute(
-            select(ServiceCenter).where(
-                ServiceCenter.owner_user_id.isnot(None),
-                ServiceCenter.location_lat.is_not(None),
-                ServiceCenter.location_lon.is_not(None),
-            )
-        )
-        services = result.scalars().all()
-
-    nearby: list[tuple[ServiceCenter, float]] = []
-    for sc in services:
-        dist = _haversine_km(lat, lon, sc.location_lat, sc.location_lon)
-        if dist <= radius_km:
-            nearby.append((sc, dist))
-
-    nearby.sort(key=lambda x: x[1])
+    # 🔹 только "живые" сервисы (есть владелец), как в списке "Автосервисы"
+    nearby = await geo_search.find_nearby_services(lat, lon, radius_km)
 
     if not nearby:
         await callback.message.edit_text(
@@ -4351,24 +4235,8 @@ async def service_search_radius_result(callback: CallbackQuery, state: FSMContex
         await callback.answer()
         return
 
-    async with AsyncSessionLocal() as session:
-        # 🔹 здесь добавили фильтр по owner_user_id, как в списке "Автосервисы"
-        result = await session.execute(
-            select(ServiceCenter).where(
-                ServiceCenter.owner_user_id.isnot(None),
-                ServiceCenter.location_lat.is_not(None),
-                ServiceCenter.location_lon.is_not(None),
-            )
-        )
-        services = result.scalars().all()
-
-    nearby: list[tuple[ServiceCenter, float]] = []
-    for sc in services:
-        dist = _haversine_km(lat, lon, sc.location_lat, sc.location_lon)
-        if dist <= radius_km:
-            nearby.append((sc, dist))
-
-    nearby.sort(key=lambda x: x[1])
+    # 🔹 только "живые" сервисы (есть владелец), как в списке "Автосервисы"
+    nearby = await geo_search.find_nearby_services(lat, lon, radius_km)
 
     if not nearby:
         await callback.message.edit_text(
@@ -1,15 +1,131 @@
 import asyncio
 import logging
+import signal
 import sys
 import os
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from redis.asyncio import Redis
 
 from app.config import config
 from app.database import db
 from app.handlers import user_handlers, manager_handlers, group_handlers, chat_handlers
 from app.handlers.admin_handlers import router as admin_router
+from app.middlewares import DbSessionMiddleware, IdentityMiddleware
+from app.services import (
+    geo_cache,
+    identity,
+    outbox,
+    request_counters,
+    request_search,
+    request_stats,
+    send_queue,
+)
+from app.services.specializations import backfill_service_specializations
+
+# Фоновые задачи процесса (сверка счётчиков, outbox) — отменяются при остановке
+_background_tasks: list[asyncio.Task] = []
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher) -> None:
+    """
+    Старт бота (и в polling, и в webhook): БД, фоновые задачи, регистрация webhook.
+    """
+    # Создание таблиц в БД (АСИНХРОННО с await!)
+    await db.create_tables()  # ← ДОБАВИТЬ AWAIT
+    logging.info("Таблицы БД созданы/проверены")
+    await backfill_service_specializations()
+    # Полнотекстовый индекс поиска заявок (FTS5 / tsvector) + дозаполнение документов
+    await request_search.ensure_search_index()
+
+    # Сверка счётчиков заявок по СТО: сразу и затем периодически
+    _background_tasks.append(asyncio.create_task(request_counters.run_reconciliation_loop()))
+    _background_tasks.append(asyncio.create_task(request_stats.run_reconciliation_loop()))
+    # Воркеры очереди отправки в Telegram (лимиты Bot API, приоритеты)
+    send_queue.start()
+    # Доставка уведомлений из outbox (записываются в транзакциях хендлеров)
+    _background_tasks.append(asyncio.create_task(outbox.run_dispatcher(bot)))
+
+    if config.BOT_MODE == "webhook":
+        if config.WEBHOOK_BASE_URL:
+            url = f"{config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}"
+            await bot.set_webhook(
+                url,
+                secret_token=config.WEBHOOK_SECRET,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+            )
+            logging.info(f"Webhook зарегистрирован: {url}")
+        else:
+            logging.info("WEBHOOK_BASE_URL не задан — setWebhook не вызываем")
+    else:
+        # Переход с webhook на polling: иначе getUpdates вернёт конфликт
+        await bot.delete_webhook()
+
+    logging.info("Бот запущен и готов к работе!")
+
+
+async def on_shutdown(dispatcher: Dispatcher) -> None:
+    """
+    Остановка: фоновые задачи, очередь отправки, соединения с БД и Redis.
+    Webhook не снимаем — за балансировщиком могут работать другие экземпляры.
+    """
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await send_queue.stop()
+
+    await dispatcher.storage.close()
+    await identity.close_redis()
+    await geo_cache.close_redis()
+    await db.engine.dispose()
+    logging.info("Бот остановлен")
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    aiohttp-сервер для webhook: POST WEBHOOK_PATH с апдейтом от Telegram
+    (или записанным апдейтом при локальной проверке — с тем же заголовком
+    X-Telegram-Bot-Api-Secret-Token). Апдейт обрабатывается фоновой задачей,
+    Telegram сразу получает 200. GET /health — для балансировщика.
+    """
+    app = web.Application()
+    # Сначала хуки диспетчера: on_shutdown отработает до закрытия сессии бота
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=config.WEBHOOK_SECRET,
+    ).register(app, path=config.WEBHOOK_PATH)
+    app.router.add_get("/health", _health)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logging.info(
+        f"Webhook-сервер слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+    )
+    # Останавливаемся по SIGINT / SIGTERM (docker stop), как и start_polling
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
 
 async def main():
     # Проверяем конфигурацию перед запуском
@@ -33,6 +149,11 @@ async def main():
         bot = Bot(token=config.BOT_TOKEN)
         dp = Dispatcher(storage=storage)
 
+        # Одна сессия БД на апдейт (хендлеры получают её аргументом session)
+        dp.update.outer_middleware(DbSessionMiddleware())
+        # Пользователь / роль / СТО из кэша (хендлеры получают аргумент identity)
+        dp.update.outer_middleware(IdentityMiddleware())
+
         # Регистрация роутеров
         dp.include_router(user_handlers.router)
         dp.include_router(manager_handlers.router)
@@ -40,13 +161,15 @@ async def main():
         dp.include_router(chat_handlers.router)
         dp.include_router(admin_router)
 
-        # Создание таблиц в БД (АСИНХРОННО с await!)
-        await db.create_tables()  # ← ДОБАВИТЬ AWAIT
-        logging.info("Таблицы БД созданы/проверены")
+        # Старт / остановка — общие для polling и webhook
+        dp.startup.register(on_startup)
+        dp.shutdown.register(on_shutdown)
 
-        # Запуск поллинга
-        logging.info("Бот запущен и готов к работе!")
-        await dp.start_polling(bot)
+        if config.BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            # Запуск поллинга
+            await dp.start_polling(bot)
 
     except Exception as e:
         logging.error(f"Ошибка при запуске бота: {e}")
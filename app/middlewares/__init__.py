@@ -0,0 +1,4 @@
+from .db_session import DbSessionMiddleware
+from .identity import IdentityMiddleware
+
+__all__ = ["DbSessionMiddleware", "IdentityMiddleware"]
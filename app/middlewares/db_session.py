@@ -0,0 +1,46 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.database.db import AsyncSessionLocal
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на апдейт: кладём её в data["session"], и хендлер получает
+    её аргументом `session: AsyncSession` — вместе с сервисами (бонусы,
+    комментарии, карточка в чате), которым её передаёт.
+
+    Соединение из пула берётся лениво, при первом запросе, так что апдейты,
+    не трогающие БД, ничего не стоят. Хендлер коммитит сам, когда нужно;
+    незакоммиченный остаток фиксируем после успешного хендлера, при исключении —
+    откатываем.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker[AsyncSession] = AsyncSessionLocal):
+        self.session_pool = session_pool
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+
+            if session.in_transaction():
+                try:
+                    await session.commit()
+                except Exception as e:
+                    await session.rollback()
+                    logging.error(f"❌ [db] Не удалось зафиксировать изменения апдейта: {e}")
+            return result
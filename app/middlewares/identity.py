@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+from app.services import identity as identity_service
+
+
+class IdentityMiddleware(BaseMiddleware):
+    """
+    Кладёт в data["identity"] пользователя апдейта (Identity: id в БД, роль,
+    админ ли, СТО владельца). Хендлер получает его аргументом
+    `identity: Identity` и не ходит в БД ради проверки прав.
+
+    Регистрировать после DbSessionMiddleware: при промахе кэша запрос идёт
+    через сессию апдейта.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user: TelegramUser | None = data.get("event_from_user")
+        if from_user is not None:
+            data["identity"] = await identity_service.resolve(
+                from_user.id, session=data.get("session")
+            )
+        return await handler(event, data)
@@ -0,0 +1,88 @@
+"""
+Микро-бенчмарк: векторный гео-поиск (geo_kernel) против старого цикла по haversine_km.
+
+Запуск из корня проекта:
+    python -m app.scripts.bench_geo_kernel [кол-во сервисов] [кол-во запросов]
+"""
+import random
+import sys
+import time
+
+from app.services.geo_index import haversine_km
+from app.services.geo_kernel import ServiceSnapshot, np
+from app.services.specializations import SPECIALIZATION_BITS, parse_specializations
+
+
+def make_rows(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    codes = list(SPECIALIZATION_BITS)
+    rows = []
+    for sc_id in range(1, n + 1):
+        # Сервисы кучкуются вокруг "города", как в реальной базе
+        lat = rnd.gauss(55.75, 0.5)
+        lon = rnd.gauss(37.62, 0.8)
+        rating = round(rnd.uniform(3.0, 5.0), 2) if rnd.random() < 0.7 else None
+        ratings_count = rnd.randint(1, 200) if rating is not None else 0
+        specs = None if rnd.random() < 0.2 else ",".join(rnd.sample(codes, rnd.randint(1, 3)))
+        rows.append((sc_id, lat, lon, rating, ratings_count, specs))
+    return rows
+
+
+def loop_match(rows, lat, lon, radius_km, category_code):
+    """
+    Как раньше в хендлерах: цикл по всем сервисам + сортировка списка.
+    """
+    nearby = []
+    for sc_id, sc_lat, sc_lon, _, _, specs in rows:
+        if category_code and specs is not None and category_code not in parse_specializations(specs):
+            continue
+        dist = haversine_km(lat, lon, sc_lat, sc_lon)
+        if dist <= radius_km:
+            nearby.append((sc_id, dist))
+    nearby.sort(key=lambda x: x[1])
+    return nearby
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    if np is None:
+        print("⚠️ numpy не установлен — geo_kernel работает в скалярном режиме")
+
+    rows = make_rows(n)
+    rnd = random.Random(7)
+    points = [
+        (rnd.gauss(55.75, 0.3), rnd.gauss(37.62, 0.5), rnd.choice([3, 5, 10, 30]), rnd.choice([None, "tire", "wash"]))
+        for _ in range(queries)
+    ]
+
+    t0 = time.perf_counter()
+    snapshot = ServiceSnapshot(rows)
+    build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    expected = [loop_match(rows, lat, lon, r, cat) for lat, lon, r, cat in points]
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = [snapshot.match(lat, lon, radius_km=r, category_code=cat) for lat, lon, r, cat in points]
+    kernel_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for lat, lon, _, cat in points:
+        snapshot.match(lat, lon, category_code=cat, k=10)
+    topk_time = time.perf_counter() - t0
+
+    assert got == expected, "geo_kernel разошёлся с haversine_km"
+
+    print(f"сервисов: {n}, запросов: {queries}")
+    print(f"снапшот:          {build * 1000:8.1f} мс")
+    print(f"цикл haversine:   {loop_time / queries * 1000:8.2f} мс/запрос")
+    print(f"geo_kernel:       {kernel_time / queries * 1000:8.2f} мс/запрос")
+    print(f"geo_kernel top10: {topk_time / queries * 1000:8.2f} мс/запрос")
+    print("✅ результаты совпадают")
+
+
+if __name__ == "__main__":
+    main()
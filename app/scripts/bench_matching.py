@@ -0,0 +1,90 @@
+"""
+Бенчмарк подбора СТО (app.services.matching) на большом числе сервисов.
+
+Сравнивает векторный rank() с эталонным циклом по score_one и проверяет,
+что топ совпадает.
+
+Запуск из корня проекта:
+    python -m app.scripts.bench_matching [кол-во сервисов] [кол-во запросов]
+"""
+import random
+import sys
+import time
+
+from app.scripts.bench_geo_kernel import make_rows
+from app.services.geo_index import haversine_km
+from app.services.geo_kernel import ServiceSnapshot, np
+from app.services.matching import rank, score_one
+
+
+def loop_rank(rows, load, lat, lon, category_code, radius_km, limit):
+    """
+    Наивный вариант: скор для каждого сервиса + полная сортировка.
+    """
+    scored = []
+    for pos, (sc_id, sc_lat, sc_lon, rating, ratings_count, specs) in enumerate(rows):
+        dist = None
+        if lat is not None and sc_lat is not None:
+            dist = haversine_km(lat, lon, sc_lat, sc_lon)
+        if radius_km is not None and (dist is None or dist > radius_km):
+            continue
+        score = score_one(dist, rating, ratings_count, specs, category_code, load[pos])
+        if score is not None:
+            scored.append((sc_id, score))
+    scored.sort(key=lambda x: -x[1])
+    return scored[:limit]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    limit = 20
+
+    if np is None:
+        print("⚠️ numpy не установлен — rank() работает в скалярном режиме")
+
+    rows = make_rows(n)
+    # У части сервисов нет координат — они участвуют в подборе без гео
+    rnd = random.Random(11)
+    rows = [
+        (sc_id, None, None, *rest) if rnd.random() < 0.1 else (sc_id, lat, lon, *rest)
+        for sc_id, lat, lon, *rest in rows
+    ]
+    load_list = [rnd.choice([0, 0, 0, 1, 2, 5, 12]) for _ in rows]
+
+    snapshot = ServiceSnapshot(rows)
+    load = np.array(load_list, dtype=np.float64) if np is not None else load_list
+
+    points = []
+    for _ in range(queries):
+        with_geo = rnd.random() < 0.7
+        points.append(
+            (
+                rnd.gauss(55.75, 0.3) if with_geo else None,
+                rnd.gauss(37.62, 0.5) if with_geo else None,
+                rnd.choice([None, "tire", "wash", "agg_turbo"]),
+                rnd.choice([None, 10, 30]) if with_geo else None,
+            )
+        )
+
+    t0 = time.perf_counter()
+    expected = [loop_rank(rows, load_list, *p, limit) for p in points]
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = [rank(snapshot, load, *p, limit=limit) for p in points]
+    rank_time = time.perf_counter() - t0
+
+    for exp, res in zip(expected, got):
+        assert len(exp) == len(res)
+        for (exp_id, exp_score), (res_id, res_score, _) in zip(exp, res):
+            assert abs(exp_score - res_score) < 1e-9, "скоры разошлись"
+
+    print(f"сервисов: {n}, запросов: {queries}, топ-{limit}")
+    print(f"цикл score_one: {loop_time / queries * 1000:8.2f} мс/запрос")
+    print(f"rank():         {rank_time / queries * 1000:8.2f} мс/запрос")
+    print("✅ топы совпадают")
+
+
+if __name__ == "__main__":
+    main()
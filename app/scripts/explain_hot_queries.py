@@ -0,0 +1,289 @@
+"""
+Проверка планов "горячих" запросов из хендлеров.
+
+Создаёт схему в отдельной (пустой!) базе, засевает её большим набором данных,
+выполняет ANALYZE и смотрит EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (Postgres)
+по каждому запросу. Если хоть один запрос читает таблицу полным
+последовательным сканом — код выхода 1.
+
+Запуск из корня проекта:
+    python -m app.scripts.explain_hot_queries [кол-во заявок] [URL базы]
+
+По умолчанию — временный файл SQLite. Для Postgres передайте URL отдельной
+пустой базы (postgresql+asyncpg://...): скрипт сам создаёт таблицы и данные.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database.base import Base
+from app.database.bonus_models import BonusTransaction
+from app.database.comment_models import Comment
+from app.database.models import Car, Request, ServiceCenter, User
+from app.database.rating_models import Rating
+from app.services.pagination import NEXT, PREV, seek_stmt
+
+
+STATUSES = ["new", "offer_sent", "accepted_by_client", "accepted", "in_progress", "completed", "rejected"]
+PAGE_SIZE = 5
+
+
+async def seed(conn, n_requests: int, rnd: random.Random) -> None:
+    n_users = max(100, n_requests // 20)
+    n_services = max(10, n_users // 20)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    users = [
+        {
+            "id": i,
+            "telegram_id": 10_000_000 + i,
+            "full_name": f"user {i}",
+            "points": 0,
+            "role": "service" if i <= n_services else "client",
+        }
+        for i in range(1, n_users + 1)
+    ]
+    await conn.execute(insert(User), users)
+
+    services = [
+        {"id": i, "name": f"СТО {i}", "owner_user_id": i, "send_to_owner": True}
+        for i in range(1, n_services + 1)
+    ]
+    await conn.execute(insert(ServiceCenter), services)
+
+    cars = [
+        {"id": i, "user_id": i, "brand": "Lada", "model": "Vesta"}
+        for i in range(1, n_users + 1)
+    ]
+    await conn.execute(insert(Car), cars)
+
+    requests = []
+    for i in range(1, n_requests + 1):
+        user_id = rnd.randint(n_services + 1, n_users)
+        requests.append(
+            {
+                "id": i,
+                "user_id": user_id,
+                "car_id": user_id,
+                "service_center_id": rnd.randint(1, n_services) if rnd.random() < 0.9 else None,
+                "service_type": "Ремонт",
+                "status": rnd.choice(STATUSES),
+                "created_at": start + timedelta(seconds=rnd.randint(0, 365 * 86400)),
+            }
+        )
+    await conn.execute(insert(Request), requests)
+
+    comments = [
+        {
+            "request_id": rnd.randint(1, n_requests),
+            "user_id": rnd.randint(1, n_users),
+            "message": "комментарий",
+            "is_manager": rnd.random() < 0.5,
+            "created_at": start + timedelta(seconds=rnd.randint(0, 365 * 86400)),
+        }
+        for _ in range(n_requests)
+    ]
+    await conn.execute(insert(Comment), comments)
+
+    bonus = [
+        {
+            "user_id": rnd.randint(1, n_users),
+            "action": "new_request",
+            "amount": 10,
+            "created_at": start + timedelta(seconds=rnd.randint(0, 365 * 86400)),
+        }
+        for _ in range(n_requests)
+    ]
+    await conn.execute(insert(BonusTransaction), bonus)
+
+    await conn.execute(text("ANALYZE"))
+
+
+def hot_queries(sc_id: int, user_id: int, telegram_id: int, request_id: int):
+    """
+    Запросы в том виде, в каком их строят хендлеры и сервисы.
+    """
+    manager_list = (
+        select(Request, User, Car)
+        .join(User, Request.user_id == User.id)
+        .join(Car, Request.car_id == Car.id, isouter=True)
+        .where(
+            (Request.service_center_id == sc_id) | (Request.service_center_id.is_(None)),
+            Request.status.in_(["accepted", "in_progress"]),
+        )
+    )
+    admin_list = (
+        select(Request, User, Car)
+        .join(User, Request.user_id == User.id)
+        .join(Car, Request.car_id == Car.id, isouter=True)
+        .where(Request.status.in_(["completed", "rejected"]))
+    )
+    client_list = (
+        select(Request, Car)
+        .join(Car, Request.car_id == Car.id, isouter=True)
+        .where(Request.user_id == user_id)
+    )
+    client_active = client_list.where(Request.status.in_(["new", "offer_sent", "in_progress"]))
+
+    return {
+        "user by telegram_id": select(User).where(User.telegram_id == telegram_id),
+        "identity (user + owned service)": (
+            select(User.id, User.role, ServiceCenter.id)
+            .outerjoin(ServiceCenter, ServiceCenter.owner_user_id == User.id)
+            .where(User.telegram_id == telegram_id)
+            .order_by(ServiceCenter.id)
+            .limit(1)
+        ),
+        "manager list, page 1": seek_stmt(manager_list, None, NEXT, PAGE_SIZE),
+        "manager list, next page": seek_stmt(manager_list, request_id, NEXT, PAGE_SIZE),
+        "manager list, prev page": seek_stmt(manager_list, request_id, PREV, PAGE_SIZE),
+        "admin list, page 1": seek_stmt(admin_list, None, NEXT, PAGE_SIZE),
+        "admin list, next page": seek_stmt(admin_list, request_id, NEXT, PAGE_SIZE),
+        "client history, page 1": seek_stmt(client_list, None, NEXT, PAGE_SIZE),
+        "client history, next page": seek_stmt(client_list, request_id, NEXT, PAGE_SIZE),
+        "client history by status": seek_stmt(client_active, request_id, NEXT, PAGE_SIZE),
+        "client history count": (
+            select(func.count(Request.id)).where(
+                Request.user_id == user_id,
+                Request.status.in_(["new", "offer_sent", "in_progress"]),
+            )
+        ),
+        "service center of owner": select(ServiceCenter).where(ServiceCenter.owner_user_id == user_id),
+        "user cars": select(Car).where(Car.user_id == user_id),
+        "service centers by rating": (
+            select(ServiceCenter)
+            .where(ServiceCenter.owner_user_id.isnot(None))
+            .order_by(ServiceCenter.rating_sort.desc(), ServiceCenter.id.desc())
+        ),
+        "rating duplicate check": (
+            select(Rating.id).where(Rating.request_id == request_id, Rating.user_id == user_id)
+        ),
+        "request comments": (
+            select(Comment, User)
+            .join(User, Comment.user_id == User.id)
+            .where(Comment.request_id == request_id)
+            .order_by(Comment.created_at.asc())
+        ),
+        "bonus history": (
+            select(BonusTransaction)
+            .where(BonusTransaction.user_id == user_id)
+            .order_by(BonusTransaction.created_at.desc())
+            .limit(10)
+        ),
+        "requests in period": (
+            select(Request.id, Request.status)
+            .where(
+                Request.created_at >= datetime(2025, 6, 1, tzinfo=timezone.utc),
+                Request.created_at < datetime(2025, 6, 8, tzinfo=timezone.utc),
+            )
+        ),
+    }
+
+
+async def explain(conn, stmt) -> tuple[list[str], list[str]]:
+    """
+    (строки плана, найденные последовательные сканы).
+    """
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+
+    if conn.dialect.name == "postgresql":
+        result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        lines: list[str] = []
+        seq_scans: list[str] = []
+
+        def walk(node, depth=0):
+            relation = node.get("Relation Name", "")
+            lines.append(f"{'  ' * depth}{node['Node Type']} {relation}".rstrip())
+            if node["Node Type"] == "Seq Scan":
+                seq_scans.append(relation)
+            for child in node.get("Plans", []):
+                walk(child, depth + 1)
+
+        walk(plan[0]["Plan"])
+        return lines, seq_scans
+
+    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    lines = [row[-1] for row in result.all()]
+    seq_scans = [
+        line
+        for line in lines
+        if line.startswith("SCAN ")
+        and " USING " not in line
+        and "CONSTANT ROW" not in line
+        and "SUBQUERY" not in line
+    ]
+    return lines, seq_scans
+
+
+async def main() -> int:
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    db_url = sys.argv[2] if len(sys.argv) > 2 else None
+
+    tmp_path = None
+    if db_url is None:
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", prefix="explain_")
+        os.close(fd)
+        db_url = f"sqlite+aiosqlite:///{tmp_path}"
+
+    engine = create_async_engine(db_url)
+    rnd = random.Random(7)
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            existing = (await conn.execute(select(func.count(Request.id)))).scalar()
+            if existing:
+                print("❌ В базе уже есть заявки — нужна отдельная пустая база для проверки")
+                return 2
+            print(f"Засеваем {n_requests} заявок...")
+            await seed(conn, n_requests, rnd)
+
+        async with engine.connect() as conn:
+            sample = (
+                await conn.execute(
+                    select(Request.id, Request.user_id, Request.service_center_id, User.telegram_id)
+                    .join(User, Request.user_id == User.id)
+                    .where(Request.service_center_id.is_not(None))
+                    .order_by(Request.id)
+                    .offset(n_requests // 2)
+                    .limit(1)
+                )
+            ).first()
+            request_id, user_id, sc_id, telegram_id = sample
+
+            failed = []
+            for name, stmt in hot_queries(sc_id, user_id, telegram_id, request_id).items():
+                lines, seq_scans = await explain(conn, stmt)
+                mark = "❌" if seq_scans else "✅"
+                print(f"{mark} {name}")
+                for line in lines:
+                    print(f"      {line}")
+                if seq_scans:
+                    failed.append(name)
+    finally:
+        await engine.dispose()
+        if tmp_path:
+            os.remove(tmp_path)
+
+    if failed:
+        print(f"\n❌ Последовательный скан в {len(failed)} запросах: {', '.join(failed)}")
+        return 1
+
+    print("\n✅ Все горячие запросы идут по индексам")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.config import config
+from app.database.chat_message_models import RequestChatMessage
+from app.database.models import Request, ServiceCenter, User
+from app.services import card_sync, outbox, request_counters, request_state, request_stats, send_queue
+from app.services.chat_service import _build_request_keyboard
+
+
+AUTO_DECLINE_NOTE = "Автоотказ: клиент выбрал другой сервис."
+
+# Статусы параллельных заявок, которые снимаются, когда клиент принял условия по одной
+COMPETING_STATUSES = ("new", "offer_sent", "accepted_by_client", "accepted")
+
+
+@dataclass(frozen=True)
+class DeclinedRequest:
+    """
+    Автоотклонённая заявка и куда о ней сообщить (всё собрано одним запросом,
+    чтобы рассылка не ходила в БД).
+    """
+    request_id: int
+    service_center_id: Optional[int]
+    chat_message_id: Optional[int]
+    # Основной чат сервиса: группа или ЛС владельца (None — не определён)
+    chat_id: Optional[int]
+    # Все копии карточки [(chat_id, message_id)] из request_chat_messages
+    chat_messages: tuple = ()
+
+
+def _primary_chat_id(row) -> Optional[int]:
+    if row.sc_id is None:
+        return None
+    if row.send_to_group and row.manager_chat_id:
+        return row.manager_chat_id
+    if row.send_to_owner and row.owner_telegram_id:
+        return row.owner_telegram_id
+    return None
+
+
+async def decline_competing_requests(
+    session: AsyncSession,
+    accepted_request: Request,
+) -> list[DeclinedRequest]:
+    """
+    Отклоняет другие активные заявки клиента по той же машине и типу работ.
+
+    Заявки блокируются одним SELECT ... FOR UPDATE (вместе с чатом сервиса),
+    статус меняется одним UPDATE ... RETURNING. Счётчики и статистика
+    обновляются тут же (UPDATE идёт мимо ORM). Коммит — за вызывающим,
+    уведомления — notify_declined после коммита.
+    """
+    if not accepted_request.car_id or not accepted_request.service_type:
+        return []
+
+    owner = aliased(User)
+    result = await session.execute(
+        select(
+            Request.id,
+            Request.status,
+            Request.service_center_id,
+            Request.category_code,
+            Request.chat_message_id,
+            ServiceCenter.id.label("sc_id"),
+            ServiceCenter.send_to_group,
+            ServiceCenter.manager_chat_id,
+            ServiceCenter.send_to_owner,
+            owner.telegram_id.label("owner_telegram_id"),
+        )
+        .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
+        .outerjoin(owner, owner.id == ServiceCenter.owner_user_id)
+        .where(
+            Request.user_id == accepted_request.user_id,
+            Request.id != accepted_request.id,
+            Request.service_type == accepted_request.service_type,
+            Request.car_id == accepted_request.car_id,
+            Request.status.in_(COMPETING_STATUSES),
+        )
+        .with_for_update(of=Request.__table__)
+    )
+    rows = {row.id: row for row in result.all()}
+    if not rows:
+        return []
+
+    requests = Request.__table__
+    result = await session.execute(
+        update(requests)
+        .where(
+            requests.c.id.in_(list(rows)),
+            requests.c.status.in_(COMPETING_STATUSES),
+        )
+        .values(
+            status="rejected",
+            # Время БД, как в request_state.transition
+            rejected_at=func.now(),
+            manager_comment=request_state.append_note(AUTO_DECLINE_NOTE),
+        )
+        .returning(requests.c.id)
+    )
+    declined_ids = sorted(result.scalars().all())
+    if not declined_ids:
+        return []
+
+    counter_deltas: dict = {}
+    stats_deltas: dict = {}
+    for request_id in declined_ids:
+        row = rows[request_id]
+        for key, delta in (
+            ((row.service_center_id, row.status or "new"), -1),
+            ((row.service_center_id, "rejected"), 1),
+        ):
+            counter_deltas[key] = counter_deltas.get(key, 0) + delta
+        for key, delta in (
+            ((row.service_center_id, row.category_code, row.status or "new"), -1),
+            ((row.service_center_id, row.category_code, "rejected"), 1),
+        ):
+            stats_deltas[key] = stats_deltas.get(key, 0) + delta
+
+    await request_counters.apply_deltas(session, counter_deltas)
+    await request_stats.apply_deltas(session, stats_deltas)
+
+    copies: dict[int, list[tuple[int, int]]] = {}
+    result = await session.execute(
+        select(
+            RequestChatMessage.request_id,
+            RequestChatMessage.chat_id,
+            RequestChatMessage.message_id,
+        ).where(RequestChatMessage.request_id.in_(declined_ids))
+    )
+    for request_id, chat_id, message_id in result.all():
+        copies.setdefault(request_id, []).append((chat_id, message_id))
+
+    logging.info(
+        f"[auto-decline] Заявка #{accepted_request.id}: автоотказ по {len(declined_ids)} "
+        f"параллельным заявкам {declined_ids}"
+    )
+    return [
+        DeclinedRequest(
+            request_id=request_id,
+            service_center_id=rows[request_id].service_center_id,
+            chat_message_id=rows[request_id].chat_message_id,
+            chat_id=_primary_chat_id(rows[request_id]),
+            chat_messages=tuple(copies.get(request_id, ())),
+        )
+        for request_id in declined_ids
+    ]
+
+
+async def _notify_one(
+    bot: Bot,
+    item: DeclinedRequest,
+    client_telegram_id: Optional[int],
+) -> None:
+    # 1. Уведомление в чат сервиса (fallback — общий чат менеджеров)
+    chat_id = item.chat_id or config.MANAGER_CHAT_ID
+    if chat_id:
+        kb = None
+        if client_telegram_id:
+            builder = InlineKeyboardBuilder()
+            builder.button(text="📩 Написать клиенту", url=f"tg://user?id={client_telegram_id}")
+            kb = builder.as_markup()
+        try:
+            await send_queue.send_message(
+                bot,
+                chat_id,
+                (
+                    f"❌ Клиент выбрал другой сервис по заявке #{item.request_id}.\n"
+                    f"Заявка автоматически переведена в статус «Отклонена»."
+                ),
+                priority=send_queue.PRIORITY_SERVICE,
+                reply_markup=kb,
+            )
+        except Exception as e:
+            logging.error(
+                f"❌ Не удалось уведомить сервис об автоотказе по заявке #{item.request_id}: {e}"
+            )
+    else:
+        logging.error(
+            f"❌ Не удалось определить чат сервиса для уведомления по заявке #{item.request_id}"
+        )
+
+    # 2. Клавиатура под всеми копиями карточки — "заявка закрыта"
+    messages = [tuple(message) for message in item.chat_messages]
+    if not messages and item.chat_id and item.chat_message_id:
+        messages = [(item.chat_id, item.chat_message_id)]
+    if messages:
+        # (клавиатура зависит только от id, статуса и наличия СТО — хватает
+        # несохраняемых объектов, без похода в БД)
+        closed = Request(id=item.request_id, status="rejected")
+        sc = ServiceCenter(id=item.service_center_id) if item.service_center_id else None
+        keyboard = _build_request_keyboard(closed, sc)
+
+        async def edit(chat_id: int, message_id: int) -> None:
+            try:
+                await card_sync.edit_reply_markup(bot, chat_id, message_id, keyboard)
+            except Exception as e:
+                logging.info(
+                    f"ℹ️ Клавиатура для заявки #{item.request_id} в чате {chat_id} уже актуальна "
+                    f"или не может быть обновлена: {e}"
+                )
+
+        await asyncio.gather(*(edit(chat_id, message_id) for chat_id, message_id in messages))
+
+
+async def notify_declined(
+    bot: Bot,
+    declined: list[DeclinedRequest],
+    client_telegram_id: Optional[int] = None,
+) -> None:
+    """
+    Рассылка по автоотклонённым заявкам: параллельно, но не больше
+    AUTO_DECLINE_CONCURRENCY запросов к Telegram одновременно.
+    Вызывать после коммита (обычно — из outbox, см. enqueue_notifications).
+    """
+    if not declined:
+        return
+
+    semaphore = asyncio.Semaphore(config.AUTO_DECLINE_CONCURRENCY)
+
+    async def run(item: DeclinedRequest) -> None:
+        async with semaphore:
+            await _notify_one(bot, item, client_telegram_id)
+
+    await asyncio.gather(*(run(item) for item in declined))
+
+
+def enqueue_notifications(
+    session: AsyncSession,
+    declined: list[DeclinedRequest],
+    client_telegram_id: Optional[int] = None,
+) -> None:
+    """
+    Ставит рассылку по автоотклонённым заявкам в outbox — в транзакции
+    автоотказа; notify_declined вызовет диспетчер после коммита.
+    """
+    if not declined:
+        return
+    outbox.enqueue(
+        session,
+        "auto_decline",
+        declined=[asdict(item) for item in declined],
+        client_telegram_id=client_telegram_id,
+    )
+
+
+@outbox.handler("auto_decline")
+async def _deliver_notifications(bot: Bot, payload: dict) -> None:
+    await notify_declined(
+        bot,
+        [DeclinedRequest(**item) for item in payload["declined"]],
+        client_telegram_id=payload.get("client_telegram_id"),
+    )
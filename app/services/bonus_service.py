@@ -1,7 +1,8 @@
 import logging
-from typing import Optional, Tuple, List
+from collections import defaultdict
+from typing import Iterable, Optional, Tuple, List
 
-from sqlalchemy import select
+from sqlalchemy import bindparam, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import config
@@ -19,6 +20,9 @@ BONUS_ACTION_MAP: dict[str, int] = {
     "rate_service": config.BONUS_RATE_SERVICE,
 }
 
+# Сколько начислений обрабатывать за раз в add_bonus_bulk
+_BULK_CHUNK = 500
+
 
 async def _get_user_by_telegram(session: AsyncSession, telegram_id: int) -> Optional[User]:
     result = await session.execute(
@@ -27,13 +31,20 @@ async def _get_user_by_telegram(session: AsyncSession, telegram_id: int) -> Opti
     return result.scalar_one_or_none()
 
 
-async def add_bonus(telegram_id: int, action: str, description: Optional[str] = None) -> bool:
+async def add_bonus(
+    telegram_id: int,
+    action: str,
+    description: Optional[str] = None,
+    session: Optional[AsyncSession] = None,
+) -> bool:
     """
     Начисляет бонусы пользователю по его telegram_id за определённое действие.
 
     :param telegram_id: Telegram ID пользователя
     :param action: ключ действия (register / new_request / accept_offer / complete_request)
     :param description: произвольное пояснение для истории
+    :param session: сессия апдейта (DbSessionMiddleware) — начисление войдёт в её
+        транзакцию, коммит и откат делает вызывающий; без неё открываем свою
     :return: True, если начисление прошло успешно
     """
     amount = BONUS_ACTION_MAP.get(action)
@@ -43,38 +54,142 @@ async def add_bonus(telegram_id: int, action: str, description: Optional[str] =
         logging.info(f"[bonus] Для действия {action!r} не настроено начисление, пропускаю")
         return False
 
+    if session is not None:
+        return await _add_bonus(session, telegram_id, action, amount, description)
+
     async with AsyncSessionLocal() as session:
         try:
-            user = await _get_user_by_telegram(session, telegram_id)
-            if not user:
-                logging.warning(f"[bonus] Пользователь с telegram_id={telegram_id} не найден, бонус не начислён")
-                return False
-
-            # Обновляем баланс
-            current_points = user.points or 0
-            user.points = current_points + amount
-
-            # Пишем в историю
-            tx = BonusTransaction(
-                user_id=user.id,
-                action=action,
-                amount=amount,
-                description=description,
-            )
-            session.add(tx)
-
+            added = await _add_bonus(session, telegram_id, action, amount, description)
             await session.commit()
-            logging.info(
-                f"[bonus] Начислено {amount} баллов пользователю {telegram_id} (action={action}), "
-                f"новый баланс={user.points}"
-            )
-            return True
+            return added
         except Exception as e:
             await session.rollback()
             logging.error(f"❌ Ошибка начисления бонусов (telegram_id={telegram_id}, action={action}): {e}")
             return False
 
 
+async def _add_bonus(
+    session: AsyncSession,
+    telegram_id: int,
+    action: str,
+    amount: int,
+    description: Optional[str],
+) -> bool:
+    # Баланс меняем в БД одним UPDATE: без лишнего чтения и без потерянных
+    # начислений при параллельных апдейтах
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(points=User.points + amount)
+        .returning(User.id, User.points)
+    )
+    row = result.first()
+    if row is None:
+        logging.warning(f"[bonus] Пользователь с telegram_id={telegram_id} не найден, бонус не начислён")
+        return False
+
+    user_id, new_balance = row
+
+    # Пишем в историю (та же транзакция)
+    await session.execute(
+        insert(BonusTransaction).values(
+            user_id=user_id,
+            action=action,
+            amount=amount,
+            description=description,
+        )
+    )
+
+    logging.info(
+        f"[bonus] Начислено {amount} баллов пользователю {telegram_id} (action={action}), "
+        f"новый баланс={new_balance}"
+    )
+    return True
+
+
+async def add_bonus_bulk(
+    entries: Iterable[Tuple[int, str, Optional[str]]],
+    session: Optional[AsyncSession] = None,
+) -> int:
+    """
+    Массовое начисление (акции, пересчёты): entries — (telegram_id, action, description).
+    Балансы и история пишутся пачками через executemany.
+
+    :param session: как в add_bonus — с ней коммит делает вызывающий
+    :return: сколько начислений записано
+    """
+    entries = [
+        (telegram_id, action, description, BONUS_ACTION_MAP.get(action) or 0)
+        for telegram_id, action, description in entries
+    ]
+    entries = [e for e in entries if e[3] > 0]
+    if not entries:
+        return 0
+
+    if session is not None:
+        return await _add_bonus_bulk(session, entries)
+
+    async with AsyncSessionLocal() as session:
+        try:
+            added = await _add_bonus_bulk(session, entries)
+            await session.commit()
+            return added
+        except Exception as e:
+            await session.rollback()
+            logging.error(f"❌ Ошибка массового начисления бонусов ({len(entries)} шт.): {e}")
+            return 0
+
+
+async def _add_bonus_bulk(session: AsyncSession, entries: list[tuple]) -> int:
+    users = User.__table__
+    added = 0
+
+    for start in range(0, len(entries), _BULK_CHUNK):
+        chunk = entries[start:start + _BULK_CHUNK]
+
+        result = await session.execute(
+            select(User.telegram_id, User.id).where(
+                User.telegram_id.in_({e[0] for e in chunk})
+            )
+        )
+        user_ids = dict(result.all())
+
+        totals: dict[int, int] = defaultdict(int)
+        ledger = []
+        for telegram_id, action, description, amount in chunk:
+            user_id = user_ids.get(telegram_id)
+            if user_id is None:
+                continue
+            totals[user_id] += amount
+            ledger.append(
+                {
+                    "user_id": user_id,
+                    "action": action,
+                    "amount": amount,
+                    "description": description,
+                }
+            )
+
+        if not ledger:
+            continue
+
+        await session.execute(
+            users.update()
+            .where(users.c.id == bindparam("uid"))
+            .values(points=users.c.points + bindparam("amt")),
+            [{"uid": uid, "amt": amt} for uid, amt in totals.items()],
+        )
+        await session.execute(insert(BonusTransaction), ledger)
+        added += len(ledger)
+
+    skipped = len(entries) - added
+    logging.info(
+        f"[bonus] Массовое начисление: записано {added}"
+        + (f", пропущено (нет пользователя) {skipped}" if skipped else "")
+    )
+    return added
+
+
 async def get_user_balance(
     telegram_id: int,
     limit_history: int = 10,
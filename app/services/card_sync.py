@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from app.config import config
+from app.services import send_queue
+from app.services.geo_cache import LRUCache
+
+
+# Последнее отправленное состояние сообщения: {"text": хеш | None, "markup": хеш}.
+# Держится в процессе: правки из других экземпляров бота сюда не попадают,
+# поэтому верим ему не дольше CARD_SYNC_CACHE_TTL_SECONDS.
+_rendered = LRUCache(config.CARD_SYNC_CACHE_SIZE, config.CARD_SYNC_CACHE_TTL_SECONDS)
+
+
+@dataclass
+class _PendingEdit:
+    """
+    Итоговое состояние сообщения, накопленное за окно склейки.
+    text = None — меняется только клавиатура.
+    """
+    bot: Bot
+    future: asyncio.Future
+    markup: Optional[InlineKeyboardMarkup] = None
+    text: Optional[str] = None
+    text_kwargs: dict = field(default_factory=dict)
+
+
+_pending: dict[tuple[int, int], _PendingEdit] = {}
+# Ссылки на задачи отложенной отправки (иначе их может собрать GC)
+_tasks: set[asyncio.Task] = set()
+
+
+def _hash(value) -> str:
+    if isinstance(value, InlineKeyboardMarkup):
+        value = value.model_dump(exclude_none=True)
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _key(chat_id: int, message_id: int) -> str:
+    return f"{chat_id}:{message_id}"
+
+
+def remember(
+    chat_id: int,
+    message_id: int,
+    markup: Optional[InlineKeyboardMarkup] = None,
+    text: Optional[str] = None,
+) -> None:
+    """
+    Запоминает, что сообщение уже в этом состоянии (например, только что
+    отправленная карточка) — такая же правка потом не уйдёт в Telegram.
+    """
+    _rendered.set(
+        _key(chat_id, message_id),
+        {"text": _hash(text) if text is not None else None, "markup": _hash(markup)},
+    )
+
+
+def forget(chat_id: int, message_id: int) -> None:
+    _rendered.pop(_key(chat_id, message_id))
+
+
+async def edit_reply_markup(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> bool:
+    """
+    Меняет клавиатуру сообщения: правки одного сообщения за CARD_SYNC_DEBOUNCE_SECONDS
+    склеиваются, уходит только итоговое состояние и только если оно отличается от
+    уже отправленного.
+    :return: True — правка отправлена, False — ничего не изменилось
+    """
+    pending = _schedule(bot, chat_id, message_id)
+    pending.markup = reply_markup
+    return await asyncio.shield(pending.future)
+
+
+async def edit_text(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    **kwargs,
+) -> bool:
+    """
+    То же для текста сообщения вместе с клавиатурой (kwargs — parse_mode и т.п.).
+    """
+    pending = _schedule(bot, chat_id, message_id)
+    pending.text = text
+    pending.text_kwargs = kwargs
+    pending.markup = reply_markup
+    return await asyncio.shield(pending.future)
+
+
+def _schedule(bot: Bot, chat_id: int, message_id: int) -> _PendingEdit:
+    key = (chat_id, message_id)
+    pending = _pending.get(key)
+    if pending is None:
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку заберут вызывающие; если все уже ушли — не шумим в лог
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        pending = _PendingEdit(bot=bot, future=future)
+        _pending[key] = pending
+        task = asyncio.create_task(_flush_later(chat_id, message_id))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    return pending
+
+
+async def _flush_later(chat_id: int, message_id: int) -> None:
+    if config.CARD_SYNC_DEBOUNCE_SECONDS > 0:
+        await asyncio.sleep(config.CARD_SYNC_DEBOUNCE_SECONDS)
+    else:
+        # Даже без окна даём досрочно склеиться правкам из того же тика
+        await asyncio.sleep(0)
+
+    pending = _pending.pop((chat_id, message_id))
+    try:
+        sent = await _apply(chat_id, message_id, pending)
+    except Exception as e:
+        if not pending.future.done():
+            pending.future.set_exception(e)
+    else:
+        if not pending.future.done():
+            pending.future.set_result(sent)
+
+
+async def _apply(chat_id: int, message_id: int, pending: _PendingEdit) -> bool:
+    key = _key(chat_id, message_id)
+    rendered = _rendered.get(key) or {}
+    markup_hash = _hash(pending.markup)
+    text_hash = _hash(pending.text) if pending.text is not None else None
+
+    text_changed = text_hash is not None and text_hash != rendered.get("text")
+    markup_changed = markup_hash != rendered.get("markup")
+    if not text_changed and not markup_changed:
+        logging.info(f"[card-sync] Сообщение {chat_id}/{message_id} не изменилось, правка пропущена")
+        return False
+
+    try:
+        if text_changed:
+            await send_queue.edit_message_text(
+                pending.bot,
+                chat_id,
+                message_id,
+                pending.text,
+                reply_markup=pending.markup,
+                **pending.text_kwargs,
+            )
+        else:
+            await send_queue.edit_message_reply_markup(
+                pending.bot,
+                chat_id,
+                message_id,
+                reply_markup=pending.markup,
+            )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            forget(chat_id, message_id)
+            raise
+        # Уже в этом состоянии (например, поправил другой экземпляр бота)
+        sent = False
+    else:
+        sent = True
+
+    _rendered.set(
+        key,
+        {"text": text_hash if text_hash is not None else rendered.get("text"), "markup": markup_hash},
+    )
+    return sent
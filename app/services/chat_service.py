@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Optional
 from datetime import datetime
@@ -10,9 +11,13 @@ from aiogram.types import (
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import config
+from app.database.chat_message_models import RequestChatMessage
 from app.database.db import AsyncSessionLocal
 from app.database.models import Request, User, Car, ServiceCenter
+from app.services import card_sync, render_cache, send_queue, service_routing
 
 
 def _format_status(status: Optional[str]) -> str:
@@ -211,7 +216,12 @@ def _format_request_text(
     return text
 
 
-async def create_request_chat(bot: Bot, request_id: int) -> None:
+async def create_request_chat(
+    bot: Bot,
+    request_id: int,
+    session: Optional[AsyncSession] = None,
+    raise_errors: bool = False,
+) -> None:
     """
     Создаёт "карточку заявки" в чате сервиса.
 
@@ -220,146 +230,221 @@ async def create_request_chat(bot: Bot, request_id: int) -> None:
     - отправляем только в чаты, привязанные к ServiceCenter в БД:
         • группа сервиса (manager_chat_id при send_to_group=True)
         • ЛС владельца сервиса (owner_user_id -> User.telegram_id при send_to_owner=True).
+    - во все чаты отправляем параллельно, каждая копия запоминается в
+      request_chat_messages (основная — ещё и в requests.chat_message_id).
+
+    session — сессия апдейта (DbSessionMiddleware): chat_message_id пишется в неё,
+    коммит и обработка ошибок — на вызывающей стороне. Без session открываем свою.
+
+    raise_errors — для outbox: удачные копии сохраняются, а затем ошибка первого
+    чата, куда карточка не ушла, пробрасывается, чтобы диспетчер повторил доставку
+    (уже отправленные копии при повторе пропускаются).
     """
+    if session is not None:
+        await _create_request_chat(bot, session, request_id)
+        return
+
     async with AsyncSessionLocal() as session:
         try:
-            result = await session.execute(
-                select(Request, User, Car, ServiceCenter)
-                .join(User, Request.user_id == User.id)
-                .join(Car, Request.car_id == Car.id, isouter=True)
-                .join(
-                    ServiceCenter,
-                    Request.service_center_id == ServiceCenter.id,
-                    isouter=True,
-                )
-                .where(Request.id == request_id)
-            )
-            row = result.first()
+            failed = await _create_request_chat(bot, session, request_id)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logging.error(f"❌ Ошибка создания чата для заявки #{request_id}: {e}")
+            if raise_errors:
+                raise
+            return
 
-            if not row:
-                logging.error(f"❌ create_request_chat: заявка #{request_id} не найдена")
-                return
+    if failed and raise_errors:
+        raise next(iter(failed.values()))
 
-            request, user, car, service_center = row
 
-            # Жёсткое требование: только из БД, global-чат не используем
-            if not service_center:
-                logging.error(
-                    f"❌ create_request_chat: у заявки #{request_id} нет привязанного автосервиса "
-                    f"(service_center_id IS NULL). Карточка не будет отправлена."
-                )
-                return
+async def _create_request_chat(
+    bot: Bot,
+    session: AsyncSession,
+    request_id: int,
+) -> dict[int, Exception]:
+    """
+    :return: чаты, куда карточку отправить не удалось {chat_id: ошибка}
+    """
+    result = await session.execute(
+        select(Request, User, Car, ServiceCenter)
+        .join(User, Request.user_id == User.id)
+        .join(Car, Request.car_id == Car.id, isouter=True)
+        .join(
+            ServiceCenter,
+            Request.service_center_id == ServiceCenter.id,
+            isouter=True,
+        )
+        .where(Request.id == request_id)
+    )
+    row = result.first()
 
-            primary_chat_id: Optional[int] = None
-            extra_chat_ids: list[int] = []
+    if not row:
+        logging.error(f"❌ create_request_chat: заявка #{request_id} не найдена")
+        return {}
 
-            # Определяем основной и дополнительные каналы для сервиса
-            owner_telegram_id: Optional[int] = None
-            if service_center.owner_user_id:
-                owner_res = await session.execute(
-                    select(User).where(User.id == service_center.owner_user_id)
-                )
-                owner = owner_res.scalar_one_or_none()
-                if owner and owner.telegram_id:
-                    owner_telegram_id = owner.telegram_id
+    request, user, car, service_center = row
 
-            # приоритет: группа → ЛС владельца
-            if service_center.send_to_group and service_center.manager_chat_id:
-                primary_chat_id = service_center.manager_chat_id
+    # Жёсткое требование: только из БД, global-чат не используем
+    if not service_center:
+        logging.error(
+            f"❌ create_request_chat: у заявки #{request_id} нет привязанного автосервиса "
+            f"(service_center_id IS NULL). Карточка не будет отправлена."
+        )
+        return {}
+
+    # Основной и дополнительные каналы для сервиса (кэш маршрутов СТО)
+    route = await service_routing.resolve(service_center.id, session)
+    if route is None or route.primary_chat_id is None:
+        logging.error(
+            f"❌ create_request_chat: не удалось определить чат автосервиса "
+            f"для заявки #{request_id}. "
+            f"service_center.id={service_center.id}, "
+            f"send_to_group={service_center.send_to_group}, "
+            f"manager_chat_id={service_center.manager_chat_id}, "
+            f"send_to_owner={service_center.send_to_owner}, "
+            f"owner_telegram_id={route.owner_telegram_id if route else None}"
+        )
+        return {}
+    primary_chat_id = route.primary_chat_id
 
-            if service_center.send_to_owner and owner_telegram_id:
-                if primary_chat_id is None:
-                    primary_chat_id = owner_telegram_id
-                else:
-                    extra_chat_ids.append(owner_telegram_id)
+    text, keyboard = render_cache.render(
+        request,
+        "chat_card",
+        lambda: _render_chat_card(request, user, car, service_center),
+    )
 
-            if primary_chat_id is None:
-                logging.error(
-                    f"❌ create_request_chat: не удалось определить чат автосервиса "
-                    f"для заявки #{request_id}. "
-                    f"service_center.id={service_center.id}, "
-                    f"send_to_group={service_center.send_to_group}, "
-                    f"manager_chat_id={service_center.manager_chat_id}, "
-                    f"send_to_owner={service_center.send_to_owner}, "
-                    f"owner_telegram_id={owner_telegram_id}"
+    async def _send_to_chat(chat_id: int) -> Optional[int]:
+        """
+        Отправляет карточку заявки в указанный чат.
+        Если есть photo_file_id — пробуем отправить как фото с подписью.
+        При любой ошибке или отсутствии фото отправляем обычный текст.
+        """
+        msg = None
+        file_id = request.photo_file_id or None
+
+        if file_id:
+            try:
+                msg = await send_queue.send_photo(
+                    bot,
+                    chat_id,
+                    file_id,
+                    caption=text,
+                    reply_markup=keyboard,
+                    parse_mode="HTML",
                 )
-                return
-
-            text = _format_request_text(request, user, car, service_center)
-            keyboard = _build_chat_keyboard(request)
-
-            # Кнопка для менеджера: написать клиенту в Telegram (без показа номера)
-            if user.telegram_id:
-                keyboard.inline_keyboard.append(
-                    [
-                        InlineKeyboardButton(
-                            text="📩 Написать клиенту",
-                            url=f"tg://user?id={user.telegram_id}",
-                        )
-                    ]
+            except Exception as e:
+                logging.error(
+                    f"❌ Ошибка отправки фото в чат {chat_id} для заявки #{request_id}: {e}"
                 )
-
-            async def _send_to_chat(chat_id: int) -> Optional[int]:
-                """
-                Отправляет карточку заявки в указанный чат.
-                Если есть photo_file_id — пробуем отправить как фото с подписью.
-                При любой ошибке или отсутствии фото отправляем обычный текст.
-                """
                 msg = None
-                file_id = request.photo_file_id or None
-
-                if file_id:
-                    try:
-                        msg = await bot.send_photo(
-                            chat_id=chat_id,
-                            photo=file_id,
-                            caption=text,
-                            reply_markup=keyboard,
-                            parse_mode="HTML",
-                        )
-                    except Exception as e:
-                        logging.error(
-                            f"❌ Ошибка отправки фото в чат {chat_id} для заявки #{request_id}: {e}"
-                        )
-                        msg = None
-
-                if msg is None:
-                    # Фоллбек на обычное сообщение
-                    msg = await bot.send_message(
-                        chat_id=chat_id,
-                        text=text,
-                        reply_markup=keyboard,
-                        parse_mode="HTML",
-                        link_preview_options=LinkPreviewOptions(is_disabled=True),
-                    )
-
-                return msg.message_id
-
-            # Отправляем в основной канал
-            primary_msg_id = await _send_to_chat(primary_chat_id)
-            if primary_msg_id:
-                request.chat_message_id = primary_msg_id
-                await session.commit()
-                logging.info(
-                    f"✅ Чат для заявки #{request_id} создан и сообщение отправлено "
-                    f"(chat_id={primary_chat_id}, msg_id={primary_msg_id})"
+
+        if msg is None:
+            # Фоллбек на обычное сообщение
+            msg = await send_queue.send_message(
+                bot,
+                chat_id,
+                text,
+                priority=send_queue.PRIORITY_SERVICE,
+                reply_markup=keyboard,
+                parse_mode="HTML",
+                link_preview_options=LinkPreviewOptions(is_disabled=True),
+            )
+
+        return msg.message_id
+
+    # Повторная доставка (например, из outbox) не дублирует уже отправленные копии
+    existing = await session.execute(
+        select(RequestChatMessage.chat_id).where(RequestChatMessage.request_id == request_id)
+    )
+    sent_chat_ids = set(existing.scalars().all())
+    chat_ids = [
+        chat_id
+        for chat_id in route.chat_ids
+        if chat_id not in sent_chat_ids
+    ]
+    if not chat_ids:
+        logging.info(f"ℹ️ Карточка заявки #{request_id} уже есть во всех чатах сервиса")
+        return {}
+
+    # Во все чаты сразу: новая заявка ждёт самый медленный чат, а не сумму
+    results = await _gather_bounded([_send_to_chat(chat_id) for chat_id in chat_ids])
+
+    failed: dict[int, Exception] = {}
+    for chat_id, result in zip(chat_ids, results):
+        is_primary = chat_id == primary_chat_id
+        if isinstance(result, Exception) or not result:
+            logging.error(
+                f"❌ Не удалось отправить карточку заявки #{request_id} в чат {chat_id}: {result}"
+            )
+            failed[chat_id] = (
+                result
+                if isinstance(result, Exception)
+                else RuntimeError(f"карточка заявки #{request_id} не отправлена в чат {chat_id}")
+            )
+            continue
+
+        session.add(
+            RequestChatMessage(
+                request_id=request_id,
+                chat_id=chat_id,
+                message_id=result,
+                is_primary=is_primary,
+            )
+        )
+        card_sync.remember(chat_id, result, markup=keyboard)
+        if is_primary:
+            request.chat_message_id = result
+            logging.info(
+                f"✅ Чат для заявки #{request_id} создан и сообщение отправлено "
+                f"(chat_id={chat_id}, msg_id={result})"
+            )
+        else:
+            logging.info(
+                f"ℹ️ Дополнительно отправлена копия заявки #{request_id} в чат {chat_id}"
+            )
+    await session.flush()
+    return failed
+
+
+def _render_chat_card(
+    request: Request,
+    user: User,
+    car: Optional[Car],
+    service_center: ServiceCenter,
+) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Текст и клавиатура карточки заявки для чата сервиса.
+    """
+    text = _format_request_text(request, user, car, service_center)
+    keyboard = _build_chat_keyboard(request)
+
+    # Кнопка для менеджера: написать клиенту в Telegram (без показа номера)
+    if user.telegram_id:
+        keyboard.inline_keyboard.append(
+            [
+                InlineKeyboardButton(
+                    text="📩 Написать клиенту",
+                    url=f"tg://user?id={user.telegram_id}",
                 )
+            ]
+        )
+    return text, keyboard
 
-            # Дополнительно — дублируем в остальные каналы (без сохранения message_id)
-            for chat_id in extra_chat_ids:
-                try:
-                    await _send_to_chat(chat_id)
-                    logging.info(
-                        f"ℹ️ Дополнительно отправлена копия заявки #{request_id} в чат {chat_id}"
-                    )
-                except Exception as e:
-                    logging.error(
-                        f"❌ Не удалось отправить копию заявки #{request_id} в чат {chat_id}: {e}"
-                    )
 
-        except Exception as e:
-            await session.rollback()
-            logging.error(f"❌ Ошибка создания чата для заявки #{request_id}: {e}")
+async def _gather_bounded(coros: list) -> list:
+    """
+    asyncio.gather не больше чем по REQUEST_CHAT_CONCURRENCY одновременно;
+    исключения возвращаются вместо результатов.
+    """
+    semaphore = asyncio.Semaphore(config.REQUEST_CHAT_CONCURRENCY)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=True)
 
 
 # app/services/chat_service.py
@@ -373,81 +458,119 @@ from app.database.db import AsyncSessionLocal
 from app.database.models import Request, ServiceCenter, User
 
 
-async def update_chat_keyboard(bot: Bot, request_id: int) -> None:
+async def update_chat_keyboard(
+    bot: Bot,
+    request_id: int,
+    session: Optional[AsyncSession] = None,
+    raise_errors: bool = False,
+) -> None:
     """
-    Обновляет inline-клавиатуру под карточкой заявки в основном чате сервиса.
+    Обновляет inline-клавиатуру под всеми копиями карточки заявки в чатах сервиса.
 
     Логика:
     * Находим заявку и привязанный к ней автосервис.
-    * Определяем основной чат сервиса (аналогично create_request_chat):
+    * Берём копии карточки из request_chat_messages.
+    * Для старых заявок без записей — основной чат сервиса (аналогично create_request_chat):
         - если send_to_group и есть manager_chat_id → используем его;
         - иначе, если send_to_owner и у владельца есть telegram_id → используем его;
-        - иначе логируем предупреждение и выходим.
-    * Берём сохранённый request.chat_message_id и делаем edit_message_reply_markup.
+        - иначе логируем предупреждение и выходим;
+      и сохранённый request.chat_message_id.
+    * Делаем edit_message_reply_markup во всех копиях параллельно.
+
+    session — сессия апдейта (DbSessionMiddleware), чтобы не открывать ещё одну;
+    в ней видны и незакоммиченные изменения заявки.
+
+    raise_errors — для outbox: ошибка правки пробрасывается, чтобы диспетчер
+    повторил доставку ("message is not modified" ошибкой не считается).
     """
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Request, ServiceCenter)
-            .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
-            .where(Request.id == request_id)
-        )
-        row = result.first()
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            target = await _resolve_chat_keyboard(session, request_id)
+    else:
+        target = await _resolve_chat_keyboard(session, request_id)
 
-        if not row:
-            logging.warning(f"⚠️ update_chat_keyboard: заявка #{request_id} не найдена")
-            return
+    if target is None:
+        return
+    request, messages, keyboard = target
 
-        request, service_center = row
+    logging.info(
+        f"🔧 update_chat_keyboard #{request.id}, status={request.status}, "
+        f"chats={[chat_id for chat_id, _ in messages]}"
+    )
 
-        if not request.chat_message_id:
-            logging.warning(
-                f"⚠️ update_chat_keyboard: у заявки #{request.id} нет chat_message_id, нечего обновлять"
+    async def _edit(chat_id: int, message_id: int) -> None:
+        try:
+            # Склейка частых правок и пропуск неизменившейся клавиатуры
+            await card_sync.edit_reply_markup(bot, chat_id, message_id, keyboard)
+        except Exception as e:
+            logging.info(
+                f"ℹ️ Клавиатура для заявки #{request.id} в чате {chat_id} уже актуальна "
+                f"или не может быть обновлена: {e}"
             )
-            return
+            if raise_errors:
+                raise
 
-        # Определяем основной чат сервиса
-        primary_chat_id: Optional[int] = None
-        if service_center is not None:
-            owner_telegram_id: Optional[int] = None
-            if service_center.owner_user_id:
-                # Получаем владельца сервиса
-                owner_res = await session.execute(
-                    select(User).where(User.id == service_center.owner_user_id)
-                )
-                owner = owner_res.scalar_one_or_none()
-                if owner and owner.telegram_id:
-                    owner_telegram_id = owner.telegram_id
-
-            # приоритет: группа → ЛС владельца
-            if service_center.send_to_group and service_center.manager_chat_id:
-                primary_chat_id = service_center.manager_chat_id
-            elif service_center.send_to_owner and owner_telegram_id:
-                primary_chat_id = owner_telegram_id
-
-        if primary_chat_id is None:
-            logging.warning(
-                "⚠️ update_chat_keyboard: не удалось определить чат автосервиса для заявки "
-                f"#{request.id}. Клавиатура не будет обновлена."
-            )
-            return
+    # Все копии карточки — параллельно
+    results = await _gather_bounded([_edit(chat_id, message_id) for chat_id, message_id in messages])
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors and raise_errors:
+        raise errors[0]
 
-        keyboard = _build_request_keyboard(request, service_center)
 
-    logging.info(
-        f"🔧 update_chat_keyboard #{request.id}, status={request.status}, chat_id={primary_chat_id}"
+async def _resolve_chat_keyboard(
+    session: AsyncSession,
+    request_id: int,
+) -> Optional[tuple[Request, list[tuple[int, int]], InlineKeyboardMarkup]]:
+    """
+    (заявка, копии карточки [(chat_id, message_id)], клавиатура) или None,
+    если обновлять нечего.
+    """
+    result = await session.execute(
+        select(Request, ServiceCenter)
+        .outerjoin(ServiceCenter, Request.service_center_id == ServiceCenter.id)
+        .where(Request.id == request_id)
+    )
+    row = result.first()
+
+    if not row:
+        logging.warning(f"⚠️ update_chat_keyboard: заявка #{request_id} не найдена")
+        return None
+
+    request, service_center = row
+    keyboard = render_cache.render(
+        request,
+        "service_keyboard",
+        lambda: _build_request_keyboard(request, service_center),
     )
 
-    try:
-        await bot.edit_message_reply_markup(
-            chat_id=primary_chat_id,
-            message_id=request.chat_message_id,
-            reply_markup=keyboard,
+    copies = await session.execute(
+        select(RequestChatMessage.chat_id, RequestChatMessage.message_id)
+        .where(RequestChatMessage.request_id == request.id)
+        .order_by(RequestChatMessage.is_primary.desc(), RequestChatMessage.id)
+    )
+    messages = [(chat_id, message_id) for chat_id, message_id in copies.all()]
+    if messages:
+        return request, messages, keyboard
+
+    # Заявки до request_chat_messages: только основная карточка
+    if not request.chat_message_id:
+        logging.warning(
+            f"⚠️ update_chat_keyboard: у заявки #{request.id} нет chat_message_id, нечего обновлять"
         )
-    except Exception as e:
-        # Например: 'message is not modified'
-        logging.info(
-            f"ℹ️ Клавиатура для заявки #{request.id} уже актуальна или не может быть обновлена: {e}"
+        return None
+
+    # Основной чат сервиса (кэш маршрутов СТО)
+    route = await service_routing.resolve(request.service_center_id, session)
+    primary_chat_id = route.primary_chat_id if route else None
+
+    if primary_chat_id is None:
+        logging.warning(
+            "⚠️ update_chat_keyboard: не удалось определить чат автосервиса для заявки "
+            f"#{request.id}. Клавиатура не будет обновлена."
         )
+        return None
+
+    return request, [(primary_chat_id, request.chat_message_id)], keyboard
 
 
 def _build_request_keyboard(
@@ -1,4 +1,6 @@
 import logging
+from typing import Optional
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database.models import Request, User
@@ -6,17 +8,26 @@ from app.database.comment_models import Comment
 from app.database.db import AsyncSessionLocal
 
 
-async def add_comment(request_id: int, user_id: int, message: str, is_manager: bool = False):
-    """Добавляет комментарий к заявке"""
+async def add_comment(
+    request_id: int,
+    user_id: int,
+    message: str,
+    is_manager: bool = False,
+    session: Optional[AsyncSession] = None,
+):
+    """
+    Добавляет комментарий к заявке.
+    С session (сессия апдейта) — только flush, коммит делает вызывающий.
+    """
+    if session is not None:
+        session.add(_new_comment(request_id, user_id, message, is_manager))
+        await session.flush()
+        logging.info(f"✅ Комментарий добавлен к заявке #{request_id}")
+        return True
+
     async with AsyncSessionLocal() as session:
         try:
-            comment = Comment(
-                request_id=request_id,
-                user_id=user_id,
-                message=message,
-                is_manager=is_manager
-            )
-            session.add(comment)
+            session.add(_new_comment(request_id, user_id, message, is_manager))
             await session.commit()
             logging.info(f"✅ Комментарий добавлен к заявке #{request_id}")
             return True
@@ -26,17 +37,33 @@ async def add_comment(request_id: int, user_id: int, message: str, is_manager: b
             return False
 
 
-async def get_comments(request_id: int):
+def _new_comment(request_id: int, user_id: int, message: str, is_manager: bool) -> Comment:
+    return Comment(
+        request_id=request_id,
+        user_id=user_id,
+        message=message,
+        is_manager=is_manager
+    )
+
+
+async def get_comments(request_id: int, session: Optional[AsyncSession] = None):
     """Получает все комментарии заявки"""
+    if session is not None:
+        return await _select_comments(session, request_id)
+
     async with AsyncSessionLocal() as session:
         try:
-            result = await session.execute(
-                select(Comment, User)
-                .join(User, Comment.user_id == User.id)
-                .where(Comment.request_id == request_id)
-                .order_by(Comment.created_at.asc())
-            )
-            return result.all()
+            return await _select_comments(session, request_id)
         except Exception as e:
             logging.error(f"❌ Ошибка получения комментариев: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+async def _select_comments(session: AsyncSession, request_id: int):
+    result = await session.execute(
+        select(Comment, User)
+        .join(User, Comment.user_id == User.id)
+        .where(Comment.request_id == request_id)
+        .order_by(Comment.created_at.asc())
+    )
+    return result.all()
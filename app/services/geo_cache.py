@@ -0,0 +1,430 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from math import floor
+from typing import Awaitable, Callable, Optional
+
+from redis.asyncio import Redis
+
+from app.config import config
+from app.database.models import ServiceCenter
+from app.services.geo_index import bounding_box, haversine_km
+
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Точность геохеша для инвалидации (≈ 20 x 20 км в средних широтах).
+# Запись кэша помечается всеми такими ячейками, которые задевает её круг поиска.
+_COVER_PRECISION = 4
+# Если ячеек слишком много (огромный радиус / полюс) — помечаем запись общим тегом
+_MAX_COVER_CELLS = 512
+_ALL_CELLS = "*"
+
+_REDIS_PREFIX = "geo_cache"
+
+ComputeFn = Callable[
+    [float, float, float, Optional[str]],
+    Awaitable[list[tuple[ServiceCenter, float]]],
+]
+
+
+# ---------------------------------------------------------------------------
+# Геохеш
+# ---------------------------------------------------------------------------
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+
+    chars: list[str] = []
+    ch = 0
+    bit = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = ch * 2 + 1
+                lon_lo = mid
+            else:
+                ch = ch * 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = ch * 2 + 1
+                lat_lo = mid
+            else:
+                ch = ch * 2
+                lat_hi = mid
+
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[ch])
+            ch = 0
+            bit = 0
+
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> tuple[float, float, float, float]:
+    """
+    Границы ячейки: (min_lat, max_lat, min_lon, max_lon).
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+
+    even = True
+    for c in geohash:
+        ch = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (ch >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+def _cell_size(precision: int) -> tuple[float, float]:
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _cover_cells(lat: float, lon: float, radius_km: float) -> set[str]:
+    """
+    Ячейки инвалидации, пересекающие bounding box круга.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+    if not lon_ranges:
+        return {_ALL_CELLS}
+
+    dlat, dlon = _cell_size(_COVER_PRECISION)
+    rows = range(int(floor((min_lat + 90.0) / dlat)), int(floor((max_lat + 90.0) / dlat)) + 1)
+    cols = {
+        c
+        for lo, hi in lon_ranges
+        for c in range(int(floor((lo + 180.0) / dlon)), int(floor((hi + 180.0) / dlon)) + 1)
+    }
+    if len(rows) * len(cols) > _MAX_COVER_CELLS:
+        return {_ALL_CELLS}
+
+    lon_cells = int(round(360.0 / dlon))
+    cells = set()
+    for row in rows:
+        cell_lat = min(-90.0 + (row + 0.5) * dlat, 90.0)
+        for col in cols:
+            cell_lon = -180.0 + ((col % lon_cells) + 0.5) * dlon
+            cells.add(geohash_encode(cell_lat, cell_lon, _COVER_PRECISION))
+    return cells
+
+
+def _cell_center_and_pad(geohash: str) -> tuple[float, float, float]:
+    """
+    Центр ячейки ключа и радиус, покрывающий любую точку ячейки.
+    """
+    min_lat, max_lat, min_lon, max_lon = geohash_bounds(geohash)
+    c_lat = (min_lat + max_lat) / 2
+    c_lon = (min_lon + max_lon) / 2
+    pad = max(
+        haversine_km(c_lat, c_lon, corner_lat, corner_lon)
+        for corner_lat in (min_lat, max_lat)
+        for corner_lon in (min_lon, max_lon)
+    )
+    return c_lat, c_lon, pad * 1.01 + 0.01
+
+
+# ---------------------------------------------------------------------------
+# Хранилища
+# ---------------------------------------------------------------------------
+
+class LRUCache:
+    """
+    Простой LRU на OrderedDict с TTL записей.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: int):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[dict]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+_local = LRUCache(config.GEO_CACHE_SIZE, config.GEO_CACHE_TTL_SECONDS)
+
+# Без Redis версии ячеек и последние известные позиции сервисов живут в процессе
+_local_versions: dict[str, int] = {}
+_local_positions: dict[int, str] = {}
+
+_redis: Optional[Redis] = None
+
+_stats = {
+    "hits_local": 0,
+    "hits_redis": 0,
+    "misses": 0,
+    "invalidations": 0,
+}
+
+
+def _get_redis() -> Optional[Redis]:
+    global _redis
+    if not config.GEO_CACHE_REDIS:
+        return None
+    if _redis is None:
+        _redis = Redis.from_url(config.REDIS_URL)
+    return _redis
+
+
+async def close_redis() -> None:
+    """
+    Закрывает соединение с Redis (при остановке бота).
+    """
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+async def _get_versions(cells: set[str]) -> dict[str, int]:
+    cells = sorted(cells)
+
+    redis = _get_redis()
+    if redis is not None:
+        try:
+            values = await redis.hmget(f"{_REDIS_PREFIX}:versions", cells)
+            return {cell: int(v or 0) for cell, v in zip(cells, values)}
+        except Exception as e:
+            logging.warning(f"[geo_cache] Redis недоступен, версии из памяти: {e}")
+
+    return {cell: _local_versions.get(cell, 0) for cell in cells}
+
+
+async def _bump_versions(cells: set[str]) -> None:
+    for cell in cells:
+        _local_versions[cell] = _local_versions.get(cell, 0) + 1
+
+    redis = _get_redis()
+    if redis is None:
+        return
+    try:
+        pipe = redis.pipeline()
+        for cell in cells:
+            pipe.hincrby(f"{_REDIS_PREFIX}:versions", cell, 1)
+        await pipe.execute()
+    except Exception as e:
+        logging.warning(f"[geo_cache] Не удалось инвалидировать ячейки в Redis: {e}")
+
+
+async def _redis_get_entry(key: str) -> Optional[dict]:
+    redis = _get_redis()
+    if redis is None:
+        return None
+    try:
+        raw = await redis.get(f"{_REDIS_PREFIX}:entry:{key}")
+    except Exception as e:
+        logging.warning(f"[geo_cache] Ошибка чтения из Redis: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+async def _redis_set_entry(key: str, entry: dict) -> None:
+    redis = _get_redis()
+    if redis is None:
+        return
+    try:
+        await redis.set(
+            f"{_REDIS_PREFIX}:entry:{key}",
+            json.dumps(entry),
+            ex=config.GEO_CACHE_TTL_SECONDS or None,
+        )
+    except Exception as e:
+        logging.warning(f"[geo_cache] Ошибка записи в Redis: {e}")
+
+
+async def _remember_positions(rows: list[dict]) -> None:
+    """
+    Запоминаем ячейку каждого сервиса из записи: при его переезде
+    нужно сбросить и записи, покрывающие старую позицию.
+    """
+    positions = {
+        row["id"]: geohash_encode(row["location_lat"], row["location_lon"], _COVER_PRECISION)
+        for row in rows
+    }
+    if not positions:
+        return
+
+    _local_positions.update(positions)
+
+    redis = _get_redis()
+    if redis is None:
+        return
+    try:
+        await redis.hset(
+            f"{_REDIS_PREFIX}:positions",
+            mapping={str(sc_id): cell for sc_id, cell in positions.items()},
+        )
+    except Exception as e:
+        logging.warning(f"[geo_cache] Ошибка записи позиций в Redis: {e}")
+
+
+async def _pop_position(sc_id: int) -> Optional[str]:
+    cell = _local_positions.pop(sc_id, None)
+
+    redis = _get_redis()
+    if redis is None:
+        return cell
+    try:
+        raw = await redis.hget(f"{_REDIS_PREFIX}:positions", str(sc_id))
+        await redis.hdel(f"{_REDIS_PREFIX}:positions", str(sc_id))
+    except Exception as e:
+        logging.warning(f"[geo_cache] Ошибка чтения позиций из Redis: {e}")
+        return cell
+    return raw.decode() if raw else cell
+
+
+# ---------------------------------------------------------------------------
+# Публичное API
+# ---------------------------------------------------------------------------
+
+def _sc_to_row(sc: ServiceCenter) -> dict:
+    return {column.key: getattr(sc, column.key) for column in ServiceCenter.__table__.columns}
+
+
+def _rows_to_result(
+    rows: list[dict], lat: float, lon: float, radius_km: float
+) -> list[tuple[ServiceCenter, float]]:
+    """
+    Точная отсечка по реальной точке пользователя — ответ такой же, как без кэша.
+    """
+    nearby: list[tuple[ServiceCenter, float]] = []
+    for row in rows:
+        dist = haversine_km(lat, lon, row["location_lat"], row["location_lon"])
+        if dist <= radius_km:
+            nearby.append((ServiceCenter(**row), dist))
+
+    nearby.sort(key=lambda x: x[1])
+    return nearby
+
+
+async def _is_fresh(entry: dict) -> bool:
+    stored = entry["versions"]
+    current = await _get_versions(set(stored))
+    return all(current.get(cell, 0) == version for cell, version in stored.items())
+
+
+async def find_cached(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    category_code: Optional[str],
+    compute: ComputeFn,
+) -> list[tuple[ServiceCenter, float]]:
+    """
+    Результат гео-поиска через кэш.
+
+    Ключ — (геохеш точки, радиус, категория). При промахе compute вызывается
+    для центра ячейки с радиусом, расширенным на размер ячейки, а в кэш
+    кладутся строки сервисов. Любой запрос из той же ячейки потом отсекается
+    по своей точной точке без обращения к БД.
+    """
+    if not config.GEO_CACHE_ENABLED:
+        return await compute(lat, lon, radius_km, category_code)
+
+    geohash = geohash_encode(lat, lon, config.GEO_CACHE_PRECISION)
+    key = f"{geohash}:{radius_km:g}:{category_code or '*'}"
+
+    entry = _local.get(key)
+    if entry is not None:
+        if await _is_fresh(entry):
+            _stats["hits_local"] += 1
+            return _rows_to_result(entry["rows"], lat, lon, radius_km)
+        _local.pop(key)
+
+    entry = await _redis_get_entry(key)
+    if entry is not None and await _is_fresh(entry):
+        _stats["hits_redis"] += 1
+        _local.set(key, entry)
+        return _rows_to_result(entry["rows"], lat, lon, radius_km)
+
+    _stats["misses"] += 1
+
+    c_lat, c_lon, pad = _cell_center_and_pad(geohash)
+    # Версии берём ДО запроса в БД: если сервис изменится во время запроса,
+    # запись сразу окажется устаревшей
+    versions = await _get_versions(_cover_cells(c_lat, c_lon, radius_km + pad))
+
+    found = await compute(c_lat, c_lon, radius_km + pad, category_code)
+    rows = [_sc_to_row(sc) for sc, _ in found]
+
+    entry = {"rows": rows, "versions": versions}
+    _local.set(key, entry)
+    await _redis_set_entry(key, entry)
+    await _remember_positions(rows)
+
+    return _rows_to_result(rows, lat, lon, radius_km)
+
+
+async def invalidate_service_center(sc: ServiceCenter) -> None:
+    """
+    Сервис изменился — сбрасываем записи, покрывающие его старую и новую позицию.
+    """
+    if not config.GEO_CACHE_ENABLED or sc.id is None:
+        return
+
+    # Общий тег сбрасывает только "глобальные" записи (полюс / огромный радиус)
+    cells = {_ALL_CELLS}
+
+    old_cell = await _pop_position(sc.id)
+    if old_cell:
+        cells.add(old_cell)
+
+    if sc.location_lat is not None and sc.location_lon is not None:
+        cells.add(geohash_encode(sc.location_lat, sc.location_lon, _COVER_PRECISION))
+
+    await _bump_versions(cells)
+    _stats["invalidations"] += 1
+
+
+def stats() -> dict[str, int]:
+    """
+    Счётчики попаданий / промахов (для админки и логов).
+    """
+    return {**_stats, "local_size": len(_local)}
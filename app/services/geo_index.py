@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from math import radians, sin, cos, sqrt, atan2, floor, pi
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter
+
+
+EARTH_RADIUS_KM = 6371.0
+
+# Сколько километров в одном градусе дуги на той же сфере, что и haversine_km
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * pi / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Расстояние между двумя точками по сфере (приблизительно по Земле) в километрах.
+    """
+    lat1_r = radians(lat1)
+    lon1_r = radians(lon1)
+    lat2_r = radians(lat2)
+    lon2_r = radians(lon2)
+
+    dlat = lat2_r - lat1_r
+    dlon = lon2_r - lon1_r
+
+    a = sin(dlat / 2) ** 2 + cos(lat1_r) * cos(lat2_r) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def bounding_box(
+    lat: float, lon: float, radius_km: float
+) -> tuple[float, float, list[tuple[float, float]]]:
+    """
+    Bounding box круга радиуса radius_km вокруг точки.
+
+    Возвращает (min_lat, max_lat, диапазоны долготы).
+    Пустой список диапазонов — долготу не ограничиваем (круг задевает полюс).
+    При переходе через 180-й меридиан диапазонов будет два.
+    """
+    dlat = radius_km / KM_PER_DEG_LAT
+    min_lat = max(lat - dlat, -90.0)
+    max_lat = min(lat + dlat, 90.0)
+
+    cos_lat = cos(radians(min(abs(lat) + dlat, 90.0)))
+    if cos_lat <= 1e-9:
+        return min_lat, max_lat, []
+
+    dlon = radius_km / (KM_PER_DEG_LAT * cos_lat)
+    if dlon >= 180.0:
+        return min_lat, max_lat, []
+
+    min_lon = lon - dlon
+    max_lon = lon + dlon
+    if min_lon < -180.0:
+        return min_lat, max_lat, [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+    if max_lon > 180.0:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+class GeoGridIndex:
+    """
+    Простой пространственный индекс по сетке широта/долгота.
+
+    Вся поверхность делится на ячейки размером cell_deg x cell_deg градусов,
+    каждый ServiceCenter попадает ровно в одну ячейку. Поиск по радиусу
+    просматривает только ячейки, пересекающие bounding box круга, поэтому
+    стоимость запроса зависит от плотности сервисов рядом, а не от их общего числа.
+    """
+
+    def __init__(self, cell_deg: float = 0.1):
+        self.cell_deg = cell_deg
+        self._lon_cells = int(round(360 / cell_deg))
+        self._cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = {}
+        self._points: dict[int, tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell_of(self, lat: float, lon: float) -> tuple[int, int]:
+        row = int(floor((lat + 90.0) / self.cell_deg))
+        col = int(floor((lon + 180.0) / self.cell_deg)) % self._lon_cells
+        return row, col
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._points.clear()
+
+    def upsert(self, sc_id: int, lat: float, lon: float) -> None:
+        """
+        Добавляет сервис в индекс или переносит его в новую ячейку.
+        """
+        self.remove(sc_id)
+        cell = self._cell_of(lat, lon)
+        self._cells.setdefault(cell, {})[sc_id] = (lat, lon)
+        self._points[sc_id] = cell
+
+    def remove(self, sc_id: int) -> None:
+        cell = self._points.pop(sc_id, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(sc_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _cells_in_box(self, lat: float, lon: float, radius_km: float):
+        """
+        Ячейки, пересекающие bounding box круга радиуса radius_km.
+        Учитываем переход через 180-й меридиан и близость к полюсам.
+        """
+        min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+        min_row = int(floor((min_lat + 90.0) / self.cell_deg))
+        max_row = int(floor((max_lat + 90.0) / self.cell_deg))
+
+        if not lon_ranges:
+            cols = range(self._lon_cells)
+        else:
+            cols = sorted(
+                {
+                    c % self._lon_cells
+                    for lo, hi in lon_ranges
+                    for c in range(
+                        int(floor((lo + 180.0) / self.cell_deg)),
+                        int(floor((hi + 180.0) / self.cell_deg)) + 1,
+                    )
+                }
+            )
+
+        for row in range(min_row, max_row + 1):
+            for col in cols:
+                yield row, col
+
+    def query_radius(
+        self, lat: float, lon: float, radius_km: float
+    ) -> list[tuple[int, float]]:
+        """
+        Все сервисы в радиусе radius_km: список (sc_id, расстояние), по возрастанию расстояния.
+        """
+        found: list[tuple[int, float]] = []
+        for cell in self._cells_in_box(lat, lon, radius_km):
+            bucket = self._cells.get(cell)
+            if not bucket:
+                continue
+            for sc_id, (sc_lat, sc_lon) in bucket.items():
+                dist = haversine_km(lat, lon, sc_lat, sc_lon)
+                if dist <= radius_km:
+                    found.append((sc_id, dist))
+
+        found.sort(key=lambda x: x[1])
+        return found
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        max_radius_km: Optional[float] = None,
+    ) -> list[tuple[int, float]]:
+        """
+        k ближайших сервисов. Радиус поиска удваивается, пока не наберём k точек
+        (или пока не упрёмся в max_radius_km / половину окружности Земли).
+        """
+        if k <= 0 or not self._points:
+            return []
+
+        limit = max_radius_km if max_radius_km is not None else 20038.0
+        radius = min(self.cell_deg * KM_PER_DEG_LAT, limit)
+
+        while True:
+            found = self.query_radius(lat, lon, radius)
+            if len(found) >= k or radius >= limit:
+                return found[:k]
+            radius = min(radius * 2, limit)
+
+
+# Общий индекс процесса
+_index = GeoGridIndex(cell_deg=config.GEO_INDEX_CELL_DEG)
+_loaded_at: Optional[float] = None
+_load_lock = asyncio.Lock()
+
+
+def _is_indexable(sc: ServiceCenter) -> bool:
+    """
+    В индекс попадают только "живые" сервисы (есть владелец) с координатами.
+    """
+    return (
+        sc.owner_user_id is not None
+        and sc.location_lat is not None
+        and sc.location_lon is not None
+    )
+
+
+async def _ensure_loaded() -> None:
+    """
+    Ленивая загрузка индекса из БД.
+
+    Дополнительно индекс полностью перестраивается раз в GEO_INDEX_REFRESH_SECONDS,
+    чтобы подхватывать изменения, сделанные другими экземплярами бота.
+    """
+    global _loaded_at
+
+    refresh = config.GEO_INDEX_REFRESH_SECONDS
+    if _loaded_at is not None and (refresh <= 0 or time.monotonic() - _loaded_at < refresh):
+        return
+
+    async with _load_lock:
+        if _loaded_at is not None and (refresh <= 0 or time.monotonic() - _loaded_at < refresh):
+            return
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(
+                    ServiceCenter.id,
+                    ServiceCenter.location_lat,
+                    ServiceCenter.location_lon,
+                ).where(
+                    ServiceCenter.owner_user_id.isnot(None),
+                    ServiceCenter.location_lat.is_not(None),
+                    ServiceCenter.location_lon.is_not(None),
+                )
+            )
+            rows = result.all()
+
+        _index.clear()
+        for sc_id, lat, lon in rows:
+            _index.upsert(sc_id, lat, lon)
+
+        _loaded_at = time.monotonic()
+        logging.info(f"[geo] Индекс сервисов перестроен: {len(_index)} точек")
+
+
+async def find_nearby(lat: float, lon: float, radius_km: float) -> list[tuple[int, float]]:
+    """
+    id сервисов в радиусе radius_km от точки и расстояния до них (по возрастанию).
+    """
+    await _ensure_loaded()
+    return _index.query_radius(lat, lon, radius_km)
+
+
+async def find_nearest(
+    lat: float,
+    lon: float,
+    k: int,
+    max_radius_km: Optional[float] = None,
+) -> list[tuple[int, float]]:
+    """
+    k ближайших сервисов к точке (опционально — не дальше max_radius_km).
+    """
+    await _ensure_loaded()
+    return _index.nearest(lat, lon, k, max_radius_km)
+
+
+def sync_service_center(sc: ServiceCenter) -> None:
+    """
+    Инкрементально обновляет индекс после изменения ServiceCenter
+    (координаты, владелец). Вызывать после успешного commit.
+    """
+    if sc.id is None:
+        return
+
+    if _is_indexable(sc):
+        _index.upsert(sc.id, sc.location_lat, sc.location_lon)
+    else:
+        _index.remove(sc.id)
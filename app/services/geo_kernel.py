@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Sequence
+
+from sqlalchemy import select
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter
+from app.services.geo_index import EARTH_RADIUS_KM, haversine_km
+from app.services.specializations import category_bit, specialization_mask
+
+try:
+    import numpy as np
+except ImportError:  # numpy не установлен — считаем тем же циклом по haversine_km
+    np = None
+
+
+# Допуск векторного прохода. numpy считает sin/cos/arctan2 своими реализациями,
+# и результат может отличаться от math на несколько ULP. Поэтому векторно
+# отбираем кандидатов с небольшим запасом, а итоговые расстояния считаем
+# haversine_km — ответ совпадает со скалярным циклом один в один.
+_RTOL = 1e-9
+_ATOL_KM = 1e-6
+
+# Маска "универсального" сервиса (specializations IS NULL) — подходит под любую категорию
+_ALL_SPECS = -1
+
+# Строка снапшота: id, lat, lon, rating, ratings_count, specializations
+# (lat / lon = None — у сервиса нет координат, в гео-запросы он не попадает)
+SnapshotRow = tuple[int, Optional[float], Optional[float], Optional[float], Optional[int], Optional[str]]
+
+
+def _coord(value: Optional[float]) -> float:
+    return float("nan") if value is None else value
+
+
+class ServiceSnapshot:
+    """
+    Колоночный снапшот активных СТО для пакетных гео-запросов.
+
+    Все данные лежат в numpy-массивах (id, широта/долгота в радианах, рейтинг,
+    маска специализаций), так что расстояния и фильтры по радиусу, категории
+    и рейтингу считаются одним векторным проходом вместо цикла по сервисам.
+    """
+
+    def __init__(self, rows: Sequence[SnapshotRow]):
+        self.rows = list(rows)
+
+        if np is None:
+            return
+
+        n = len(self.rows)
+        self.ids = np.fromiter((r[0] for r in self.rows), dtype=np.int64, count=n)
+        self.lat_r = np.radians(
+            np.fromiter((_coord(r[1]) for r in self.rows), dtype=np.float64, count=n)
+        )
+        self.lon_r = np.radians(
+            np.fromiter((_coord(r[2]) for r in self.rows), dtype=np.float64, count=n)
+        )
+        self.has_geo = ~(np.isnan(self.lat_r) | np.isnan(self.lon_r))
+        self.cos_lat = np.cos(self.lat_r)
+        self.rating = np.fromiter(
+            (r[3] if r[3] is not None else 0.0 for r in self.rows),
+            dtype=np.float64,
+            count=n,
+        )
+        self.ratings_count = np.fromiter(
+            (r[4] or 0 for r in self.rows), dtype=np.int64, count=n
+        )
+        self.spec_mask = np.fromiter(
+            (_ALL_SPECS if r[5] is None else specialization_mask(r[5]) for r in self.rows),
+            dtype=np.int64,
+            count=n,
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def distances(self, lat: float, lon: float):
+        """
+        Расстояния (км) от точки до всех сервисов снапшота — та же формула, что в haversine_km.
+        """
+        lat_r = np.radians(lat)
+        lon_r = np.radians(lon)
+
+        dlat = self.lat_r - lat_r
+        dlon = self.lon_r - lon_r
+
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat_r) * self.cos_lat * np.sin(dlon / 2) ** 2
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        return EARTH_RADIUS_KM * c
+
+    def match(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: Optional[float] = None,
+        category_code: Optional[str] = None,
+        min_rating: Optional[float] = None,
+        k: Optional[int] = None,
+    ) -> list[tuple[int, float]]:
+        """
+        Подходящие сервисы: список (sc_id, расстояние), по возрастанию расстояния.
+
+        radius_km     — не дальше радиуса;
+        category_code — специализация включает категорию (или сервис универсальный);
+        min_rating    — рейтинг не ниже;
+        k             — только k ближайших.
+        """
+        if not self.rows or (k is not None and k <= 0):
+            return []
+
+        if np is None:
+            return self._match_scalar(lat, lon, radius_km, category_code, min_rating, k)
+
+        dist = self.distances(lat, lon)
+
+        keep = self.has_geo.copy()
+        if radius_km is not None:
+            keep &= dist <= radius_km * (1 + _RTOL) + _ATOL_KM
+        if category_code:
+            keep &= (self.spec_mask & category_bit(category_code)) != 0
+        if min_rating is not None:
+            keep &= self.rating >= min_rating
+
+        candidates = np.flatnonzero(keep)
+
+        if k is not None and len(candidates) > k:
+            cand_dist = dist[candidates]
+            top = np.argpartition(cand_dist, k - 1)[:k]
+            # Берём всё, что не дальше k-го с учётом допуска — на границе
+            # порядок решит точный haversine_km
+            kth = cand_dist[top].max()
+            candidates = candidates[cand_dist <= kth * (1 + _RTOL) + _ATOL_KM]
+
+        return self._exact(lat, lon, candidates.tolist(), radius_km, k)
+
+    def _exact(
+        self,
+        lat: float,
+        lon: float,
+        positions: list[int],
+        radius_km: Optional[float],
+        k: Optional[int],
+    ) -> list[tuple[int, float]]:
+        found: list[tuple[int, int, float]] = []
+        for pos in positions:
+            sc_id, sc_lat, sc_lon = self.rows[pos][:3]
+            dist = haversine_km(lat, lon, sc_lat, sc_lon)
+            if radius_km is None or dist <= radius_km:
+                found.append((pos, sc_id, dist))
+
+        found.sort(key=lambda x: (x[2], x[0]))
+        if k is not None:
+            found = found[:k]
+        return [(sc_id, dist) for _, sc_id, dist in found]
+
+    def _match_scalar(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: Optional[float],
+        category_code: Optional[str],
+        min_rating: Optional[float],
+        k: Optional[int],
+    ) -> list[tuple[int, float]]:
+        bit = category_bit(category_code)
+        positions = []
+        for pos, (_, sc_lat, sc_lon, rating, _, specs) in enumerate(self.rows):
+            if sc_lat is None or sc_lon is None:
+                continue
+            if category_code and specs is not None and not (specialization_mask(specs) & bit):
+                continue
+            if min_rating is not None and (rating or 0.0) < min_rating:
+                continue
+            positions.append(pos)
+
+        return self._exact(lat, lon, positions, radius_km, k)
+
+
+# Общий снапшот процесса
+_snapshot: Optional[ServiceSnapshot] = None
+_loaded_at: Optional[float] = None
+_load_lock = asyncio.Lock()
+
+
+async def get_snapshot() -> ServiceSnapshot:
+    """
+    Снапшот активных СТО (и с координатами, и без). Перечитывается из БД раз в
+    GEO_INDEX_REFRESH_SECONDS или после invalidate().
+    """
+    global _snapshot, _loaded_at
+
+    refresh = config.GEO_INDEX_REFRESH_SECONDS
+    if _snapshot is not None and _loaded_at is not None and (
+        refresh <= 0 or time.monotonic() - _loaded_at < refresh
+    ):
+        return _snapshot
+
+    async with _load_lock:
+        if _snapshot is not None and _loaded_at is not None and (
+            refresh <= 0 or time.monotonic() - _loaded_at < refresh
+        ):
+            return _snapshot
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(
+                    ServiceCenter.id,
+                    ServiceCenter.location_lat,
+                    ServiceCenter.location_lon,
+                    ServiceCenter.rating,
+                    ServiceCenter.ratings_count,
+                    ServiceCenter.specializations,
+                ).where(ServiceCenter.owner_user_id.isnot(None))
+            )
+            rows = [tuple(row) for row in result.all()]
+
+        _snapshot = ServiceSnapshot(rows)
+        _loaded_at = time.monotonic()
+        logging.info(
+            f"[geo] Снапшот сервисов перестроен: {len(_snapshot)} точек"
+            f"{'' if np is not None else ' (без numpy)'}"
+        )
+        return _snapshot
+
+
+def invalidate() -> None:
+    """
+    Снапшот устарел (изменились координаты / специализации / рейтинг) —
+    перечитаем его при следующем запросе.
+    """
+    global _loaded_at
+    _loaded_at = None
+
+
+async def match_services(
+    lat: float,
+    lon: float,
+    radius_km: Optional[float] = None,
+    category_code: Optional[str] = None,
+    min_rating: Optional[float] = None,
+    k: Optional[int] = None,
+) -> list[tuple[int, float]]:
+    """
+    Подходящие сервисы из общего снапшота: (sc_id, расстояние) по возрастанию расстояния.
+    """
+    snapshot = await get_snapshot()
+    return snapshot.match(lat, lon, radius_km, category_code, min_rating, k)
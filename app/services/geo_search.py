@@ -0,0 +1,193 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import and_, or_, select, func
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter
+from app.services import geo_cache, geo_index, geo_kernel
+from app.services.geo_index import haversine_km, bounding_box
+from app.services.specializations import specialization_filter
+
+
+# Запас по радиусу для запросов через earthdistance / PostGIS:
+# у них свой радиус Земли, точную отсечку делаем haversine_km по кандидатам.
+_DB_RADIUS_PADDING = 1.01
+
+
+def _bbox_predicate(lat: float, lon: float, radius_km: float):
+    """
+    WHERE-условие по bounding box — использует индекс (location_lat, location_lon).
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+
+    conditions = [ServiceCenter.location_lat.between(min_lat, max_lat)]
+    if lon_ranges:
+        conditions.append(
+            or_(
+                *[
+                    ServiceCenter.location_lon.between(lo, hi)
+                    for lo, hi in lon_ranges
+                ]
+            )
+        )
+    return and_(*conditions)
+
+
+def _earthdistance_predicate(lat: float, lon: float, radius_km: float):
+    """
+    Postgres + cube/earthdistance: earth_box(...) @> ll_to_earth(...) (GiST-индекс).
+    """
+    radius_m = radius_km * 1000 * _DB_RADIUS_PADDING
+    return func.earth_box(func.ll_to_earth(lat, lon), radius_m).op("@>")(
+        func.ll_to_earth(ServiceCenter.location_lat, ServiceCenter.location_lon)
+    )
+
+
+def _postgis_point(lat_expr, lon_expr):
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(lon_expr, lat_expr), 4326))
+
+
+def _postgis_predicate(lat: float, lon: float, radius_km: float):
+    """
+    Postgres + PostGIS: ST_DWithin по geography (GiST-индекс).
+    """
+    radius_m = radius_km * 1000 * _DB_RADIUS_PADDING
+    return func.ST_DWithin(
+        _postgis_point(ServiceCenter.location_lat, ServiceCenter.location_lon),
+        _postgis_point(lat, lon),
+        radius_m,
+        False,
+    )
+
+
+def _active_services_query(category_code: Optional[str] = None):
+    """
+    Базовый запрос: только активные СТО (есть владелец) с координатами,
+    опционально — подходящие по категории работ.
+    """
+    query = select(ServiceCenter).where(
+        ServiceCenter.owner_user_id.isnot(None),
+        ServiceCenter.location_lat.is_not(None),
+        ServiceCenter.location_lon.is_not(None),
+    )
+
+    if category_code:
+        query = query.where(specialization_filter(category_code))
+
+    return query
+
+
+async def _find_via_index(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    category_code: Optional[str],
+) -> list[tuple[ServiceCenter, float]]:
+    hits = await geo_index.find_nearby(lat, lon, radius_km)
+    if not hits:
+        return []
+
+    async with AsyncSessionLocal() as session:
+        query = _active_services_query(category_code).where(
+            ServiceCenter.id.in_([sc_id for sc_id, _ in hits])
+        )
+        result = await session.execute(query)
+        services = {sc.id: sc for sc in result.scalars().all()}
+
+    return [(services[sc_id], dist) for sc_id, dist in hits if sc_id in services]
+
+
+async def _find_via_kernel(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    category_code: Optional[str],
+) -> list[tuple[ServiceCenter, float]]:
+    hits = await geo_kernel.match_services(
+        lat, lon, radius_km=radius_km, category_code=category_code
+    )
+    if not hits:
+        return []
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ServiceCenter).where(ServiceCenter.id.in_([sc_id for sc_id, _ in hits]))
+        )
+        services = {sc.id: sc for sc in result.scalars().all()}
+
+    return [(services[sc_id], dist) for sc_id, dist in hits if sc_id in services]
+
+
+async def find_nearby_services(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    category_code: Optional[str] = None,
+) -> list[tuple[ServiceCenter, float]]:
+    """
+    Активные СТО в радиусе radius_km от точки, по возрастанию расстояния.
+    Результаты кэшируются по ячейкам геохеша (app.services.geo_cache).
+    """
+    return await geo_cache.find_cached(
+        lat, lon, radius_km, category_code, _find_nearby_uncached
+    )
+
+
+async def _find_nearby_uncached(
+    lat: float,
+    lon: float,
+    radius_km: float,
+    category_code: Optional[str] = None,
+) -> list[tuple[ServiceCenter, float]]:
+    """
+    Режим выбирается через GEO_SEARCH_MODE:
+    - index         — кандидаты из in-memory индекса (app.services.geo_index);
+    - vector        — векторный проход numpy по снапшоту (app.services.geo_kernel);
+    - bbox          — SQL-фильтр по bounding box + haversine по кандидатам;
+    - earthdistance — Postgres cube/earthdistance;
+    - postgis       — Postgres PostGIS.
+    """
+    mode = config.GEO_SEARCH_MODE
+
+    if mode == "index":
+        return await _find_via_index(lat, lon, radius_km, category_code)
+    if mode == "vector":
+        return await _find_via_kernel(lat, lon, radius_km, category_code)
+
+    query = _active_services_query(category_code)
+
+    if mode == "earthdistance":
+        query = query.where(_earthdistance_predicate(lat, lon, radius_km))
+    elif mode == "postgis":
+        query = query.where(_postgis_predicate(lat, lon, radius_km))
+    else:
+        query = query.where(_bbox_predicate(lat, lon, radius_km))
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query)
+        services = result.scalars().all()
+
+    nearby: list[tuple[ServiceCenter, float]] = []
+    for sc in services:
+        dist = haversine_km(lat, lon, sc.location_lat, sc.location_lon)
+        if dist <= radius_km:
+            nearby.append((sc, dist))
+
+    nearby.sort(key=lambda x: x[1])
+
+    logging.debug(
+        f"[geo] mode={mode}: {len(services)} кандидатов из БД, {len(nearby)} в радиусе {radius_km} км"
+    )
+    return nearby
+
+
+async def sync_service_center(sc: ServiceCenter) -> None:
+    """
+    Сообщает гео-поиску об изменении ServiceCenter (координаты, владелец,
+    специализации, рейтинг). Вызывать после успешного commit.
+    """
+    geo_index.sync_service_center(sc)
+    geo_kernel.invalidate()
+    await geo_cache.invalidate_service_center(sc)
@@ -0,0 +1,154 @@
+import json
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter, User
+from app.services.geo_cache import LRUCache
+
+
+_REDIS_PREFIX = "identity"
+
+
+@dataclass(frozen=True)
+class Identity:
+    """
+    Кто прислал апдейт: пользователь, его роль и СТО, которым он владеет.
+    user_id = None — пользователь ещё не зарегистрирован.
+    """
+    telegram_id: int
+    user_id: Optional[int] = None
+    role: Optional[str] = None
+    service_center_id: Optional[int] = None
+
+    @property
+    def is_admin(self) -> bool:
+        return self.telegram_id in config.ADMIN_USER_IDS
+
+    @property
+    def is_registered(self) -> bool:
+        return self.user_id is not None
+
+    @property
+    def is_manager(self) -> bool:
+        return self.is_admin or self.role == "service"
+
+    @property
+    def manager_sc_id(self) -> Optional[int]:
+        """
+        СТО, заявки которого видит менеджер; None у админа — он видит все.
+        """
+        return None if self.is_admin else self.service_center_id
+
+
+_local = LRUCache(config.IDENTITY_CACHE_SIZE, config.IDENTITY_CACHE_TTL_SECONDS)
+
+_redis: Optional[Redis] = None
+
+
+def _get_redis() -> Optional[Redis]:
+    global _redis
+    if not config.IDENTITY_CACHE_REDIS:
+        return None
+    if _redis is None:
+        _redis = Redis.from_url(config.REDIS_URL)
+    return _redis
+
+
+async def close_redis() -> None:
+    """
+    Закрывает соединение с Redis (при остановке бота).
+    """
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+async def _load(session: AsyncSession, telegram_id: int) -> Identity:
+    # Один запрос: пользователь + СТО, которым он владеет
+    result = await session.execute(
+        select(User.id, User.role, ServiceCenter.id)
+        .outerjoin(ServiceCenter, ServiceCenter.owner_user_id == User.id)
+        .where(User.telegram_id == telegram_id)
+        .order_by(ServiceCenter.id)
+        .limit(1)
+    )
+    row = result.first()
+    if row is None:
+        return Identity(telegram_id=telegram_id)
+
+    user_id, role, sc_id = row
+    return Identity(
+        telegram_id=telegram_id,
+        user_id=user_id,
+        role=role,
+        service_center_id=sc_id,
+    )
+
+
+async def resolve(telegram_id: int, session: Optional[AsyncSession] = None) -> Identity:
+    """
+    Identity пользователя: сначала локальный TTL-кэш, потом Redis, потом БД.
+    session — сессия апдейта (DbSessionMiddleware); нужна только при промахе.
+    """
+    key = str(telegram_id)
+
+    cached = _local.get(key)
+    if cached is not None:
+        return cached
+
+    redis = _get_redis()
+    if redis is not None:
+        try:
+            raw = await redis.get(f"{_REDIS_PREFIX}:{key}")
+        except Exception as e:
+            logging.warning(f"[identity] Ошибка чтения из Redis: {e}")
+            raw = None
+        if raw:
+            identity = Identity(**json.loads(raw))
+            _local.set(key, identity)
+            return identity
+
+    if session is not None:
+        identity = await _load(session, telegram_id)
+    else:
+        async with AsyncSessionLocal() as session:
+            identity = await _load(session, telegram_id)
+
+    _local.set(key, identity)
+    if redis is not None:
+        try:
+            await redis.set(
+                f"{_REDIS_PREFIX}:{key}",
+                json.dumps(asdict(identity)),
+                ex=config.IDENTITY_CACHE_REDIS_TTL_SECONDS or None,
+            )
+        except Exception as e:
+            logging.warning(f"[identity] Ошибка записи в Redis: {e}")
+
+    return identity
+
+
+async def invalidate(telegram_id: int) -> None:
+    """
+    Роль пользователя или его СТО изменились (регистрация, /reset и т.п.).
+    Вызывать после коммита. Локальные кэши других экземпляров бота
+    доживут свой IDENTITY_CACHE_TTL_SECONDS.
+    """
+    key = str(telegram_id)
+    _local.pop(key)
+
+    redis = _get_redis()
+    if redis is None:
+        return
+    try:
+        await redis.delete(f"{_REDIS_PREFIX}:{key}")
+    except Exception as e:
+        logging.warning(f"[identity] Не удалось сбросить кэш в Redis: {e}")
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter
+from app.services import geo_kernel, request_counters
+from app.services.geo_index import haversine_km
+from app.services.geo_kernel import ServiceSnapshot, np
+from app.services.specializations import category_bit, specialization_mask
+
+
+# Веса факторов итогового скора (каждый фактор нормирован в [0, 1])
+WEIGHT_DISTANCE = 0.40
+WEIGHT_RATING = 0.30
+WEIGHT_SPECIALIZATION = 0.15
+WEIGHT_LOAD = 0.15
+
+# Расстояние, на котором фактор расстояния падает вдвое
+DISTANCE_HALF_KM = 5.0
+
+# Байесовский рейтинг: пока оценок мало, рейтинг тянется к "среднему" сервису
+RATING_PRIOR_MEAN = 4.0
+RATING_PRIOR_WEIGHT = 5
+
+# Универсальный сервис (без специализаций) подходит, но хуже профильного
+SPEC_FIT_EXACT = 1.0
+SPEC_FIT_UNIVERSAL = 0.6
+
+# Число открытых заявок, при котором фактор загрузки падает вдвое
+LOAD_HALF = 3.0
+
+# Как часто перечитывать загрузку сервисов из БД
+_LOAD_REFRESH_SECONDS = 30
+
+
+def bayesian_rating(rating: Optional[float], ratings_count: Optional[int]) -> float:
+    """
+    Рейтинг с поправкой на число оценок: 5⭐ по одной оценке < 4.8⭐ по сотне.
+    """
+    count = ratings_count or 0
+    return (
+        RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT + (rating or 0.0) * count
+    ) / (RATING_PRIOR_WEIGHT + count)
+
+
+def score_one(
+    dist_km: Optional[float],
+    rating: Optional[float],
+    ratings_count: Optional[int],
+    specializations: Optional[str],
+    category_code: Optional[str],
+    open_load: int,
+) -> Optional[float]:
+    """
+    Скор одного сервиса (эталонная скалярная версия; None — не подходит по категории).
+    dist_km = None — расстояние неизвестно (нет точки пользователя или координат СТО).
+    """
+    if category_code and specializations is None:
+        spec_fit = SPEC_FIT_UNIVERSAL
+    elif category_code:
+        if not specialization_mask(specializations) & category_bit(category_code):
+            return None
+        spec_fit = SPEC_FIT_EXACT
+    else:
+        spec_fit = SPEC_FIT_EXACT
+
+    distance_fit = 0.0 if dist_km is None else 1.0 / (1.0 + dist_km / DISTANCE_HALF_KM)
+    rating_fit = (bayesian_rating(rating, ratings_count) - 1.0) / 4.0
+    load_fit = 1.0 / (1.0 + open_load / LOAD_HALF)
+
+    return (
+        WEIGHT_DISTANCE * distance_fit
+        + WEIGHT_RATING * rating_fit
+        + WEIGHT_SPECIALIZATION * spec_fit
+        + WEIGHT_LOAD * load_fit
+    )
+
+
+def rank(
+    snapshot: ServiceSnapshot,
+    open_load,
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    category_code: Optional[str] = None,
+    radius_km: Optional[float] = None,
+    limit: Optional[int] = None,
+) -> list[tuple[int, float, Optional[float]]]:
+    """
+    Ранжирует сервисы снапшота: список (sc_id, скор, расстояние) по убыванию скора.
+
+    open_load — число открытых заявок по позициям снапшота (массив той же длины).
+    Без точки пользователя фактор расстояния у всех нулевой, и порядок решают
+    рейтинг, специализация и загрузка. С radius_km в выдачу попадают только
+    сервисы с координатами в радиусе.
+    """
+    if not len(snapshot) or (limit is not None and limit <= 0):
+        return []
+
+    if np is None:
+        return _rank_scalar(snapshot, open_load, lat, lon, category_code, radius_km, limit)
+
+    has_point = lat is not None and lon is not None
+
+    keep = np.ones(len(snapshot), dtype=bool)
+    spec_fit = np.full(len(snapshot), SPEC_FIT_EXACT)
+    if category_code:
+        universal = snapshot.spec_mask == -1
+        keep &= universal | ((snapshot.spec_mask & category_bit(category_code)) != 0)
+        spec_fit[universal] = SPEC_FIT_UNIVERSAL
+
+    distance_fit = np.zeros(len(snapshot))
+    dist = None
+    if has_point:
+        dist = snapshot.distances(lat, lon)
+        if radius_km is not None:
+            keep &= snapshot.has_geo & (dist <= radius_km)
+        geo = snapshot.has_geo
+        distance_fit[geo] = 1.0 / (1.0 + dist[geo] / DISTANCE_HALF_KM)
+
+    count = snapshot.ratings_count
+    rating_fit = (
+        (RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT + snapshot.rating * count)
+        / (RATING_PRIOR_WEIGHT + count)
+        - 1.0
+    ) / 4.0
+    load_fit = 1.0 / (1.0 + open_load / LOAD_HALF)
+
+    score = (
+        WEIGHT_DISTANCE * distance_fit
+        + WEIGHT_RATING * rating_fit
+        + WEIGHT_SPECIALIZATION * spec_fit
+        + WEIGHT_LOAD * load_fit
+    )
+
+    candidates = np.flatnonzero(keep)
+    if limit is not None and len(candidates) > limit:
+        top = np.argpartition(-score[candidates], limit - 1)[:limit]
+        candidates = candidates[top]
+
+    candidates = candidates[np.lexsort((candidates, -score[candidates]))]
+
+    ranked: list[tuple[int, float, Optional[float]]] = []
+    for pos in candidates.tolist():
+        sc_id, sc_lat, sc_lon = snapshot.rows[pos][:3]
+        dist_km = None
+        if has_point and sc_lat is not None and sc_lon is not None:
+            dist_km = haversine_km(lat, lon, sc_lat, sc_lon)
+        ranked.append((sc_id, float(score[pos]), dist_km))
+    return ranked
+
+
+def _rank_scalar(
+    snapshot: ServiceSnapshot,
+    open_load,
+    lat: Optional[float],
+    lon: Optional[float],
+    category_code: Optional[str],
+    radius_km: Optional[float],
+    limit: Optional[int],
+) -> list[tuple[int, float, Optional[float]]]:
+    has_point = lat is not None and lon is not None
+
+    ranked = []
+    for pos, (sc_id, sc_lat, sc_lon, rating, ratings_count, specs) in enumerate(snapshot.rows):
+        dist_km = None
+        if has_point and sc_lat is not None and sc_lon is not None:
+            dist_km = haversine_km(lat, lon, sc_lat, sc_lon)
+        if has_point and radius_km is not None and (dist_km is None or dist_km > radius_km):
+            continue
+
+        score = score_one(dist_km, rating, ratings_count, specs, category_code, open_load[pos])
+        if score is not None:
+            ranked.append((pos, sc_id, score, dist_km))
+
+    ranked.sort(key=lambda x: (-x[2], x[0]))
+    if limit is not None:
+        ranked = ranked[:limit]
+    return [(sc_id, score, dist_km) for _, sc_id, score, dist_km in ranked]
+
+
+# ---------------------------------------------------------------------------
+# Загрузка сервисов (открытые заявки)
+# ---------------------------------------------------------------------------
+
+_load_by_id: dict[int, int] = {}
+_load_loaded_at: Optional[float] = None
+_load_lock = asyncio.Lock()
+
+# Массив загрузки, выровненный по позициям конкретного снапшота
+_aligned: Optional[tuple[ServiceSnapshot, float, object]] = None
+
+
+async def _get_open_load() -> dict[int, int]:
+    global _load_by_id, _load_loaded_at
+
+    if _load_loaded_at is not None and time.monotonic() - _load_loaded_at < _LOAD_REFRESH_SECONDS:
+        return _load_by_id
+
+    async with _load_lock:
+        if _load_loaded_at is not None and time.monotonic() - _load_loaded_at < _LOAD_REFRESH_SECONDS:
+            return _load_by_id
+
+        # Счётчики ведутся инкрементально (app.services.request_counters) —
+        # читаем маленькую таблицу вместо count(*) по requests
+        _load_by_id = await request_counters.get_open_load()
+
+        _load_loaded_at = time.monotonic()
+        return _load_by_id
+
+
+async def _aligned_load(snapshot: ServiceSnapshot):
+    global _aligned
+
+    load_by_id = await _get_open_load()
+    if _aligned is not None and _aligned[0] is snapshot and _aligned[1] == _load_loaded_at:
+        return _aligned[2]
+
+    values = [load_by_id.get(row[0], 0) for row in snapshot.rows]
+    aligned = np.array(values, dtype=np.float64) if np is not None else values
+    _aligned = (snapshot, _load_loaded_at, aligned)
+    return aligned
+
+
+def invalidate_load() -> None:
+    """
+    Загрузка сервисов изменилась (новая / закрытая заявка) — перечитаем при следующем подборе.
+    """
+    global _load_loaded_at
+    _load_loaded_at = None
+
+
+# ---------------------------------------------------------------------------
+# Публичное API
+# ---------------------------------------------------------------------------
+
+async def match_service_centers(
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    category_code: Optional[str] = None,
+    radius_km: Optional[float] = None,
+    limit: Optional[int] = None,
+) -> list[tuple[ServiceCenter, Optional[float]]]:
+    """
+    Подбор СТО под заявку / поиск: список (ServiceCenter, расстояние или None),
+    лучшие сначала. Скор учитывает расстояние, рейтинг с поправкой на число
+    оценок, соответствие специализации и текущую загрузку сервиса.
+    """
+    snapshot = await geo_kernel.get_snapshot()
+    open_load = await _aligned_load(snapshot)
+
+    ranked = rank(snapshot, open_load, lat, lon, category_code, radius_km, limit)
+    if not ranked:
+        return []
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ServiceCenter).where(ServiceCenter.id.in_([sc_id for sc_id, _, _ in ranked]))
+        )
+        services = {sc.id: sc for sc in result.scalars().all()}
+
+    logging.debug(
+        f"[match] category={category_code} radius={radius_km}: "
+        f"{len(ranked)} из {len(snapshot)} сервисов"
+    )
+    return [
+        (services[sc_id], dist_km)
+        for sc_id, _, dist_km in ranked
+        if sc_id in services
+    ]
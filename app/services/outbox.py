@@ -0,0 +1,351 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+)
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.outbox_models import OutboxMessage
+from app.services import send_queue
+
+
+# Доставка по типу записи: async (bot, payload) -> None
+DeliveryHandler = Callable[[Bot, dict], Awaitable[None]]
+
+_handlers: dict[str, DeliveryHandler] = {}
+
+# Будит диспетчер сразу после коммита транзакции, записавшей что-то в outbox
+# (другие экземпляры бота подхватят записи по OUTBOX_POLL_SECONDS)
+_wakeup = asyncio.Event()
+
+# Ошибки, после которых повтор бессмыслен: чат недоступен, сообщение удалено и т.п.
+_PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound)
+
+
+def handler(kind: str):
+    """
+    Регистрирует доставку для записей outbox типа kind.
+    """
+    def decorator(func: DeliveryHandler) -> DeliveryHandler:
+        _handlers[kind] = func
+        return func
+
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# Запись: в транзакции вызывающего
+# ---------------------------------------------------------------------------
+
+def enqueue(session: AsyncSession, kind: str, **payload) -> None:
+    """
+    Ставит действие в outbox в транзакции вызывающего: уйдёт в Telegram только
+    после коммита и не потеряется, если процесс упадёт сразу после него.
+    """
+    session.add(
+        OutboxMessage(
+            kind=kind,
+            payload=json.dumps(payload, ensure_ascii=False),
+            available_at=datetime.now(timezone.utc),
+        )
+    )
+    session.info["outbox_pending"] = True
+
+
+def enqueue_message(
+    session: AsyncSession,
+    chat_id: int,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    parse_mode: Optional[str] = None,
+    priority: int = send_queue.PRIORITY_CLIENT,
+) -> None:
+    """
+    Сообщение в чат (клиенту, сервису).
+    priority — полоса очереди отправки (send_queue.PRIORITY_*).
+    """
+    enqueue(
+        session,
+        "message",
+        chat_id=chat_id,
+        text=text,
+        reply_markup=reply_markup.model_dump(exclude_none=True) if reply_markup else None,
+        parse_mode=parse_mode,
+        priority=priority,
+    )
+
+
+def enqueue_chat_keyboard(session: AsyncSession, request_id: int) -> None:
+    """
+    Обновление клавиатуры под карточкой заявки в чате сервиса.
+    """
+    enqueue(session, "chat_keyboard", request_id=request_id)
+
+
+def enqueue_request_card(session: AsyncSession, request_id: int) -> None:
+    """
+    Карточка новой заявки в чате сервиса.
+    """
+    enqueue(session, "request_card", request_id=request_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session: Session) -> None:
+    if session.info.pop("outbox_pending", False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session: Session) -> None:
+    session.info.pop("outbox_pending", None)
+
+
+# ---------------------------------------------------------------------------
+# Доставка
+# ---------------------------------------------------------------------------
+
+@handler("message")
+async def _deliver_message(bot: Bot, payload: dict) -> None:
+    markup = payload.get("reply_markup")
+    await send_queue.send_message(
+        bot,
+        payload["chat_id"],
+        payload["text"],
+        priority=payload.get("priority", send_queue.PRIORITY_CLIENT),
+        reply_markup=InlineKeyboardMarkup.model_validate(markup) if markup else None,
+        parse_mode=payload.get("parse_mode"),
+    )
+
+
+@handler("chat_keyboard")
+async def _deliver_chat_keyboard(bot: Bot, payload: dict) -> None:
+    from app.services.chat_service import update_chat_keyboard
+
+    await update_chat_keyboard(bot, payload["request_id"], raise_errors=True)
+
+
+@handler("request_card")
+async def _deliver_request_card(bot: Bot, payload: dict) -> None:
+    from app.services.chat_service import create_request_chat
+
+    await create_request_chat(bot, payload["request_id"], raise_errors=True)
+
+
+def _retry_delay(attempts: int) -> float:
+    # 5 с, 10 с, 20 с ... не больше 10 минут
+    return min(5 * 2 ** (attempts - 1), 600)
+
+
+async def _claim_batch(now: datetime, limit: int) -> list:
+    """
+    Забирает до limit готовых записей: один UPDATE ставит им аренду (available_at
+    в будущем) и возвращает их. SKIP LOCKED на Postgres — чтобы несколько
+    экземпляров бота не брали одно и то же.
+    """
+    outbox = OutboxMessage.__table__
+    ready = (
+        select(outbox.c.id)
+        .where(outbox.c.available_at <= now)
+        .order_by(outbox.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(outbox)
+            .where(outbox.c.id.in_(ready.scalar_subquery()))
+            .values(
+                available_at=now + timedelta(seconds=config.OUTBOX_LEASE_SECONDS),
+                attempts=outbox.c.attempts + 1,
+            )
+            .returning(outbox.c.id, outbox.c.kind, outbox.c.payload, outbox.c.attempts)
+        )
+        rows = sorted(result.all(), key=lambda row: row.id)
+        await session.commit()
+    return rows
+
+
+# Записи, которые этот процесс сейчас доставляет: их аренду продлевает
+# _renew_leases, пока доставка ждёт своей очереди в send_queue
+_in_flight: dict[int, asyncio.Task] = {}
+
+
+async def _finish(row, delay: Optional[float] = None, error: Optional[str] = None) -> None:
+    """
+    Итог по одной записи сразу после её доставки: delay = None — удалить,
+    иначе отложить повтор на delay секунд.
+    """
+    _in_flight.pop(row.id, None)
+    outbox = OutboxMessage.__table__
+    async with AsyncSessionLocal() as session:
+        if delay is None:
+            await session.execute(delete(outbox).where(outbox.c.id == row.id))
+        else:
+            await session.execute(
+                update(outbox)
+                .where(outbox.c.id == row.id)
+                .values(
+                    available_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                    last_error=(error or "")[:1000],
+                )
+            )
+        await session.commit()
+
+
+async def _deliver_row(bot: Bot, row) -> bool:
+    """
+    Доставляет одну запись и сразу фиксирует результат.
+    Успешные и безнадёжные записи удаляются, остальные откладываются с
+    экспоненциальной паузой (TelegramRetryAfter — на сколько попросил Telegram).
+    :return: True — запись отложена до повтора
+    """
+    deliver = _handlers.get(row.kind)
+    if deliver is None:
+        logging.error(f"[outbox] Неизвестный тип записи {row.kind!r} (#{row.id}), пропускаем")
+        await _finish(row)
+        return False
+
+    try:
+        await deliver(bot, json.loads(row.payload))
+    except asyncio.CancelledError:
+        # Остановка бота: запись подберут после окончания аренды
+        _in_flight.pop(row.id, None)
+        raise
+    except TelegramRetryAfter as e:
+        await _finish(row, e.retry_after, str(e))
+        return True
+    except _PERMANENT_ERRORS as e:
+        logging.error(f"[outbox] {row.kind} #{row.id} не доставлено: {e}")
+        await _finish(row)
+        return False
+    except Exception as e:
+        if row.attempts >= config.OUTBOX_MAX_ATTEMPTS:
+            logging.error(
+                f"[outbox] {row.kind} #{row.id} не доставлено за {row.attempts} попыток: {e}"
+            )
+            await _finish(row)
+            return False
+        await _finish(row, _retry_delay(row.attempts), str(e))
+        return True
+
+    await _finish(row)
+    return False
+
+
+async def _deliver_row_logged(bot: Bot, row) -> None:
+    try:
+        if await _deliver_row(bot, row):
+            logging.warning(f"[outbox] {row.kind} #{row.id} отложено до повтора")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Не удалось записать итог (например, БД недоступна) — запись
+        # вернётся в работу после окончания аренды
+        _in_flight.pop(row.id, None)
+        logging.error(f"[outbox] Ошибка фиксации {row.kind} #{row.id}: {e}")
+    finally:
+        # Освободилось место — диспетчер может брать следующие записи
+        _wakeup.set()
+
+
+async def _renew_leases() -> None:
+    """
+    Продлевает аренду записей, которые ещё доставляются: send_queue держит темп
+    чатов (группа — 20 в минуту), и доставка может идти дольше OUTBOX_LEASE_SECONDS.
+    Без продления такую запись взял бы и повторно отправил другой экземпляр бота.
+    """
+    outbox = OutboxMessage.__table__
+    interval = max(config.OUTBOX_LEASE_SECONDS / 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        ids = list(_in_flight)
+        if not ids:
+            continue
+        try:
+            now = datetime.now(timezone.utc)
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(outbox)
+                    .where(outbox.c.id.in_(ids), outbox.c.available_at > now)
+                    .values(available_at=now + timedelta(seconds=config.OUTBOX_LEASE_SECONDS))
+                )
+                await session.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[outbox] Не удалось продлить аренду {len(ids)} записей: {e}")
+
+
+def _start_rows(bot: Bot, rows: list) -> list[asyncio.Task]:
+    # Задачи создаются по порядку записи — в том же порядке записи встают в send_queue
+    tasks = []
+    for row in rows:
+        task = asyncio.create_task(_deliver_row_logged(bot, row))
+        _in_flight[row.id] = task
+        tasks.append(task)
+    return tasks
+
+
+async def dispatch_batch(bot: Bot) -> int:
+    """
+    Берёт пачку outbox (до OUTBOX_BATCH_SIZE) и ждёт её доставки.
+    :return: сколько записей взято
+    """
+    rows = await _claim_batch(datetime.now(timezone.utc), config.OUTBOX_BATCH_SIZE)
+    if rows:
+        await asyncio.gather(*_start_rows(bot, rows))
+    return len(rows)
+
+
+async def run_dispatcher(bot: Bot) -> None:
+    """
+    Фоновая задача: разбирает outbox. Каждая запись доставляется своей задачей
+    и фиксируется сразу по готовности, поэтому медленный чат не держит остальные.
+    Новые записи берутся, пока в доставке меньше OUTBOX_MAX_IN_FLIGHT; иначе
+    диспетчер ждёт коммита с новыми записями, освобождения места или
+    OUTBOX_POLL_SECONDS.
+    """
+    renew_task = asyncio.create_task(_renew_leases())
+    try:
+        while True:
+            _wakeup.clear()
+            capacity = min(
+                config.OUTBOX_BATCH_SIZE,
+                config.OUTBOX_MAX_IN_FLIGHT - len(_in_flight),
+            )
+            claimed = 0
+            if capacity > 0:
+                try:
+                    rows = await _claim_batch(datetime.now(timezone.utc), capacity)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error(f"[outbox] Ошибка диспетчера: {e}")
+                    rows = []
+                _start_rows(bot, rows)
+                claimed = len(rows)
+
+            if capacity > 0 and claimed >= capacity:
+                continue
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=config.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        renew_task.cancel()
+        for task in list(_in_flight.values()):
+            task.cancel()
+        _in_flight.clear()
@@ -0,0 +1,139 @@
+from typing import Optional
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.database.models import Request
+
+
+# Направление перехода по страницам (часть callback_data)
+NEXT = "n"
+PREV = "p"
+
+
+def parse_page_args(parts: list[str]) -> tuple[int, str, Optional[int]]:
+    """
+    Разбирает хвост callback_data списка заявок: <page>[:<направление>:<id заявки-курсора>].
+    Старые кнопки без курсора (только номер страницы) открывают первую страницу.
+    """
+    page = int(parts[0]) if parts else 1
+    if len(parts) >= 3 and parts[1] in (NEXT, PREV):
+        return page, parts[1], int(parts[2])
+    return 1, NEXT, None
+
+
+def page_callback(prefix: str, page: int, direction: str, cursor_id: int) -> str:
+    return f"{prefix}:{page}:{direction}:{cursor_id}"
+
+
+def seek_stmt(stmt: Select, cursor_id: Optional[int], direction: str, limit: int) -> Select:
+    """
+    Keyset-пагинация по (created_at, id), новые заявки сначала.
+
+    Курсор — id крайней заявки предыдущей страницы; её created_at берём
+    подзапросом по первичному ключу, поэтому в callback_data хватает одного id,
+    а страница N стоит столько же, сколько первая.
+    """
+    key = tuple_(Request.created_at, Request.id)
+
+    if cursor_id is not None:
+        anchor = aliased(Request)
+        anchor_created_at = (
+            select(anchor.created_at).where(anchor.id == cursor_id).scalar_subquery()
+        )
+        bound = tuple_(anchor_created_at, cursor_id)
+        stmt = stmt.where(key > bound if direction == PREV else key < bound)
+
+    if direction == PREV:
+        stmt = stmt.order_by(Request.created_at.asc(), Request.id.asc())
+    else:
+        stmt = stmt.order_by(Request.created_at.desc(), Request.id.desc())
+
+    # +1 строка — чтобы узнать, есть ли что-то дальше, без count(*)
+    return stmt.limit(limit + 1)
+
+
+async def fetch_request_page(
+    session: AsyncSession,
+    stmt: Select,
+    cursor_id: Optional[int],
+    direction: str,
+    limit: int,
+) -> tuple[list, bool, bool]:
+    """
+    Страница строк запроса по заявкам (первый столбец — Request).
+    Возвращает (строки от новых к старым, есть ли страница раньше, есть ли позже).
+
+    Если курсор "убежал" (заявка удалена, на предыдущей странице строк меньше
+    лимита и т.п.) — отдаём первую страницу.
+    """
+    rows = (await session.execute(seek_stmt(stmt, cursor_id, direction, limit))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if cursor_id is not None and (
+        not rows or (direction == PREV and not has_more and len(rows) < limit)
+    ):
+        return await fetch_request_page(session, stmt, None, NEXT, limit)
+
+    if direction == PREV:
+        rows.reverse()
+        return rows, has_more, True
+
+    return rows, cursor_id is not None, has_more
+
+
+def seek_by_id_stmt(
+    stmt: Select,
+    id_column,
+    cursor_id: Optional[int],
+    direction: str,
+    limit: int,
+    descending: bool = True,
+) -> Select:
+    """
+    Keyset-пагинация по одному первичному ключу (списки пользователей, СТО и т.п.).
+    descending — порядок "вперёд": новые (большие id) сначала.
+    """
+    # Назад — это вперёд в обратном порядке
+    forward_desc = descending if direction == NEXT else not descending
+
+    if cursor_id is not None:
+        stmt = stmt.where(id_column < cursor_id if forward_desc else id_column > cursor_id)
+
+    stmt = stmt.order_by(id_column.desc() if forward_desc else id_column.asc())
+    return stmt.limit(limit + 1)
+
+
+async def fetch_id_page(
+    session: AsyncSession,
+    stmt: Select,
+    id_column,
+    cursor_id: Optional[int],
+    direction: str,
+    limit: int,
+    descending: bool = True,
+) -> tuple[list, bool, bool]:
+    """
+    То же, что fetch_request_page, но курсор — значение id_column.
+    Возвращает (строки в прямом порядке, есть ли страница раньше, есть ли позже).
+    """
+    rows = (
+        await session.execute(
+            seek_by_id_stmt(stmt, id_column, cursor_id, direction, limit, descending)
+        )
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if cursor_id is not None and (
+        not rows or (direction == PREV and not has_more and len(rows) < limit)
+    ):
+        return await fetch_id_page(session, stmt, id_column, None, NEXT, limit, descending)
+
+    if direction == PREV:
+        rows.reverse()
+        return rows, has_more, True
+
+    return rows, cursor_id is not None, has_more
@@ -0,0 +1,69 @@
+import logging
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import ServiceCenter
+from app.database.rating_models import Rating
+from app.services.matching import RATING_PRIOR_MEAN, RATING_PRIOR_WEIGHT
+
+
+async def add_rating(
+    session: AsyncSession,
+    request_id: int,
+    user_id: int,
+    service_center_id: Optional[int],
+    score: int,
+) -> bool:
+    """
+    Сохраняет оценку и пересчитывает рейтинг СТО (в транзакции вызывающего, без коммита).
+
+    Повтор по той же (заявка, пользователь) отсекается уникальным индексом:
+    INSERT ... ON CONFLICT DO NOTHING ничего не вставит.
+    :return: False — пользователь уже оценивал эту заявку
+    """
+    insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+    result = await session.execute(
+        insert(Rating)
+        .values(
+            request_id=request_id,
+            user_id=user_id,
+            service_center_id=service_center_id,
+            score=score,
+        )
+        .on_conflict_do_nothing(index_elements=["request_id", "user_id"])
+        .returning(Rating.id)
+    )
+    if result.first() is None:
+        return False
+
+    if service_center_id is not None:
+        await session.execute(_rating_update(service_center_id, score))
+
+    logging.info(
+        f"[rating] Оценка {score} по заявке #{request_id} (СТО {service_center_id})"
+    )
+    return True
+
+
+def _rating_update(service_center_id: int, score: int):
+    """
+    Среднее, количество и байесовский ключ сортировки — одним UPDATE от текущих
+    значений строки (правые части SET видят значения до обновления).
+    """
+    sc = ServiceCenter.__table__.c
+    count = func.coalesce(sc.ratings_count, 0)
+    total = func.coalesce(sc.rating, 0.0) * count + score
+
+    return (
+        update(ServiceCenter.__table__)
+        .where(sc.id == service_center_id)
+        .values(
+            ratings_count=count + 1,
+            rating=total / (count + 1),
+            rating_sort=(RATING_PRIOR_MEAN * RATING_PRIOR_WEIGHT + total)
+            / (RATING_PRIOR_WEIGHT + count + 1),
+        )
+    )
@@ -0,0 +1,43 @@
+from typing import Callable, TypeVar
+
+from app.config import config
+from app.database.models import Request
+from app.services.geo_cache import LRUCache
+
+
+T = TypeVar("T")
+
+# (request_id, version, вид) -> готовый текст / клавиатура.
+# Новая версия заявки — новый ключ, старые записи вытесняются LRU.
+_cache = LRUCache(config.RENDER_CACHE_SIZE, config.RENDER_CACHE_TTL_SECONDS)
+
+_stats = {"hits": 0, "misses": 0}
+
+
+def render(request: Request, view: str, build: Callable[[], T]) -> T:
+    """
+    Отрисовка заявки в виде view (карточка, клавиатура ...) из кэша; при промахе —
+    build() и запись в кэш. Результат общий для всех вызывающих — не изменять.
+    Заявки без id или version (несохранённые объекты) отрисовываются без кэша.
+    """
+    if request.id is None or request.version is None:
+        return build()
+
+    key = f"{request.id}:{request.version}:{view}"
+    cached = _cache.get(key)
+    if cached is not None:
+        _stats["hits"] += 1
+        return cached
+
+    _stats["misses"] += 1
+    value = build()
+    _cache.set(key, value)
+    return value
+
+
+def stats() -> dict:
+    """
+    Попадания / промахи кэша и его размер — для логов и отладки.
+    """
+    return {**_stats, "size": len(_cache)}
+
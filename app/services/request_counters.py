@@ -0,0 +1,256 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, event, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import Request, ServiceCenterRequestCount
+
+
+# Ключ счётчика для заявок без СТО
+UNASSIGNED = 0
+
+# Статусы, в которых заявка ещё "висит" на сервисе (нагрузка СТО)
+OPEN_REQUEST_STATUSES = ("new", "offer_sent", "accepted_by_client", "accepted", "in_progress")
+
+
+def _sc_key(service_center_id: Optional[int]) -> int:
+    return service_center_id if service_center_id is not None else UNASSIGNED
+
+
+# ---------------------------------------------------------------------------
+# Инкрементальное обновление: в той же транзакции, что и изменение заявки
+# ---------------------------------------------------------------------------
+
+def _history_values(state, key: str):
+    """
+    (старое, новое) значение атрибута и флаг "старое известно".
+    """
+    history = state.attrs[key].history
+    if not history.added:
+        value = history.unchanged[0] if history.unchanged else getattr(state.obj(), key)
+        return value, value, True
+
+    new = history.added[0]
+    if history.deleted:
+        return history.deleted[0], new, True
+    # Атрибут не был загружен до изменения — старое значение придётся читать из БД
+    return None, new, False
+
+
+def _upsert(dialect_name: str, sc_key: int, status: str, delta: int):
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert(ServiceCenterRequestCount).values(
+        service_center_id=sc_key,
+        status=status,
+        requests_count=delta,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["service_center_id", "status"],
+        set_={"requests_count": ServiceCenterRequestCount.requests_count + delta},
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _track_request_status(session: Session, flush_context, instances) -> None:
+    """
+    Перед каждым flush считаем, как меняются пары (СТО, статус) у заявок
+    (новые, удалённые, смена статуса или СТО), и применяем дельты к счётчикам
+    тем же соединением — то есть в той же транзакции.
+
+    Массовые UPDATE/DELETE мимо ORM сюда не попадают: такие места должны
+    вызывать apply_deltas сами (а сверка поправит всё остальное).
+    """
+    deltas: dict[tuple[int, str], int] = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Request):
+            deltas[(_sc_key(obj.service_center_id), obj.status or "new")] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Request):
+            state = obj._sa_instance_state
+            old_status, _, _ = _history_values(state, "status")
+            old_sc, _, _ = _history_values(state, "service_center_id")
+            deltas[(_sc_key(old_sc), old_status or "new")] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Request) or obj in session.deleted:
+            continue
+
+        state = obj._sa_instance_state
+        old_status, new_status, status_known = _history_values(state, "status")
+        old_sc, new_sc, sc_known = _history_values(state, "service_center_id")
+        if old_status == new_status and old_sc == new_sc and status_known and sc_known:
+            continue
+
+        if not (status_known and sc_known):
+            row = session.connection().execute(
+                select(Request.status, Request.service_center_id).where(Request.id == obj.id)
+            ).first()
+            if row is None:
+                continue
+            if not status_known:
+                old_status = row.status
+            if not sc_known:
+                old_sc = row.service_center_id
+            if old_status == new_status and old_sc == new_sc:
+                continue
+
+        deltas[(_sc_key(old_sc), old_status or "new")] -= 1
+        deltas[(_sc_key(new_sc), new_status or "new")] += 1
+
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        _apply_sync(session, deltas)
+
+
+def _apply_sync(session: Session, deltas: dict[tuple[int, str], int]) -> None:
+    conn = session.connection()
+    dialect_name = conn.dialect.name
+    for (sc_key, status), delta in deltas.items():
+        conn.execute(_upsert(dialect_name, sc_key, status, delta))
+
+
+async def apply_deltas(
+    session: AsyncSession,
+    deltas: dict[tuple[Optional[int], str], int],
+) -> None:
+    """
+    Ручное обновление счётчиков — для массовых UPDATE заявок мимо ORM.
+    Ключ — (service_center_id или None, статус), значение — изменение количества.
+    """
+    merged: dict[tuple[int, str], int] = defaultdict(int)
+    for (sc_id, status), delta in deltas.items():
+        merged[(_sc_key(sc_id), status)] += delta
+
+    dialect_name = session.bind.dialect.name
+    for (sc_key, status), delta in merged.items():
+        if delta:
+            await session.execute(_upsert(dialect_name, sc_key, status, delta))
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+async def count_requests(
+    session: AsyncSession,
+    sc_id: Optional[int],
+    statuses: Optional[Iterable[str]] = None,
+    include_unassigned: bool = True,
+) -> int:
+    """
+    Количество заявок по счётчикам.
+    sc_id = None — по всем сервисам (админ), иначе — по СТО
+    (и непривязанным заявкам, если include_unassigned).
+    """
+    stmt = select(func.coalesce(func.sum(ServiceCenterRequestCount.requests_count), 0))
+
+    if sc_id is not None:
+        keys = [sc_id, UNASSIGNED] if include_unassigned else [sc_id]
+        stmt = stmt.where(ServiceCenterRequestCount.service_center_id.in_(keys))
+    if statuses:
+        stmt = stmt.where(ServiceCenterRequestCount.status.in_(list(statuses)))
+
+    return int((await session.execute(stmt)).scalar() or 0)
+
+
+async def get_open_load() -> dict[int, int]:
+    """
+    Число открытых заявок по каждому СТО (id -> количество).
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(
+                ServiceCenterRequestCount.service_center_id,
+                func.sum(ServiceCenterRequestCount.requests_count),
+            )
+            .where(
+                ServiceCenterRequestCount.service_center_id != UNASSIGNED,
+                ServiceCenterRequestCount.status.in_(OPEN_REQUEST_STATUSES),
+            )
+            .group_by(ServiceCenterRequestCount.service_center_id)
+        )
+        return {sc_id: int(total or 0) for sc_id, total in result.all()}
+
+
+# ---------------------------------------------------------------------------
+# Сверка с таблицей requests
+# ---------------------------------------------------------------------------
+
+async def reconcile() -> int:
+    """
+    Пересчитывает счётчики из requests и исправляет расхождения.
+    Возвращает число исправленных пар (СТО, статус).
+    """
+    async with AsyncSessionLocal() as session:
+        if session.bind.dialect.name == "postgresql":
+            # Смены статусов подождут сверку — их дельты лягут поверх свежих значений
+            await session.execute(
+                text("LOCK TABLE service_center_request_counts IN EXCLUSIVE MODE")
+            )
+
+        sc_key = func.coalesce(Request.service_center_id, UNASSIGNED)
+        status = func.coalesce(Request.status, "new")
+        result = await session.execute(
+            select(sc_key, status, func.count(Request.id)).group_by(sc_key, status)
+        )
+        actual = {(sc, st): cnt for sc, st, cnt in result.all()}
+
+        result = await session.execute(
+            select(
+                ServiceCenterRequestCount.service_center_id,
+                ServiceCenterRequestCount.status,
+                ServiceCenterRequestCount.requests_count,
+            )
+        )
+        stored = {(sc, st): cnt for sc, st, cnt in result.all()}
+
+        fixed = 0
+        for key in set(actual) | set(stored):
+            expected = actual.get(key, 0)
+            if stored.get(key) == expected:
+                continue
+            fixed += 1
+
+            sc, st = key
+            if expected == 0:
+                await session.execute(
+                    delete(ServiceCenterRequestCount).where(
+                        ServiceCenterRequestCount.service_center_id == sc,
+                        ServiceCenterRequestCount.status == st,
+                    )
+                )
+            else:
+                # upsert с дельтой до нужного значения
+                await session.execute(
+                    _upsert(session.bind.dialect.name, sc, st, expected - stored.get(key, 0))
+                )
+
+        await session.commit()
+
+    if fixed:
+        logging.warning(f"[counters] Сверка исправила {fixed} счётчиков заявок")
+    return fixed
+
+
+async def run_reconciliation_loop() -> None:
+    """
+    Фоновая задача: сверка при старте и затем раз в REQUEST_COUNTERS_RECONCILE_SECONDS.
+    """
+    while True:
+        try:
+            await reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[counters] Ошибка сверки счётчиков заявок: {e}")
+
+        await asyncio.sleep(config.REQUEST_COUNTERS_RECONCILE_SECONDS)
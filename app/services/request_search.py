@@ -0,0 +1,429 @@
+import logging
+import re
+from typing import Iterable, Optional
+
+from sqlalchemy import (
+    and_,
+    bindparam,
+    column,
+    delete,
+    event,
+    exists,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database.db import AsyncSessionLocal
+from app.database.models import Car, Request, RequestSearchDocument, User
+
+
+# Сколько заявок показываем в результатах поиска
+SEARCH_LIMIT = 20
+
+# Пачка заявок при первичном заполнении индекса
+_BACKFILL_CHUNK = 1000
+
+# Кириллические буквы госномеров, совпадающие по начертанию с латинскими
+_PLATE_TRANSLATE = str.maketrans("АВЕКМНОРСТУХ", "ABEKMHOPCTYX")
+
+# Поля, от которых зависит поисковый документ заявки
+_TRACKED_FIELDS = {
+    Request: ("description", "service_center_id", "user_id", "car_id"),
+    Car: ("license_plate", "vin"),
+    User: ("full_name", "phone_number"),
+}
+
+# Виртуальная таблица FTS5 (rowid = request_id), создаётся только на SQLite
+_fts_table = table("request_search_fts", column("rowid"), column("document"))
+
+# Что доступно в текущей БД (выставляется в ensure_search_index при старте)
+_ready = False
+_fts = False     # SQLite FTS5
+_pg_fts = False  # Postgres tsvector-индекс
+_trgm = False    # Postgres pg_trgm
+
+
+# ---------------------------------------------------------------------------
+# Нормализация
+# ---------------------------------------------------------------------------
+
+def normalize_plate(value: Optional[str]) -> str:
+    """
+    Госномер для точного поиска: верхний регистр, латиница, без пробелов и дефисов.
+    'а 123 вс 77' и 'A123BC77' дают одно и то же.
+    """
+    if not value:
+        return ""
+    return re.sub(r"[^A-Z0-9]", "", value.upper().translate(_PLATE_TRANSLATE))
+
+
+def normalize_vin(value: Optional[str]) -> str:
+    return normalize_plate(value)
+
+
+def normalize_phone(value: Optional[str]) -> str:
+    """
+    Последние 10 цифр: +7 999 ..., 8 (999) ... и 999... совпадают.
+    """
+    if not value:
+        return ""
+    return re.sub(r"\D", "", value)[-10:]
+
+
+def _tokens(query: str) -> list[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+def _build_document(row) -> dict:
+    plate = normalize_plate(row.license_plate)
+    vin = normalize_vin(row.vin)
+    phone = normalize_phone(row.phone_number)
+
+    parts = [
+        row.full_name,
+        row.phone_number,
+        phone,
+        row.license_plate,
+        plate,
+        vin,
+        row.description,
+    ]
+    return {
+        "request_id": row.id,
+        "service_center_id": row.service_center_id,
+        "created_at": row.created_at,
+        "plate_norm": plate or None,
+        "vin_norm": vin or None,
+        "phone_norm": phone or None,
+        "document": " ".join(p for p in parts if p).lower(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Обновление документов: в той же транзакции, что и изменение заявки / авто / клиента
+# ---------------------------------------------------------------------------
+
+def _has_changes(obj, fields: Iterable[str]) -> bool:
+    state = obj._sa_instance_state
+    return any(state.attrs[f].history.has_changes() for f in fields)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_search_documents(session: Session, flush_context) -> None:
+    """
+    После flush пересобираем документы затронутых заявок тем же соединением.
+    Изменение авто или клиента пересобирает все его заявки.
+    """
+    if not _ready:
+        return
+
+    request_ids: set[int] = set()
+    car_ids: set[int] = set()
+    user_ids: set[int] = set()
+    deleted_ids: set[int] = set()
+
+    for obj in session.new:
+        if isinstance(obj, Request):
+            request_ids.add(obj.id)
+
+    for obj in session.dirty:
+        fields = _TRACKED_FIELDS.get(type(obj))
+        if not fields or obj in session.deleted or not _has_changes(obj, fields):
+            continue
+        if isinstance(obj, Request):
+            request_ids.add(obj.id)
+        elif isinstance(obj, Car):
+            car_ids.add(obj.id)
+        else:
+            user_ids.add(obj.id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Request):
+            deleted_ids.add(obj.id)
+
+    if request_ids or car_ids or user_ids or deleted_ids:
+        _refresh(session.connection(), request_ids, car_ids, user_ids, deleted_ids)
+
+
+def _refresh(
+    conn: Connection,
+    request_ids: Iterable[int] = (),
+    car_ids: Iterable[int] = (),
+    user_ids: Iterable[int] = (),
+    deleted_ids: Iterable[int] = (),
+) -> int:
+    conditions = []
+    if request_ids:
+        conditions.append(Request.id.in_(list(request_ids)))
+    if car_ids:
+        conditions.append(Request.car_id.in_(list(car_ids)))
+    if user_ids:
+        conditions.append(Request.user_id.in_(list(user_ids)))
+
+    rows = []
+    if conditions:
+        rows = conn.execute(
+            select(
+                Request.id,
+                Request.service_center_id,
+                Request.created_at,
+                Request.description,
+                User.full_name,
+                User.phone_number,
+                Car.license_plate,
+                Car.vin,
+            )
+            .join(User, Request.user_id == User.id)
+            .outerjoin(Car, Request.car_id == Car.id)
+            .where(or_(*conditions))
+        ).all()
+
+    ids = {row.id for row in rows} | set(deleted_ids)
+    if not ids:
+        return 0
+
+    conn.execute(
+        delete(RequestSearchDocument).where(RequestSearchDocument.request_id.in_(list(ids)))
+    )
+    if _fts:
+        conn.execute(
+            text("DELETE FROM request_search_fts WHERE rowid IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": list(ids)},
+        )
+
+    docs = [_build_document(row) for row in rows]
+    if docs:
+        conn.execute(insert(RequestSearchDocument), docs)
+        if _fts:
+            conn.execute(
+                text("INSERT INTO request_search_fts (rowid, document) VALUES (:rowid, :document)"),
+                [{"rowid": d["request_id"], "document": d["document"]} for d in docs],
+            )
+    return len(docs)
+
+
+# ---------------------------------------------------------------------------
+# Схема и первичное заполнение
+# ---------------------------------------------------------------------------
+
+async def _try_ddl(session: AsyncSession, sql: str) -> bool:
+    """
+    DDL, который может не пройти (нет FTS5 / прав на расширение) — в savepoint,
+    чтобы не ломать остальную транзакцию.
+    """
+    try:
+        async with session.begin_nested():
+            await session.execute(text(sql))
+        return True
+    except Exception as e:
+        logging.warning(f"[search] {sql.split('(')[0].strip()}: {e}")
+        return False
+
+
+async def ensure_search_index() -> None:
+    """
+    Вызывается при старте: создаёт полнотекстовые индексы под диалект
+    (если их ещё нет) и дозаполняет документы для заявок без них.
+    """
+    global _ready, _fts, _pg_fts, _trgm
+
+    async with AsyncSessionLocal() as session:
+        dialect = session.bind.dialect.name
+
+        if dialect == "sqlite":
+            _fts = await _try_ddl(
+                session,
+                "CREATE VIRTUAL TABLE IF NOT EXISTS request_search_fts USING fts5("
+                "document, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+            )
+        elif dialect == "postgresql":
+            _pg_fts = await _try_ddl(
+                session,
+                "CREATE INDEX IF NOT EXISTS ix_request_search_tsv ON request_search "
+                "USING gin (to_tsvector('simple'::regconfig, document))",
+            )
+            if await _try_ddl(session, "CREATE EXTENSION IF NOT EXISTS pg_trgm"):
+                _trgm = await _try_ddl(
+                    session,
+                    "CREATE INDEX IF NOT EXISTS ix_request_search_trgm ON request_search "
+                    "USING gin (document gin_trgm_ops)",
+                )
+        await session.commit()
+
+        # Заявки без документа (база до миграции или запись мимо процесса бота)
+        missing_stmt = select(Request.id).where(
+            ~exists().where(RequestSearchDocument.request_id == Request.id)
+        )
+        missing = (await session.execute(missing_stmt)).scalars().all()
+        for start in range(0, len(missing), _BACKFILL_CHUNK):
+            chunk = missing[start:start + _BACKFILL_CHUNK]
+            await session.run_sync(lambda s: _refresh(s.connection(), request_ids=chunk))
+
+        if _fts:
+            docs_count = (
+                await session.execute(select(func.count()).select_from(RequestSearchDocument))
+            ).scalar()
+            fts_count = (
+                await session.execute(text("SELECT count(*) FROM request_search_fts"))
+            ).scalar()
+            if docs_count != fts_count:
+                await session.execute(text("DELETE FROM request_search_fts"))
+                await session.execute(
+                    text(
+                        "INSERT INTO request_search_fts (rowid, document) "
+                        "SELECT request_id, document FROM request_search"
+                    )
+                )
+
+        await session.commit()
+
+    _ready = True
+    if missing:
+        logging.info(f"[search] Проиндексировано заявок: {len(missing)}")
+    logging.info(
+        f"[search] Поиск заявок: {dialect}, fts5={_fts}, tsvector={_pg_fts}, trgm={_trgm}"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Поиск
+# ---------------------------------------------------------------------------
+
+def _scope(sc_id: Optional[int]):
+    # Менеджер сервиса видит только свои и непривязанные заявки
+    if sc_id is None:
+        return True
+    return or_(
+        RequestSearchDocument.service_center_id == sc_id,
+        RequestSearchDocument.service_center_id.is_(None),
+    )
+
+
+async def _exact_ids(session: AsyncSession, query: str, sc_id: Optional[int], limit: int) -> list[int]:
+    """
+    Быстрые точные пути по индексам: #номер заявки, госномер, VIN, телефон.
+    """
+    conditions = []
+
+    m = re.fullmatch(r"#?\s*(\d{1,9})", query)
+    if m:
+        conditions.append(RequestSearchDocument.request_id == int(m.group(1)))
+
+    plate = normalize_plate(query)
+    if 4 <= len(plate) <= 12 and re.search(r"\d", plate) and re.search(r"[A-Z]", plate):
+        # Госномер целиком или его начало без региона: диапазон по индексу вместо LIKE
+        upper = plate[:-1] + chr(ord(plate[-1]) + 1)
+        conditions.append(
+            and_(RequestSearchDocument.plate_norm >= plate, RequestSearchDocument.plate_norm < upper)
+        )
+    if len(plate) == 17:
+        conditions.append(RequestSearchDocument.vin_norm == plate)
+
+    digits = re.sub(r"\D", "", query)
+    if len(digits) >= 10 and not re.search(r"[^\d\s()+\-]", query):
+        conditions.append(RequestSearchDocument.phone_norm == digits[-10:])
+
+    if not conditions:
+        return []
+
+    result = await session.execute(
+        select(RequestSearchDocument.request_id)
+        .where(or_(*conditions), _scope(sc_id))
+        .order_by(RequestSearchDocument.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def _fulltext_ids(session: AsyncSession, query: str, sc_id: Optional[int], limit: int) -> list[int]:
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    doc = RequestSearchDocument
+
+    if _fts:
+        # Все слова запроса как префиксы, ранжирование — bm25
+        match = " ".join(f'"{t}"*' for t in tokens)
+        stmt = (
+            select(doc.request_id)
+            .join(_fts_table, _fts_table.c.rowid == doc.request_id)
+            .where(_fts_table.c.document.match(match), _scope(sc_id))
+            .order_by(func.bm25(literal_column("request_search_fts")), doc.created_at.desc())
+            .limit(limit)
+        )
+    elif _pg_fts:
+        tsv = func.to_tsvector(literal_column("'simple'::regconfig"), doc.document)
+        tsq = func.to_tsquery(
+            literal_column("'simple'::regconfig"), " & ".join(f"{t}:*" for t in tokens)
+        )
+        condition = tsv.op("@@")(tsq)
+        rank = func.ts_rank_cd(tsv, tsq)
+        if _trgm:
+            # Подстрока в середине слова (часть номера, фамилии) — через триграммы
+            like = "%" + re.sub(r"([%_\\])", r"\\\1", query.lower()) + "%"
+            condition = or_(condition, doc.document.ilike(like))
+            rank = rank + func.similarity(doc.document, query.lower())
+        stmt = (
+            select(doc.request_id)
+            .where(condition, _scope(sc_id))
+            .order_by(rank.desc(), doc.created_at.desc())
+            .limit(limit)
+        )
+    else:
+        # Без полнотекстовых индексов — подстрока по одной узкой таблице документов
+        stmt = (
+            select(doc.request_id)
+            .where(*[doc.document.contains(t, autoescape=True) for t in tokens], _scope(sc_id))
+            .order_by(doc.created_at.desc())
+            .limit(limit)
+        )
+
+    result = await session.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def search_requests(
+    session: AsyncSession,
+    query: str,
+    sc_id: Optional[int],
+    limit: int = SEARCH_LIMIT,
+) -> list[tuple[Request, User, Optional[Car]]]:
+    """
+    Поиск заявок менеджером: сначала точные совпадения (номер заявки, госномер,
+    VIN, телефон), затем полнотекстовые по релевантности.
+    sc_id = None — админ, ищет по всем заявкам.
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    ids = await _exact_ids(session, query, sc_id, limit)
+    if len(ids) < limit:
+        seen = set(ids)
+        for request_id in await _fulltext_ids(session, query, sc_id, limit):
+            if request_id not in seen and len(ids) < limit:
+                ids.append(request_id)
+                seen.add(request_id)
+
+    if not ids:
+        return []
+
+    result = await session.execute(
+        select(Request, User, Car)
+        .join(User, Request.user_id == User.id)
+        .join(Car, Request.car_id == Car.id, isouter=True)
+        .where(Request.id.in_(ids))
+    )
+    by_id = {row[0].id: row for row in result.all()}
+    return [tuple(by_id[i]) for i in ids if i in by_id]
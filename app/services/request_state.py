@@ -0,0 +1,164 @@
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy import case, column, func, literal, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import Request, ServiceCenter
+from app.services import request_counters, request_stats
+
+
+# Машина состояний заявки: целевой статус -> (из каких статусов можно перейти, поле времени).
+# Повторный переход в тот же статус запрещён (кроме повторной отправки условий),
+# поэтому двойное нажатие кнопки просто не находит строку.
+TRANSITIONS: dict[str, tuple[tuple[str, ...], Optional[str]]] = {
+    "offer_sent": (("new", "rejected", "offer_sent"), None),
+    "accepted_by_client": (("offer_sent",), "accepted_at"),
+    "accepted": (("new", "offer_sent", "accepted_by_client"), "accepted_at"),
+    "in_progress": (("accepted_by_client", "accepted"), "in_progress_at"),
+    "completed": (("accepted", "in_progress"), "completed_at"),
+    "rejected": (("new", "offer_sent", "accepted_by_client", "accepted", "in_progress"), "rejected_at"),
+    "cancelled": (("accepted_by_client", "in_progress"), "rejected_at"),
+}
+
+
+def append_note(note: str):
+    """
+    SQL-выражение для manager_comment: пометка дописывается к существующему
+    комментарию через пустую строку (или становится комментарием, если его нет).
+    """
+    comment = Request.__table__.c.manager_comment
+    return case(
+        (or_(comment.is_(None), comment == ""), note),
+        else_=comment + "\n\n" + note,
+    )
+
+
+def owned_by(user_id: Optional[int]):
+    """
+    Условие "заявка принадлежит СТО, которым владеет пользователь" — для where=.
+    """
+    return Request.__table__.c.service_center_id.in_(
+        select(ServiceCenter.id).where(ServiceCenter.owner_user_id == user_id)
+    )
+
+
+def _status_in(status_column, statuses: Iterable[str]):
+    statuses = tuple(statuses)
+    condition = status_column.in_(statuses)
+    # Старые заявки без статуса считаются новыми
+    if "new" in statuses:
+        condition = or_(condition, status_column.is_(None))
+    return condition
+
+
+async def transition(
+    session: AsyncSession,
+    request_id: int,
+    new_status: str,
+    *,
+    allowed: Optional[Iterable[str]] = None,
+    where: Iterable = (),
+    values: Optional[dict] = None,
+    note: Optional[str] = None,
+    keep_timestamp: bool = False,
+) -> Optional[Request]:
+    """
+    Переводит заявку в new_status одним условным UPDATE ... WHERE status IN (...) RETURNING
+    (compare-and-swap без блокировок строки; на Postgres — без предварительного SELECT).
+    Коммит — за вызывающим.
+
+    allowed        — из каких статусов можно перейти (по умолчанию из TRANSITIONS)
+    where          — дополнительные условия (например, owned_by(user_id))
+    values         — дополнительные поля для SET
+    note           — пометка, дописываемая в manager_comment
+    keep_timestamp — не перезаписывать уже заполненное поле времени
+
+    :return: обновлённая заявка (для карточек и уведомлений) или None — заявки нет,
+             она уже не в допустимом статусе (например, повторное нажатие) или не
+             прошла условия where
+    """
+    sources, timestamp_field = TRANSITIONS[new_status]
+    if allowed is not None:
+        sources = tuple(allowed)
+
+    requests = Request.__table__
+    set_values = {"status": new_status}
+    if timestamp_field:
+        timestamp = requests.c[timestamp_field]
+        set_values[timestamp_field] = (
+            func.coalesce(timestamp, func.now()) if keep_timestamp else func.now()
+        )
+    if note:
+        set_values["manager_comment"] = append_note(note)
+    set_values.update(values or {})
+
+    conditions = [requests.c.id == request_id, *where]
+
+    if session.bind.dialect.name == "postgresql":
+        # Self-join на снимок строки до UPDATE: старый статус (для счётчиков)
+        # возвращается тем же запросом. Равенство статусов в WHERE не даст
+        # обновить строку, которую параллельный переход успел изменить.
+        previous = requests.alias("previous")
+        stmt = (
+            update(requests)
+            .where(
+                *conditions,
+                _status_in(requests.c.status, sources),
+                previous.c.id == requests.c.id,
+                requests.c.status.is_not_distinct_from(previous.c.status),
+            )
+            .values(set_values)
+            .returning(*requests.c, previous.c.status.label("previous_status"))
+        )
+    else:
+        # SQLite: RETURNING видит только новую строку, поэтому сначала читаем
+        # статус, а UPDATE делаем по точному совпадению с ним
+        found = (
+            await session.execute(
+                select(requests.c.status).where(
+                    *conditions, _status_in(requests.c.status, sources)
+                )
+            )
+        ).first()
+        if found is None:
+            return None
+        stmt = (
+            update(requests)
+            .where(*conditions, requests.c.status.is_not_distinct_from(found.status))
+            .values(set_values)
+            .returning(*requests.c, literal(found.status).label("previous_status"))
+        )
+
+    # Заявка из RETURNING попадает в identity map (populate_existing — поверх уже
+    # загруженной в этой сессии копии)
+    row = (
+        await session.execute(
+            select(Request, column("previous_status")).from_statement(stmt),
+            execution_options={"populate_existing": True},
+        )
+    ).first()
+    if row is None:
+        return None
+
+    request, old_status = row
+    old_status = old_status or "new"
+    if old_status != new_status:
+        # UPDATE идёт мимо before_flush — счётчики и свёртку обновляем сами
+        await request_counters.apply_deltas(
+            session,
+            {
+                (request.service_center_id, old_status): -1,
+                (request.service_center_id, new_status): 1,
+            },
+        )
+        await request_stats.apply_deltas(
+            session,
+            {
+                (request.service_center_id, request.category_code, old_status): -1,
+                (request.service_center_id, request.category_code, new_status): 1,
+            },
+        )
+
+    logging.info(f"[request-state] Заявка #{request_id}: {old_status} → {new_status}")
+    return request
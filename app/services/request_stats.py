@@ -0,0 +1,298 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import case, delete, event, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import Request, RequestStatsHourly, RequestStatsRollup
+from app.services.request_counters import UNASSIGNED, _history_values, _sc_key
+
+
+# Ключ свёртки для заявок без категории
+NO_CATEGORY = ""
+
+# (СТО или 0, категория или "", статус)
+RollupKey = tuple[int, str, str]
+
+
+def _key(service_center_id: Optional[int], category_code: Optional[str], status: Optional[str]) -> RollupKey:
+    return _sc_key(service_center_id), category_code or NO_CATEGORY, status or "new"
+
+
+def _current_hour() -> datetime:
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+@dataclass
+class RequestStats:
+    """
+    Снимок статистики заявок для админки.
+    delta_24h / delta_7d — изменение количества по статусам (если запрошено).
+    """
+    total: int = 0
+    by_status: dict[str, int] = field(default_factory=dict)
+    by_category: dict[str, int] = field(default_factory=dict)
+    by_service_center: dict[int, int] = field(default_factory=dict)
+    delta_24h: Optional[dict[str, int]] = None
+    delta_7d: Optional[dict[str, int]] = None
+
+
+# ---------------------------------------------------------------------------
+# Инкрементальное обновление: в той же транзакции, что и изменение заявки
+# ---------------------------------------------------------------------------
+
+def _upsert_rollup(dialect_name: str, key: RollupKey, delta: int):
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    sc_key, category, status = key
+    stmt = insert(RequestStatsRollup).values(
+        service_center_id=sc_key,
+        category_code=category,
+        status=status,
+        requests_count=delta,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["service_center_id", "category_code", "status"],
+        set_={"requests_count": RequestStatsRollup.requests_count + delta},
+    )
+
+
+def _upsert_hourly(dialect_name: str, hour: datetime, status: str, delta: int):
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert(RequestStatsHourly).values(hour=hour, status=status, delta=delta)
+    return stmt.on_conflict_do_update(
+        index_elements=["hour", "status"],
+        set_={"delta": RequestStatsHourly.delta + delta},
+    )
+
+
+def _statements(dialect_name: str, deltas: dict[RollupKey, int]) -> list:
+    hour = _current_hour()
+    by_status: dict[str, int] = defaultdict(int)
+    stmts = []
+    for key, delta in deltas.items():
+        stmts.append(_upsert_rollup(dialect_name, key, delta))
+        by_status[key[2]] += delta
+    for status, delta in by_status.items():
+        if delta:
+            stmts.append(_upsert_hourly(dialect_name, hour, status, delta))
+    return stmts
+
+
+@event.listens_for(Session, "before_flush")
+def _track_request_stats(session: Session, flush_context, instances) -> None:
+    """
+    Как и счётчики СТО (request_counters), но с категорией: дельты по
+    (СТО, категория, статус) для новых, удалённых и изменённых заявок.
+    Массовые UPDATE мимо ORM должны вызывать apply_deltas сами.
+    """
+    deltas: dict[RollupKey, int] = defaultdict(int)
+
+    for obj in session.new:
+        if isinstance(obj, Request):
+            deltas[_key(obj.service_center_id, obj.category_code, obj.status)] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Request):
+            state = obj._sa_instance_state
+            old_status, _, _ = _history_values(state, "status")
+            old_sc, _, _ = _history_values(state, "service_center_id")
+            old_cat, _, _ = _history_values(state, "category_code")
+            deltas[_key(old_sc, old_cat, old_status)] -= 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Request) or obj in session.deleted:
+            continue
+
+        state = obj._sa_instance_state
+        old_status, new_status, status_known = _history_values(state, "status")
+        old_sc, new_sc, sc_known = _history_values(state, "service_center_id")
+        old_cat, new_cat, cat_known = _history_values(state, "category_code")
+        old_key = _key(old_sc, old_cat, old_status)
+        new_key = _key(new_sc, new_cat, new_status)
+        if old_key == new_key and status_known and sc_known and cat_known:
+            continue
+
+        if not (status_known and sc_known and cat_known):
+            row = session.connection().execute(
+                select(Request.status, Request.service_center_id, Request.category_code)
+                .where(Request.id == obj.id)
+            ).first()
+            if row is None:
+                continue
+            old_key = _key(
+                old_sc if sc_known else row.service_center_id,
+                old_cat if cat_known else row.category_code,
+                old_status if status_known else row.status,
+            )
+            if old_key == new_key:
+                continue
+
+        deltas[old_key] -= 1
+        deltas[new_key] += 1
+
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        conn = session.connection()
+        for stmt in _statements(conn.dialect.name, deltas):
+            conn.execute(stmt)
+
+
+async def apply_deltas(
+    session: AsyncSession,
+    deltas: dict[tuple[Optional[int], Optional[str], str], int],
+) -> None:
+    """
+    Ручное обновление свёртки — для массовых UPDATE заявок мимо ORM.
+    Ключ — (service_center_id, category_code, статус), значение — изменение количества.
+    """
+    merged: dict[RollupKey, int] = defaultdict(int)
+    for (sc_id, category, status), delta in deltas.items():
+        merged[_key(sc_id, category, status)] += delta
+
+    merged = {key: delta for key, delta in merged.items() if delta}
+    for stmt in _statements(session.bind.dialect.name, merged):
+        await session.execute(stmt)
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+async def get_stats(session: AsyncSession, with_deltas: bool = False) -> RequestStats:
+    """
+    Статистика из свёртки: размер чтения зависит от числа СТО / категорий /
+    статусов, а не от числа заявок.
+    """
+    stats = RequestStats()
+    by_status: dict[str, int] = defaultdict(int)
+    by_category: dict[str, int] = defaultdict(int)
+    by_sc: dict[int, int] = defaultdict(int)
+
+    result = await session.execute(
+        select(
+            RequestStatsRollup.service_center_id,
+            RequestStatsRollup.category_code,
+            RequestStatsRollup.status,
+            RequestStatsRollup.requests_count,
+        ).where(RequestStatsRollup.requests_count != 0)
+    )
+    for sc_key, category, status, count in result.all():
+        stats.total += count
+        by_status[status] += count
+        by_category[category] += count
+        by_sc[sc_key] += count
+
+    stats.by_status = dict(by_status)
+    stats.by_category = dict(by_category)
+    stats.by_service_center = dict(by_sc)
+
+    if with_deltas:
+        hour = _current_hour()
+        since_24h = hour - timedelta(hours=23)
+        since_7d = hour - timedelta(days=7) + timedelta(hours=1)
+        result = await session.execute(
+            select(
+                RequestStatsHourly.status,
+                func.sum(
+                    case((RequestStatsHourly.hour >= since_24h, RequestStatsHourly.delta), else_=0)
+                ),
+                func.sum(RequestStatsHourly.delta),
+            )
+            .where(RequestStatsHourly.hour >= since_7d)
+            .group_by(RequestStatsHourly.status)
+        )
+        stats.delta_24h = {}
+        stats.delta_7d = {}
+        for status, delta_24h, delta_7d in result.all():
+            stats.delta_24h[status] = int(delta_24h or 0)
+            stats.delta_7d[status] = int(delta_7d or 0)
+
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Сверка: один проход GROUP BY по requests
+# ---------------------------------------------------------------------------
+
+async def reconcile() -> int:
+    """
+    Пересчитывает свёртку одним GROUP BY по requests, исправляет расхождения
+    и удаляет устаревшие почасовые изменения. Возвращает число исправленных ключей.
+    """
+    async with AsyncSessionLocal() as session:
+        dialect_name = session.bind.dialect.name
+        if dialect_name == "postgresql":
+            # Изменения заявок подождут сверку — их дельты лягут поверх свежих значений
+            await session.execute(text("LOCK TABLE request_stats_rollup IN EXCLUSIVE MODE"))
+
+        sc_key = func.coalesce(Request.service_center_id, UNASSIGNED)
+        category = func.coalesce(Request.category_code, NO_CATEGORY)
+        status = func.coalesce(Request.status, "new")
+        result = await session.execute(
+            select(sc_key, category, status, func.count(Request.id))
+            .group_by(sc_key, category, status)
+        )
+        actual = {(sc, cat, st): cnt for sc, cat, st, cnt in result.all()}
+
+        result = await session.execute(
+            select(
+                RequestStatsRollup.service_center_id,
+                RequestStatsRollup.category_code,
+                RequestStatsRollup.status,
+                RequestStatsRollup.requests_count,
+            )
+        )
+        stored = {(sc, cat, st): cnt for sc, cat, st, cnt in result.all()}
+
+        fixed = 0
+        for key in set(actual) | set(stored):
+            expected = actual.get(key, 0)
+            if stored.get(key) == expected:
+                continue
+            fixed += 1
+
+            sc, cat, st = key
+            if expected == 0:
+                await session.execute(
+                    delete(RequestStatsRollup).where(
+                        RequestStatsRollup.service_center_id == sc,
+                        RequestStatsRollup.category_code == cat,
+                        RequestStatsRollup.status == st,
+                    )
+                )
+            else:
+                await session.execute(
+                    _upsert_rollup(dialect_name, key, expected - stored.get(key, 0))
+                )
+
+        keep_from = _current_hour() - timedelta(days=config.REQUEST_STATS_HOURLY_KEEP_DAYS)
+        await session.execute(delete(RequestStatsHourly).where(RequestStatsHourly.hour < keep_from))
+
+        await session.commit()
+
+    if fixed:
+        logging.warning(f"[stats] Сверка исправила {fixed} строк свёртки заявок")
+    return fixed
+
+
+async def run_reconciliation_loop() -> None:
+    """
+    Фоновая задача: сверка при старте и затем раз в REQUEST_COUNTERS_RECONCILE_SECONDS.
+    """
+    while True:
+        try:
+            await reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[stats] Ошибка сверки статистики заявок: {e}")
+
+        await asyncio.sleep(config.REQUEST_COUNTERS_RECONCILE_SECONDS)
@@ -0,0 +1,260 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.config import config
+
+
+# Полосы приоритета (меньше — раньше): карточки и клавиатуры в чатах сервисов
+# идут впереди информационных сообщений клиентам
+PRIORITY_SERVICE = 0
+PRIORITY_CLIENT = 1
+
+# Сколько запросов подряд можно отправить в один чат, прежде чем включится лимит
+CHAT_BURST = 3
+GROUP_BURST = 5
+
+# Сколько ведёр чатов держать, прежде чем выбросить простаивающие
+_MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity подряд.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """
+        Через сколько секунд появится токен (0 — уже есть).
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        """
+        Ничего не выдавать ближайшие seconds секунд (ответ TelegramRetryAfter).
+        """
+        self._refill(now)
+        self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    chat_id: Optional[int] = field(compare=False)
+    call: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    retries: int = field(default=0, compare=False)
+
+
+_queue: Optional[asyncio.PriorityQueue] = None
+_workers: list[asyncio.Task] = []
+_seq = itertools.count()
+
+_global_bucket = TokenBucket(config.SEND_GLOBAL_PER_SECOND, config.SEND_GLOBAL_PER_SECOND)
+_chat_buckets: dict[int, TokenBucket] = {}
+
+
+def _chat_bucket(chat_id: int, now: float) -> TokenBucket:
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        if len(_chat_buckets) >= _MAX_CHAT_BUCKETS:
+            for idle_id in [cid for cid, b in _chat_buckets.items() if b.is_idle(now)]:
+                del _chat_buckets[idle_id]
+        # Отрицательный chat_id — группа / канал
+        if chat_id < 0:
+            bucket = TokenBucket(config.SEND_GROUP_PER_MINUTE / 60, GROUP_BURST)
+        else:
+            bucket = TokenBucket(config.SEND_CHAT_PER_SECOND, CHAT_BURST)
+        _chat_buckets[chat_id] = bucket
+    return bucket
+
+
+def _requeue_later(job: _Job, delay: float) -> None:
+    # Задание возвращается в очередь со своим приоритетом и номером —
+    # впереди более поздних; воркер тем временем обслуживает другие чаты
+    asyncio.get_running_loop().call_later(delay, _queue.put_nowait, job)
+
+
+async def _run(job: _Job) -> None:
+    if job.future.done():
+        return
+
+    while True:
+        now = time.monotonic()
+        chat_bucket = _chat_bucket(job.chat_id, now) if job.chat_id is not None else None
+        chat_wait = chat_bucket.wait_time(now) if chat_bucket else 0.0
+        if chat_wait > 0:
+            _requeue_later(job, chat_wait)
+            return
+        global_wait = _global_bucket.wait_time(now)
+        if global_wait > 0:
+            await asyncio.sleep(global_wait)
+            continue
+        _global_bucket.take()
+        if chat_bucket:
+            chat_bucket.take()
+        break
+
+    try:
+        result = await job.call()
+    except TelegramRetryAfter as e:
+        now = time.monotonic()
+        (chat_bucket or _global_bucket).pause(now, e.retry_after)
+        if job.retries < config.SEND_MAX_RETRIES:
+            job.retries += 1
+            logging.warning(
+                f"[send-queue] Flood control в чате {job.chat_id}: повтор через {e.retry_after} с"
+            )
+            _requeue_later(job, e.retry_after)
+        elif not job.future.done():
+            job.future.set_exception(e)
+    except Exception as e:
+        if not job.future.done():
+            job.future.set_exception(e)
+    else:
+        if not job.future.done():
+            job.future.set_result(result)
+
+
+async def _worker() -> None:
+    while True:
+        job = await _queue.get()
+        try:
+            await _run(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"[send-queue] Ошибка воркера: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            _queue.task_done()
+
+
+def start() -> None:
+    """
+    Запускает пул воркеров (SEND_QUEUE_WORKERS) в текущем event loop.
+    Вызывается при старте бота; call() тоже запустит его при первом запросе.
+    """
+    global _queue
+    if _workers:
+        return
+    _queue = asyncio.PriorityQueue()
+    for _ in range(config.SEND_QUEUE_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop() -> None:
+    """
+    Останавливает воркеров; неотправленные запросы завершаются CancelledError.
+    """
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if _queue is not None:
+        while not _queue.empty():
+            job = _queue.get_nowait()
+            job.future.cancel()
+
+
+async def call(
+    chat_id: Optional[int],
+    method: Callable[[], Awaitable[Any]],
+    priority: int = PRIORITY_CLIENT,
+) -> Any:
+    """
+    Выполняет запрос к Bot API через очередь: с учётом глобального лимита и
+    лимита чата chat_id, в порядке приоритета. TelegramRetryAfter повторяется
+    автоматически (до SEND_MAX_RETRIES раз), остальные ошибки пробрасываются.
+    """
+    start()
+    future = asyncio.get_running_loop().create_future()
+    _queue.put_nowait(_Job(priority, next(_seq), chat_id, method, future))
+    return await future
+
+
+# ---------------------------------------------------------------------------
+# Обёртки над методами Bot
+# ---------------------------------------------------------------------------
+
+async def send_message(bot: Bot, chat_id: int, text: str, priority: int = PRIORITY_CLIENT, **kwargs):
+    return await call(
+        chat_id,
+        lambda: bot.send_message(chat_id=chat_id, text=text, **kwargs),
+        priority,
+    )
+
+
+async def send_photo(bot: Bot, chat_id: int, photo: str, priority: int = PRIORITY_SERVICE, **kwargs):
+    return await call(
+        chat_id,
+        lambda: bot.send_photo(chat_id=chat_id, photo=photo, **kwargs),
+        priority,
+    )
+
+
+async def edit_message_reply_markup(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    reply_markup=None,
+    priority: int = PRIORITY_SERVICE,
+):
+    return await call(
+        chat_id,
+        lambda: bot.edit_message_reply_markup(
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=reply_markup,
+        ),
+        priority,
+    )
+
+
+async def edit_message_text(
+    bot: Bot,
+    chat_id: int,
+    message_id: int,
+    text: str,
+    priority: int = PRIORITY_SERVICE,
+    **kwargs,
+):
+    return await call(
+        chat_id,
+        lambda: bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=message_id,
+            text=text,
+            **kwargs,
+        ),
+        priority,
+    )
@@ -0,0 +1,111 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import config
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter, User
+from app.services.geo_cache import LRUCache
+
+
+@dataclass(frozen=True)
+class ServiceRoute:
+    """
+    Куда доставлять уведомления по заявкам СТО.
+
+    primary_chat_id — основной чат: группа (send_to_group + manager_chat_id),
+                      иначе ЛС владельца (send_to_owner); None — не определён
+    extra_chat_ids  — дополнительные чаты (ЛС владельца, если основной — группа)
+    """
+    service_center_id: int
+    owner_telegram_id: Optional[int] = None
+    primary_chat_id: Optional[int] = None
+    extra_chat_ids: tuple[int, ...] = ()
+
+    @property
+    def chat_ids(self) -> list[int]:
+        return [self.primary_chat_id, *self.extra_chat_ids] if self.primary_chat_id else []
+
+
+_routes = LRUCache(config.SERVICE_ROUTING_CACHE_SIZE, config.SERVICE_ROUTING_CACHE_TTL_SECONDS)
+
+
+async def _load(session: AsyncSession, service_center_id: int) -> Optional[ServiceRoute]:
+    # Один запрос: настройки доставки СТО + telegram_id владельца
+    result = await session.execute(
+        select(
+            ServiceCenter.send_to_group,
+            ServiceCenter.manager_chat_id,
+            ServiceCenter.send_to_owner,
+            User.telegram_id,
+        )
+        .outerjoin(User, User.id == ServiceCenter.owner_user_id)
+        .where(ServiceCenter.id == service_center_id)
+    )
+    row = result.first()
+    if row is None:
+        return None
+
+    send_to_group, manager_chat_id, send_to_owner, owner_telegram_id = row
+
+    primary_chat_id: Optional[int] = None
+    extra_chat_ids: list[int] = []
+
+    # приоритет: группа → ЛС владельца
+    if send_to_group and manager_chat_id:
+        primary_chat_id = manager_chat_id
+
+    if send_to_owner and owner_telegram_id:
+        if primary_chat_id is None:
+            primary_chat_id = owner_telegram_id
+        elif owner_telegram_id != primary_chat_id:
+            extra_chat_ids.append(owner_telegram_id)
+
+    return ServiceRoute(
+        service_center_id=service_center_id,
+        owner_telegram_id=owner_telegram_id,
+        primary_chat_id=primary_chat_id,
+        extra_chat_ids=tuple(extra_chat_ids),
+    )
+
+
+async def resolve(
+    service_center_id: Optional[int],
+    session: Optional[AsyncSession] = None,
+) -> Optional[ServiceRoute]:
+    """
+    Маршрут доставки для СТО: из кэша или одним запросом к БД.
+    None — СТО не указан или не найден.
+    """
+    if service_center_id is None:
+        return None
+
+    key = str(service_center_id)
+    cached = _routes.get(key)
+    if cached is not None:
+        return cached
+
+    if session is not None:
+        route = await _load(session, service_center_id)
+    else:
+        async with AsyncSessionLocal() as session:
+            route = await _load(session, service_center_id)
+
+    if route is not None:
+        _routes.set(key, route)
+    return route
+
+
+def invalidate(service_center_id: Optional[int]) -> None:
+    """
+    Настройки доставки СТО изменились (/bind_group, выбор куда слать заявки).
+    Вызывать после коммита. Кэши других экземпляров бота доживут свой
+    SERVICE_ROUTING_CACHE_TTL_SECONDS.
+    """
+    if service_center_id is None:
+        return
+    _routes.pop(str(service_center_id))
+    logging.info(f"[service-routing] Маршрут СТО #{service_center_id} сброшен")
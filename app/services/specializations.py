@@ -0,0 +1,129 @@
+import logging
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import delete, exists, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.db import AsyncSessionLocal
+from app.database.models import ServiceCenter, ServiceCenterSpecialization
+
+
+# Битовые маски специализаций СТО.
+# Позиции битов фиксированы — не меняйте порядок, новые коды добавляйте в конец.
+SPECIALIZATION_BITS: dict[str, int] = {
+    "wash": 1 << 0,
+    "tire": 1 << 1,
+    "electric": 1 << 2,
+    "mechanic": 1 << 3,
+    "paint": 1 << 4,
+    "maint": 1 << 5,
+    "agg_turbo": 1 << 6,
+    "agg_starter": 1 << 7,
+    "agg_generator": 1 << 8,
+    "agg_steering": 1 << 9,
+}
+
+
+def parse_specializations(raw: Optional[str]) -> set[str]:
+    """
+    'wash,tire' -> {'wash', 'tire'}. Пустая строка / None -> пустое множество.
+    """
+    if not raw:
+        return set()
+    return {code.strip() for code in raw.split(",") if code.strip()}
+
+
+def specialization_mask(specs: Union[str, Iterable[str], None]) -> int:
+    """
+    Битовая маска по строке через запятую или набору кодов.
+    0 — специализаций нет (универсальный сервис). Неизвестные коды игнорируются.
+    """
+    if specs is None or isinstance(specs, str):
+        specs = parse_specializations(specs)
+
+    mask = 0
+    for code in specs:
+        mask |= SPECIALIZATION_BITS.get(code, 0)
+    return mask
+
+
+def category_bit(category_code: Optional[str]) -> int:
+    """
+    Бит категории работ (category_code из заявки). 0 — категория неизвестна.
+    """
+    if not category_code:
+        return 0
+    return SPECIALIZATION_BITS.get(category_code, 0)
+
+
+def specialization_filter(category_code: str):
+    """
+    WHERE-условие "СТО подходит под категорию работ": в её специализациях
+    есть этот код (поиск по индексу service_center_specializations.code)
+    или специализаций нет вовсе (универсальный сервис).
+    """
+    return or_(
+        ServiceCenter.specializations.is_(None),
+        ServiceCenter.id.in_(
+            select(ServiceCenterSpecialization.service_center_id).where(
+                ServiceCenterSpecialization.code == category_code
+            )
+        ),
+    )
+
+
+async def set_service_specializations(
+    session: AsyncSession,
+    sc: ServiceCenter,
+    codes: Optional[Iterable[str]],
+) -> None:
+    """
+    Сохраняет специализации СТО и в текстовое поле, и в таблицу
+    service_center_specializations. Пустой список / None — универсальный сервис.
+    commit делает вызывающий код.
+    """
+    codes = sorted({code.strip() for code in (codes or ()) if code and code.strip()})
+    sc.specializations = ",".join(codes) if codes else None
+
+    if sc.id is None:
+        await session.flush()
+
+    await session.execute(
+        delete(ServiceCenterSpecialization).where(
+            ServiceCenterSpecialization.service_center_id == sc.id
+        )
+    )
+    session.add_all(
+        [ServiceCenterSpecialization(service_center_id=sc.id, code=code) for code in codes]
+    )
+
+
+async def backfill_service_specializations() -> None:
+    """
+    Заполняет service_center_specializations для СТО, у которых специализации
+    есть только в текстовом поле (база создана через create_all без миграции).
+    Повторный запуск ничего не меняет.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ServiceCenter.id, ServiceCenter.specializations).where(
+                ServiceCenter.specializations.is_not(None),
+                ~exists().where(
+                    ServiceCenterSpecialization.service_center_id == ServiceCenter.id
+                ),
+            )
+        )
+        rows = result.all()
+        if not rows:
+            return
+
+        session.add_all(
+            [
+                ServiceCenterSpecialization(service_center_id=sc_id, code=code)
+                for sc_id, raw in rows
+                for code in parse_specializations(raw)
+            ]
+        )
+        await session.commit()
+
+    logging.info(f"[specs] Заполнены специализации для {len(rows)} СТО")
@@ -10,6 +10,9 @@ from app.database.base import Base
 from app.database import models  # noqa: F401
 from app.database import bonus_models  # noqa: F401
 from app.database import comment_models  # noqa: F401
+from app.database import rating_models  # noqa: F401
+from app.database import outbox_models  # noqa: F401
+from app.database import chat_message_models  # noqa: F401
 
 
 # Это стандартный alembic Config (НЕ путать с app.config)
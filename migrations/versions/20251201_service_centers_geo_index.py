@@ -0,0 +1,62 @@
+"""composite geo index for service centers (+ optional earthdistance / PostGIS)
+
+Revision ID: 20251201_sc_geo_index
+Revises: 03a9e3c61add
+Create Date: 2025-12-01
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+from app.config import config as app_config
+
+
+# Идентификаторы миграции
+revision = "20251201_sc_geo_index"
+down_revision = "03a9e3c61add"
+branch_labels = None
+depends_on = None
+
+
+def _index_exists(table_name: str, index_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return any(ix["name"] == index_name for ix in inspector.get_indexes(table_name))
+
+
+def upgrade() -> None:
+    # Обычный композитный индекс — для SQL-префильтра по bounding box (любая БД)
+    if not _index_exists("service_centers", "ix_service_centers_location"):
+        op.create_index(
+            "ix_service_centers_location",
+            "service_centers",
+            ["location_lat", "location_lon"],
+        )
+
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    # Postgres: GiST-индексы только для выбранного режима гео-поиска,
+    # чтобы не требовать расширения, которые не используются.
+    if app_config.GEO_SEARCH_MODE == "earthdistance":
+        op.execute("CREATE EXTENSION IF NOT EXISTS cube")
+        op.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_service_centers_earth "
+            "ON service_centers USING gist (ll_to_earth(location_lat, location_lon))"
+        )
+    elif app_config.GEO_SEARCH_MODE == "postgis":
+        op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_service_centers_geog "
+            "ON service_centers USING gist "
+            "(geography(ST_SetSRID(ST_MakePoint(location_lon, location_lat), 4326)))"
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_service_centers_earth")
+        op.execute("DROP INDEX IF EXISTS ix_service_centers_geog")
+
+    op.drop_index("ix_service_centers_location", table_name="service_centers")
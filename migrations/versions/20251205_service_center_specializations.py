@@ -0,0 +1,80 @@
+"""normalized service center specializations (+ backfill from comma-separated text)
+
+Revision ID: 20251205_sc_specializations
+Revises: 20251201_sc_geo_index
+Create Date: 2025-12-05
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251205_sc_specializations"
+down_revision = "20251201_sc_geo_index"
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists("service_center_specializations"):
+        op.create_table(
+            "service_center_specializations",
+            sa.Column(
+                "service_center_id",
+                sa.Integer(),
+                sa.ForeignKey("service_centers.id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("code", sa.String(length=50), primary_key=True),
+        )
+        op.create_index(
+            "ix_service_center_specializations_code",
+            "service_center_specializations",
+            ["code", "service_center_id"],
+        )
+
+    # ---- Backfill из service_centers.specializations ('wash,tire,...') ----
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.text(
+            "SELECT id, specializations FROM service_centers "
+            "WHERE specializations IS NOT NULL"
+        )
+    ).fetchall()
+
+    existing = {
+        (sc_id, code)
+        for sc_id, code in bind.execute(
+            sa.text("SELECT service_center_id, code FROM service_center_specializations")
+        ).fetchall()
+    }
+
+    to_insert = []
+    for sc_id, raw in rows:
+        for code in {c.strip() for c in raw.split(",") if c.strip()}:
+            if (sc_id, code) not in existing:
+                to_insert.append({"service_center_id": sc_id, "code": code})
+
+    if to_insert:
+        table = sa.table(
+            "service_center_specializations",
+            sa.column("service_center_id", sa.Integer()),
+            sa.column("code", sa.String()),
+        )
+        op.bulk_insert(table, to_insert)
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_service_center_specializations_code",
+        table_name="service_center_specializations",
+    )
+    op.drop_table("service_center_specializations")
@@ -0,0 +1,49 @@
+"""per-service-center request counters by status (+ backfill from requests)
+
+Revision ID: 20251208_sc_request_counts
+Revises: 20251205_sc_specializations
+Create Date: 2025-12-08
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251208_sc_request_counts"
+down_revision = "20251205_sc_specializations"
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    if _table_exists("service_center_request_counts"):
+        return
+
+    op.create_table(
+        "service_center_request_counts",
+        # 0 — заявки без привязки к СТО, поэтому без внешнего ключа
+        sa.Column("service_center_id", sa.Integer(), primary_key=True),
+        sa.Column("status", sa.String(length=50), primary_key=True),
+        sa.Column("requests_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+    # ---- Backfill: текущие количества заявок ----
+    op.execute(
+        "INSERT INTO service_center_request_counts "
+        "(service_center_id, status, requests_count) "
+        "SELECT COALESCE(service_center_id, 0), COALESCE(status, 'new'), COUNT(*) "
+        "FROM requests "
+        "GROUP BY COALESCE(service_center_id, 0), COALESCE(status, 'new')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("service_center_request_counts")
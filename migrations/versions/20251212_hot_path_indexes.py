@@ -0,0 +1,66 @@
+"""hot-path indexes for requests, comments, bonus ledger, cars and service center owners
+
+Revision ID: 20251212_hot_path_indexes
+Revises: 20251208_sc_request_counts
+Create Date: 2025-12-12
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251212_hot_path_indexes"
+down_revision = "20251208_sc_request_counts"
+branch_labels = None
+depends_on = None
+
+
+# (таблица, имя индекса, колонки)
+INDEXES = [
+    ("requests", "ix_requests_user_created", ["user_id", "created_at", "id"]),
+    (
+        "requests",
+        "ix_requests_sc_status_created",
+        ["service_center_id", "status", "created_at", "id"],
+    ),
+    ("requests", "ix_requests_status_created", ["status", "created_at", "id"]),
+    ("requests", "ix_requests_created", ["created_at", "id"]),
+    ("comments", "ix_comments_request_created", ["request_id", "created_at"]),
+    (
+        "bonus_transactions",
+        "ix_bonus_transactions_user_created",
+        ["user_id", "created_at"],
+    ),
+    ("cars", "ix_cars_user_id", ["user_id"]),
+    ("service_centers", "ix_service_centers_owner", ["owner_user_id"]),
+]
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def _index_exists(table_name: str, index_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return any(ix["name"] == index_name for ix in inspector.get_indexes(table_name))
+
+
+def upgrade() -> None:
+    for table_name, index_name, columns in INDEXES:
+        if not _table_exists(table_name) or _index_exists(table_name, index_name):
+            continue
+        op.create_index(index_name, table_name, columns)
+
+    # Свежая статистика, чтобы планировщик сразу начал пользоваться индексами
+    if op.get_bind().dialect.name in ("postgresql", "sqlite"):
+        op.execute("ANALYZE")
+
+
+def downgrade() -> None:
+    for table_name, index_name, _ in reversed(INDEXES):
+        if _table_exists(table_name) and _index_exists(table_name, index_name):
+            op.drop_index(index_name, table_name=table_name)
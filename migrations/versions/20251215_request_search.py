@@ -0,0 +1,76 @@
+"""request search documents + full-text indexes (FTS5 on SQLite, tsvector/pg_trgm on Postgres)
+
+Revision ID: 20251215_request_search
+Revises: 20251212_hot_path_indexes
+Create Date: 2025-12-15
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251215_request_search"
+down_revision = "20251212_hot_path_indexes"
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists("request_search"):
+        op.create_table(
+            "request_search",
+            sa.Column(
+                "request_id",
+                sa.Integer(),
+                sa.ForeignKey("requests.id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            sa.Column("service_center_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("plate_norm", sa.String(length=20), nullable=True),
+            sa.Column("vin_norm", sa.String(length=50), nullable=True),
+            sa.Column("phone_norm", sa.String(length=20), nullable=True),
+            sa.Column("document", sa.Text(), nullable=False, server_default=""),
+        )
+        op.create_index("ix_request_search_plate", "request_search", ["plate_norm"])
+        op.create_index("ix_request_search_vin", "request_search", ["vin_norm"])
+        op.create_index("ix_request_search_phone", "request_search", ["phone_norm"])
+        op.create_index(
+            "ix_request_search_sc_created",
+            "request_search",
+            ["service_center_id", "created_at"],
+        )
+
+    # Полнотекстовые индексы. Документы заполняет бот при старте
+    # (request_search.ensure_search_index), он же создаст индексы, если здесь не вышло.
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS request_search_fts USING fts5("
+            "document, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    elif dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_request_search_tsv ON request_search "
+            "USING gin (to_tsvector('simple'::regconfig, document))"
+        )
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_request_search_trgm ON request_search "
+            "USING gin (document gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TABLE IF EXISTS request_search_fts")
+    op.drop_table("request_search")
@@ -0,0 +1,59 @@
+"""admin statistics rollup by service center / category / status + hourly deltas
+
+Revision ID: 20251216_request_stats_rollup
+Revises: 20251215_request_search
+Create Date: 2025-12-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251216_request_stats_rollup"
+down_revision = "20251215_request_search"
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists("request_stats_rollup"):
+        op.create_table(
+            "request_stats_rollup",
+            # 0 — заявки без СТО, "" — без категории
+            sa.Column("service_center_id", sa.Integer(), primary_key=True),
+            sa.Column("category_code", sa.String(length=50), primary_key=True),
+            sa.Column("status", sa.String(length=50), primary_key=True),
+            sa.Column("requests_count", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+        # ---- Backfill: один проход GROUP BY по заявкам ----
+        op.execute(
+            "INSERT INTO request_stats_rollup "
+            "(service_center_id, category_code, status, requests_count) "
+            "SELECT COALESCE(service_center_id, 0), COALESCE(category_code, ''), "
+            "COALESCE(status, 'new'), COUNT(*) "
+            "FROM requests "
+            "GROUP BY COALESCE(service_center_id, 0), COALESCE(category_code, ''), "
+            "COALESCE(status, 'new')"
+        )
+
+    if not _table_exists("request_stats_hourly"):
+        op.create_table(
+            "request_stats_hourly",
+            sa.Column("hour", sa.DateTime(timezone=True), primary_key=True),
+            sa.Column("status", sa.String(length=50), primary_key=True),
+            sa.Column("delta", sa.Integer(), nullable=False, server_default="0"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("request_stats_hourly")
+    op.drop_table("request_stats_rollup")
@@ -0,0 +1,123 @@
+"""ratings table (moved from RATING: comments) + bayesian rating sort key on service centers
+
+Revision ID: 20251218_ratings
+Revises: 20251216_request_stats_rollup
+Create Date: 2025-12-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251218_ratings"
+down_revision = "20251216_request_stats_rollup"
+branch_labels = None
+depends_on = None
+
+
+# Те же значения, что matching.RATING_PRIOR_MEAN / RATING_PRIOR_WEIGHT
+# (миграция не импортирует код приложения)
+PRIOR_MEAN = 4.0
+PRIOR_WEIGHT = 5
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def _column_exists(table_name: str, column_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return column_name in [c["name"] for c in inspector.get_columns(table_name)]
+
+
+def upgrade() -> None:
+    if not _table_exists("ratings"):
+        op.create_table(
+            "ratings",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "request_id",
+                sa.Integer(),
+                sa.ForeignKey("requests.id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column(
+                "user_id",
+                sa.Integer(),
+                sa.ForeignKey("users.id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column("service_center_id", sa.Integer(), nullable=True),
+            sa.Column("score", sa.Integer(), nullable=False),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+            sa.UniqueConstraint("request_id", "user_id", name="uq_ratings_request_user"),
+        )
+        op.create_index(
+            "ix_ratings_service_center",
+            "ratings",
+            ["service_center_id", "created_at"],
+        )
+
+    # ---- Backfill: оценки из комментариев "RATING:<n>" (первая на заявку и пользователя) ----
+    # Вне проверки выше: таблицу мог уже создать create_all при старте бота —
+    # тогда она пустая, а оценки всё ещё лежат в комментариях.
+    op.execute(
+        "INSERT INTO ratings (request_id, user_id, service_center_id, score, created_at) "
+        "SELECT c.request_id, c.user_id, r.service_center_id, "
+        "CAST(SUBSTR(c.message, 8) AS INTEGER), COALESCE(c.created_at, CURRENT_TIMESTAMP) "
+        "FROM comments c "
+        "JOIN requests r ON r.id = c.request_id "
+        "WHERE c.message LIKE 'RATING:%' "
+        "AND c.id = ("
+        "  SELECT MIN(c2.id) FROM comments c2 "
+        "  WHERE c2.request_id = c.request_id AND c2.user_id = c.user_id "
+        "  AND c2.message LIKE 'RATING:%'"
+        ") "
+        "AND NOT EXISTS ("
+        "  SELECT 1 FROM ratings rt "
+        "  WHERE rt.request_id = c.request_id AND rt.user_id = c.user_id"
+        ")"
+    )
+    op.execute("DELETE FROM comments WHERE message LIKE 'RATING:%'")
+
+    if not _column_exists("service_centers", "rating_sort"):
+        op.add_column(
+            "service_centers",
+            sa.Column("rating_sort", sa.Float(), nullable=False, server_default="4.0"),
+        )
+        op.create_index(
+            "ix_service_centers_rating_sort",
+            "service_centers",
+            ["rating_sort", "id"],
+        )
+
+    # Ключ сортировки пересчитываем всегда (колонку тоже мог создать create_all)
+    op.execute(
+        "UPDATE service_centers SET rating_sort = "
+        f"({PRIOR_MEAN} * {PRIOR_WEIGHT} + COALESCE(rating, 0) * COALESCE(ratings_count, 0)) "
+        f"/ ({PRIOR_WEIGHT} + COALESCE(ratings_count, 0))"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_service_centers_rating_sort", table_name="service_centers")
+    with op.batch_alter_table("service_centers") as batch_op:
+        batch_op.drop_column("rating_sort")
+
+    # Возвращаем оценки в комментарии
+    op.execute(
+        "INSERT INTO comments (request_id, user_id, message, is_manager, created_at) "
+        "SELECT request_id, user_id, 'RATING:' || CAST(score AS VARCHAR(10)), false, created_at "
+        "FROM ratings"
+    )
+    op.drop_table("ratings")
@@ -0,0 +1,53 @@
+"""transactional outbox for request notifications
+
+Revision ID: 20251220_outbox
+Revises: 20251218_ratings
+Create Date: 2025-12-20
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251220_outbox"
+down_revision = "20251218_ratings"
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists("outbox"):
+        op.create_table(
+            "outbox",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("kind", sa.String(length=50), nullable=False),
+            sa.Column("payload", sa.Text(), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column(
+                "available_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+            sa.Column("last_error", sa.Text(), nullable=True),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+        )
+        op.create_index("ix_outbox_available", "outbox", ["available_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_outbox_available", table_name="outbox")
+    op.drop_table("outbox")
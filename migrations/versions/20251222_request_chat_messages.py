@@ -0,0 +1,73 @@
+"""request_chat_messages: every copy of a request card in service chats
+
+Revision ID: 20251222_request_chat_messages
+Revises: 20251220_outbox
+Create Date: 2025-12-22
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251222_request_chat_messages"
+down_revision = "20251220_outbox"
+branch_labels = None
+depends_on = None
+
+
+def _table_exists(table_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists("request_chat_messages"):
+        op.create_table(
+            "request_chat_messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "request_id",
+                sa.Integer(),
+                sa.ForeignKey("requests.id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column("chat_id", sa.BigInteger(), nullable=False),
+            sa.Column("message_id", sa.BigInteger(), nullable=False),
+            sa.Column("is_primary", sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=False,
+            ),
+            sa.UniqueConstraint(
+                "request_id",
+                "chat_id",
+                name="uq_request_chat_messages_request_chat",
+            ),
+        )
+
+        # ---- Backfill: основная карточка из requests.chat_message_id ----
+        # (чат — по тем же правилам, что в chat_service: группа → ЛС владельца;
+        # копии в дополнительных чатах раньше не запоминались)
+        op.execute(
+            "INSERT INTO request_chat_messages (request_id, chat_id, message_id, is_primary) "
+            "SELECT r.id, "
+            "CASE WHEN sc.send_to_group AND sc.manager_chat_id IS NOT NULL "
+            "THEN sc.manager_chat_id ELSE u.telegram_id END, "
+            "r.chat_message_id, "
+            "TRUE "
+            "FROM requests r "
+            "JOIN service_centers sc ON sc.id = r.service_center_id "
+            "LEFT JOIN users u ON u.id = sc.owner_user_id "
+            "WHERE r.chat_message_id IS NOT NULL "
+            "AND ((sc.send_to_group AND sc.manager_chat_id IS NOT NULL) "
+            "OR (sc.send_to_owner AND u.telegram_id IS NOT NULL))"
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("request_chat_messages")
@@ -0,0 +1,35 @@
+"""requests.version for the render cache
+
+Revision ID: 20251224_request_version
+Revises: 20251222_request_chat_messages
+Create Date: 2025-12-24
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# Идентификаторы миграции
+revision = "20251224_request_version"
+down_revision = "20251222_request_chat_messages"
+branch_labels = None
+depends_on = None
+
+
+def _column_exists(table_name: str, column_name: str) -> bool:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+    return column_name in [c["name"] for c in inspector.get_columns(table_name)]
+
+
+def upgrade() -> None:
+    if not _column_exists("requests", "version"):
+        op.add_column(
+            "requests",
+            sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("requests", "version")